@@ -11,9 +11,12 @@ from kivymd.app import MDApp
 from kivymd.uix.button import MDRaisedButton
 from kivymd.uix.dialog import MDDialog
 
+from PIL import Image
+
 from widgets.Hotkeys import Hotkeys
 from widgets.CollectionPanel import CollectionPanel
 from widgets.CollectionToolbar import CollectionToolbar
+from widgets.ConfirmationSnackbar import ConfirmationSnackbar
 
 from screens.StartScreen import StartScreen
 from screens.CollectionScreen import CollectionScreen
@@ -21,6 +24,9 @@ from screens.ComparisonScreen import ComparisonScreen
 from screens.AboutScreen import AboutScreen
 
 from api.CollectionManager import CollectionManager
+from api.ColorPalette import ColorPalette
+from api.DuplicateIndex import DuplicateIndex
+from api.PerceptualHash import PerceptualHash
 
 
 class ArtyApp(MDApp):
@@ -54,6 +60,10 @@ class ArtyApp(MDApp):
 
         self.icon = "resources/icon.png"
 
+        # scans of artworks are much larger than what Pillow considers a
+        # decompression bomb by default (89 megapixels)
+        Image.MAX_IMAGE_PIXELS = 1024 ** 3
+
         # set KivyMD color palettes
         self.theme_cls.primary_palette = "Pink"
         self.theme_cls.accent_palette = "Red"
@@ -138,15 +148,26 @@ class ArtyApp(MDApp):
         # give the collection to the CollectionGrid, which will in turn
         # display the images on the screen
         self.GRID.set_collection(self.CURRENT_COLLECTION)
-        self.TOOLBAR.displayed_images = self.CURRENT_COLLECTION.get_collection()
+        self.TOOLBAR.initialize(self.CURRENT_COLLECTION)
 
         # initialize CollectionPanel
         self.PANEL.initialize(self.PROJECT_DIRECTORY)
-        self.PANEL.set_image(self.CURRENT_COLLECTION.get_collection()[0])
+        # a directory without images can be opened, to drop some in it
+        if self.CURRENT_COLLECTION.get_collection():
+            self.PANEL.set_image(self.CURRENT_COLLECTION.get_collection()[0])
 
         # initialize ComparisonScreen
         self.SCREENS['COMPARE'].initialize(self.PROJECT_DIRECTORY)
 
+        # compute the missing palettes and hashes in the background, so
+        # they are ready when the user clicks on the images or drops
+        # new ones
+        filenames = [
+            i.filename for i in self.CURRENT_COLLECTION.get_collection()
+        ]
+        ColorPalette.precompute(self.PROJECT_DIRECTORY, filenames)
+        PerceptualHash.precompute(self.PROJECT_DIRECTORY, filenames)
+
         # switch to the collection screen
         self.SCREEN_MANAGER.switch_to(
             self.SCREENS["COLLECTION"], 
@@ -191,14 +212,62 @@ class ArtyApp(MDApp):
 
         try:
             # add image to the collection
-            self.CURRENT_COLLECTION.add_image(file_path)
+            new_image = self.CURRENT_COLLECTION.add_image(file_path)
+            CollectionManager.schedule_save(self.CURRENT_COLLECTION)
             # refresh the CollectionGrid
             self.GRID.set_collection(self.CURRENT_COLLECTION)
+            self.TOOLBAR.initialize(self.CURRENT_COLLECTION)
 
         except ValueError as err:
             err_msg = "The file %s couldn't be added to the collection." % file_path
             self.show_error(err_msg)
             Logger.exception(err)
+            return
+
+        self._warn_duplicates(new_image)
+
+
+    def _warn_duplicates(self, collection_image):
+        """ Summary
+            -------
+            Warns the user when an image added to the collection has
+            near duplicates in it. The image is hashed in the
+            background, the others' hashes are cached.
+
+            Arguments
+            ---------
+            collection_image : CollectionImage
+                The added image
+        """
+        collection = self.CURRENT_COLLECTION
+
+        PerceptualHash.load(
+            collection.get_absolute_path(collection_image),
+            lambda hashes: self._on_hashed(
+                collection, collection_image, hashes
+            )
+        )
+
+
+    def _on_hashed(self, collection, collection_image, hashes):
+        """ Summary
+            -------
+            Shows the near duplicates of an added image once it is
+            hashed, unless another collection was opened meanwhile.
+        """
+        if hashes is None or collection is not self.CURRENT_COLLECTION:
+            return
+
+        duplicates = DuplicateIndex.get_index(collection).query(
+            hashes, exclude=collection_image.filename
+        )
+
+        if duplicates:
+            ConfirmationSnackbar(
+                text="%s looks like %s, already in the collection" % (
+                    collection_image.filename, duplicates[0][0]
+                )
+            ).open()
 
 
     def _on_request_close(self, *_args):
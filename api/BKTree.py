@@ -0,0 +1,116 @@
+"""
+    Burkhard-Keller tree, to find the keys close to a key
+"""
+
+
+class BKTree():
+    """ Summary
+        -------
+        Burkhard-Keller tree: indexes keys in a metric space, e.g.
+        integer hashes with the Hamming distance, so that the keys
+        within a distance of a key are found without comparing it with
+        all of them.
+
+        Each child of a node is stored under its distance to the node.
+        By the triangle inequality, a search within max_distance of a
+        key only visits the children whose distance to the node is
+        within max_distance of the distance between the node and the
+        key.
+
+        Methods
+        -------
+        add(key, value)
+            Adds a value under a key
+        search(key, max_distance)
+            Finds the values whose keys are within a distance of a key
+    """
+
+    def __init__(self, distance=None):
+        """ Summary
+            -------
+            Creates an empty tree
+
+            Arguments
+            ---------
+            distance : callable, optional
+                distance(key_a, key_b) -> int, a metric. The Hamming
+                distance between integers by default.
+        """
+        self._distance = distance or self.hamming_distance
+        # node: [key, list of values, {distance: child node}]
+        self._root = None
+        self._size = 0
+
+
+    def __len__(self):
+        return self._size
+
+
+    @staticmethod
+    def hamming_distance(key_a, key_b):
+        """ Number of bits which differ between two integers """
+        return bin(key_a ^ key_b).count("1")
+
+
+    def add(self, key, value):
+        """ Summary
+            -------
+            Adds a value under a key. Values with equal keys share the
+            same node.
+        """
+        self._size += 1
+
+        if self._root is None:
+            self._root = [key, [value], dict()]
+            return
+
+        node = self._root
+        while True:
+            distance = self._distance(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], dict()]
+                return
+            node = child
+
+
+    def search(self, key, max_distance):
+        """ Summary
+            -------
+            Finds the values whose keys are within a distance of a key
+
+            Arguments
+            ---------
+            key
+                The key to search around
+            max_distance : int
+                Maximum distance, included
+
+            Returns
+            -------
+            list(tuple)
+                (distance, value), closest first
+        """
+        results = list()
+        if self._root is None:
+            return results
+
+        # iterative, deep trees don't hit the recursion limit
+        nodes = [self._root]
+        while nodes:
+            node_key, values, children = nodes.pop()
+            distance = self._distance(key, node_key)
+
+            if distance <= max_distance:
+                results += [(distance, value) for value in values]
+
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    nodes.append(child)
+
+        results.sort(key=lambda result: result[0])
+        return results
@@ -10,6 +10,8 @@ import shutil
 from dataclasses import dataclass, field
 from dataclasses_json import dataclass_json
 
+from api.SearchIndex import SearchIndex
+
 
 @dataclass_json
 @dataclass
@@ -28,6 +30,9 @@ class Collection():
             path to this collection's directory
         collection : list(CollectionImage), optional
             list of the images in the collection
+        file_records : dict, optional
+            filename -> {"size": int, "mtime": int} of the image files,
+            as they were when the collection was last checked
 
         Methods
         -------
@@ -35,11 +40,32 @@ class Collection():
             getter for the collection attribute
         set_collection(coll_list)
             setter for the collection attribute
+        get_image(filename)
+            get an image of the collection from its filename
         add_image(filename)
             add an image to the collection from source
+        append_image(collection_image)
+            add a CollectionImage to the collection
+        remove_image(collection_image)
+            remove an image from the collection
         update_image(collection_image)
             update an image in the collection, if the image doesn't
             exist, throw an exception.
+        get_search_index()
+            get the SearchIndex of the collection
+        pop_changes()
+            get and forget the images changed since the last call
+        mark_changed(changed, removed)
+            mark images as changed, e.g. when saving them failed
+
+        Notes
+        -----
+        The collection list is indexed by filename, so that looking up,
+        adding and updating an image don't need to scan the list. To
+        keep the index (and the SearchIndex) in sync, always modify the
+        collection through the methods above rather than by modifying
+        the list or the images directly. The same goes for saving only
+        the changed images (see CollectionManager.save()).
     """
     # the whole field(metadata=config(field_name=...)) shenanigans are
     # there to create aliases for the attribute's name in order for the
@@ -48,6 +74,20 @@ class Collection():
     work_directory :    str
     version :           str
     collection:         list = field(default_factory=list)
+    file_records :      dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        # filename -> position of the image in the collection list
+        # (not a field, so it isn't serialized)
+        self._index = dict()
+        self._build_index()
+        # built on demand by get_search_index()
+        self._search_index = None
+        # filenames of the images added or updated, and removed, since
+        # the last pop_changes()
+        self._changed = set()
+        self._removed = set()
+
 
     def get_collection(self):
         """getter for the collection list"""
@@ -56,13 +96,44 @@ class Collection():
 
     def set_collection(self, coll_list):
         """setter for the collection list"""
+        self._removed.update(
+            image.filename for image in self.collection
+        )
         self.collection = coll_list
+        self._build_index()
+        self._search_index = None
+
+        self._changed = set(self._index)
+        self._removed.difference_update(self._changed)
+
+
+    def get_image(self, filename):
+        """ Summary
+            -------
+            Gets an image of the collection from its filename
+
+            Arguments
+            ---------
+            filename : str
+                filename of the image
+
+            Returns
+            -------
+            CollectionImage or None
+                The image with this filename, None if there is no such
+                image in the collection
+        """
+        try:
+            return self.collection[self._index[filename]]
+        except KeyError:
+            return None
 
 
     def add_image(self, source):
         """ Summary
             -------
-            Function to add an image to the collection
+            Function to add an image to the collection. The file is
+            copied to the work directory and gets a file record.
 
             Returns
             -------
@@ -98,15 +169,87 @@ class Collection():
 
         new_image = CollectionImage(file_name)
 
-        if new_image in self.collection:
+        self.append_image(new_image)
+
+        # the properties, palette and hashes of the image are saved in
+        # its record once they are computed
+        stat = os.stat(os.path.join(self.work_directory, file_name))
+        self.file_records[file_name] = {
+            "size": stat.st_size, "mtime": stat.st_mtime_ns
+        }
+
+        return new_image
+
+
+    def append_image(self, collection_image):
+        """ Summary
+            -------
+            Adds a CollectionImage at the end of the collection
+
+            Arguments
+            ---------
+            collection_image: CollectionImage
+                the image to add
+
+            Raises
+            ------
+            ValueError
+                If an image with the same filename is already in the
+                collection
+        """
+        if collection_image.filename in self._index:
             raise ValueError(
                 "This image already exists in the collection %s" %
-                file_name
+                collection_image.filename
             )
 
-        self.collection.append(new_image)
+        self._index[collection_image.filename] = len(self.collection)
+        self.collection.append(collection_image)
+        self._changed.add(collection_image.filename)
+        self._removed.discard(collection_image.filename)
 
-        return new_image
+        if self._search_index is not None:
+            self._search_index.add(collection_image)
+
+
+    def remove_image(self, collection_image):
+        """ Summary
+            -------
+            Removes an image from the collection
+
+            Arguments
+            ---------
+            collection_image: CollectionImage
+                the image to remove
+
+            Raises
+            ------
+            ValueError
+                If the image doesn't exist in the collection
+
+            Notes
+            -----
+            Unlike the other operations, removing an image shifts the
+            images after it in the list, and their position in the
+            index.
+        """
+        try:
+            idx = self._index.pop(collection_image.filename)
+        except KeyError as err:
+            raise ValueError(
+                "Cannot remove an image that doesn't exist in the collection."
+            ) from err
+
+        del self.collection[idx]
+
+        for image in self.collection[idx:]:
+            self._index[image.filename] -= 1
+
+        self._changed.discard(collection_image.filename)
+        self._removed.add(collection_image.filename)
+
+        if self._search_index is not None:
+            self._search_index.remove(collection_image)
 
 
     def update_image(self, collection_image):
@@ -125,14 +268,78 @@ class Collection():
             Exception
                 If the image to update doesn't exist in the collectin
         """
-        if collection_image not in self.collection:
+        try:
+            idx = self._index[collection_image.filename]
+        except KeyError as err:
             raise ValueError(
                 "Cannot update an image that doesn't exist in the collection."
-            )
+            ) from err
 
-        for idx, image in enumerate(self.collection):
-            if collection_image == image:
-                self.collection[idx] = collection_image
+        self.collection[idx] = collection_image
+        self._changed.add(collection_image.filename)
+
+        if self._search_index is not None:
+            self._search_index.update(collection_image)
+
+
+    def get_search_index(self):
+        """ Summary
+            -------
+            Gets the SearchIndex of the collection, to be given to
+            CollectionUtils.filter(). It is built on the first call,
+            and then kept up to date by the methods of the collection.
+
+            Returns
+            -------
+            SearchIndex
+                The index of the images of the collection
+        """
+        if self._search_index is None:
+            self._search_index = SearchIndex(self.collection)
+
+        return self._search_index
+
+
+    def pop_changes(self):
+        """ Summary
+            -------
+            Gets the images added, updated or removed since the last
+            call, and forgets them.
+
+            Returns
+            -------
+            changed : set(str)
+                filenames of the images added or updated
+            removed : set(str)
+                filenames of the images removed
+        """
+        changed, removed = self._changed, self._removed
+        self._changed, self._removed = set(), set()
+
+        return changed, removed
+
+
+    def mark_changed(self, changed=(), removed=()):
+        """ Summary
+            -------
+            Marks images as changed again, e.g. when saving the changes
+            returned by pop_changes() failed. Images changed since then
+            are left as they are.
+
+            Arguments
+            ---------
+            changed : iterable(str)
+                filenames of images added or updated
+            removed : iterable(str)
+                filenames of images removed
+        """
+        for filename in changed:
+            if filename in self._index:
+                self._changed.add(filename)
+
+        for filename in removed:
+            if filename not in self._index:
+                self._removed.add(filename)
 
 
     def get_absolute_path(self, collection_image):
@@ -157,3 +364,13 @@ class Collection():
             )
 
         return os.path.join(self.work_directory, collection_image.filename)
+
+
+    def _build_index(self):
+        """ Summary
+            -------
+            Rebuilds the filename index from the collection list.
+        """
+        self._index = {
+            image.filename: idx for idx, image in enumerate(self.collection)
+        }
@@ -42,6 +42,8 @@ class CollectionImage():
         -------
         to_legend()
             generates a reference string (legend)
+        get_numeric_datation()
+            estimated numeric value of the datation
 
         Notes
         -----
@@ -119,8 +121,45 @@ class CollectionImage():
         return legend
 
 
+    def get_numeric_datation(self):
+        """ Summary
+            -------
+            Estimated year of the datation of the image (see
+            CollectionUtils._datation_to_numeric()). The value is
+            computed once and cached until the datation changes.
+
+            Returns
+            -------
+            int
+                The estimated year, 0 if nothing could be found
+        """
+        from api.CollectionUtils import CollectionUtils
+
+        # the cache is a plain attribute rather than a field, so that it
+        # isn't serialized
+        cache = getattr(self, "_numeric_datation", None)
+
+        if cache is None or cache[0] != self.datation:
+            cache = (
+                self.datation,
+                CollectionUtils._datation_to_numeric(self.datation)
+            )
+            self._numeric_datation = cache
+
+        return cache[1]
+
+
     def __eq__(self, other):
         """ overloads the == operator so that two CollectionImages with
             the same filename are considered the same image.
         """
+        if not isinstance(other, CollectionImage):
+            return NotImplemented
         return self.filename == other.filename
+
+
+    def __hash__(self):
+        """ CollectionImages are hashed by filename, consistently with
+            __eq__, so they can be used in sets and as dict keys.
+        """
+        return hash(self.filename)
@@ -1,11 +1,24 @@
 import json
 import os
-
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import fields
+from functools import partial
+
+from kivy.clock import Clock
 from kivy.logger import Logger
 
 from api.Collection import Collection
 from api.CollectionImage import CollectionImage
+from api.ColorPalette import ColorPalette
 from api.CollectionUtils import CollectionUtils
+from api.ImageInfo import ImageInfo
+from api.PerceptualHash import PerceptualHash
+from api.SQLiteStore import SQLiteStore
+from api.ThumbnailCache import ThumbnailCache
+from api.TilePyramid import TilePyramid
 
 
 class CollectionManager():
@@ -19,12 +32,47 @@ class CollectionManager():
             loads a collection from a path.
         save(collection: Collection):
             saves a collection
+        save_async(collection, callback):
+            saves a collection in the background
+        schedule_save(collection):
+            saves a collection in the background, a bit later
+        wait():
+            finishes the saves in progress
+        export_json(collection, file_path):
+            writes a collection to a JSON meta file
+
+        Attributes
+        ----------
+        STORE : str
+            Where the collections are saved, one of STORES:
+                json
+                    in the JSON meta file of the work directory, written
+                    in full at every save
+                sqlite
+                    in an SQLite database next to the meta file (see
+                    SQLiteStore), where only the images which changed
+                    since the last save are written. The meta file is
+                    only read when it is more recent than the database,
+                    e.g. after an export_json(), or when it was replaced
+                    by another one.
+        SAVE_DELAY : float
+            Seconds schedule_save() waits for other changes before
+            saving
+
+        Notes
+        -----
+        The saves only take into account the changes made through the
+        methods of Collection (see Collection.pop_changes()). They are
+        written by a single worker thread, in the order they were
+        requested. The JSON meta file is written to a temporary file
+        first, and then renamed, so that a crash while saving doesn't
+        leave a truncated meta file.
 
         TODO
         ----
         - Make loading times faster
-        - JSON format optimisation by minifying and aliasing the property
-          names to take less space on disk.
+        - JSON format optimisation by aliasing the property names to
+          take less space on disk.
         - Proof the loading so:
             1. we can have the absolute path to an image in a
                CollectionImage
@@ -36,14 +84,30 @@ class CollectionManager():
 
     META_EXTENSION = ".arty"
 
+    STORES = ("json", "sqlite")
+    STORE = "json"
+
+    SAVE_DELAY = 2
+
+    # writes the saves in the background, one at a time
+    _save_executor = None
+    _save_futures = list()
+    # collection waiting for schedule_save()'s delay
+    _scheduled = None
+    _save_trigger = None
+
     ### IMPORTANT
     # When doing changes to the .arty file :
     # Change the version number
-    VERSION = "Alpha-1.1"
+    VERSION = "Alpha-1.2"
     # By the way, I don't think using app-wide versioning nomenclature
     # in here is the best idea. We should go back to something separate
     # from app versioning.
 
+    # work directory -> name of its meta file, so we don't have to list
+    # the directory each time we save
+    _meta_filenames = dict()
+
     @classmethod
     def load(cls, path):
         """ Summary
@@ -68,27 +132,47 @@ class CollectionManager():
                 if the collection's work directory is not found
 
         """
-        # check if the path given is valid
-        if not os.listdir(path):
-            raise FileNotFoundError
+        # the collection could be in the middle of a save
+        cls.wait()
 
-        # check if there is already a project file in this directory
-        meta_filename = cls._get_meta_filename(path)
+        # list the directory once: it gives us both the meta file and
+        # the images
+        meta_filename, image_entries = cls._scan_directory(path)
 
+        # check if the path given is valid: only an empty directory is
+        # refused, a directory without images is an empty collection
+        if not meta_filename and not image_entries:
+            with os.scandir(path) as entries:
+                if next(entries, None) is None:
+                    raise FileNotFoundError
+
+        # check if there is already a project file in this directory
         if meta_filename:
             # if it's the case, load it.
-            collection = cls.__load_meta(path)
+            collection = cls.__load_store(path, meta_filename)
         else:
             # if it's not the case, create a new one and start with a
             # default collection
             cls.__create_meta(path)
             # create a default collection
-            collection = Collection(path, "Untitled Collection", list())
+            collection = Collection(path, cls.VERSION, list())
 
         # check the images in the directory and update the collection
         # and meta
-        collection = cls.__check_files(collection)
+        collection = cls.__check_files(collection, image_entries)
+        # the properties, palettes and hashes of the images computed in
+        # the previous sessions
+        ImageInfo.restore(path, collection.file_records)
+        ColorPalette.restore(path, collection.file_records)
+        PerceptualHash.restore(path, collection.file_records)
         cls.__write_meta(collection)
+        # everything was just written
+        collection.pop_changes()
+
+        # remove the thumbnails and tiles of images that were modified
+        # or deleted since the last session
+        ThumbnailCache.prune(path, collection.file_records)
+        TilePyramid.prune(path, collection.file_records)
         Logger.info("Collection: Collection loaded")
 
         return collection
@@ -97,17 +181,130 @@ class CollectionManager():
     def save(cls, collection):
         """ Summary
             -------
-            This method saves a collection to disk.
+            This method saves a collection to disk, and returns once it
+            is written, after the saves in progress. A save of the
+            collection waiting for schedule_save()'s delay is done by
+            this one.
 
             Parameters
             ----------
             collection: Collection
                 the Collection object to save
         """
-        cls.__write_meta(collection)
+        if cls._scheduled is collection:
+            cls._scheduled = None
+            cls._save_trigger.cancel()
+
+        write, changes = cls.__prepare_save(collection)
+
+        # the saves in progress are older, they are written first
+        cls.__wait_saves()
+
+        try:
+            write()
+        except Exception:
+            collection.mark_changed(*changes)
+            raise
+
         Logger.info("Collection: Collection saved")
 
 
+    @classmethod
+    def save_async(cls, collection, callback=None):
+        """ Summary
+            -------
+            Saves a collection in a worker thread. The data to save is
+            read right away, the collection can then be modified.
+
+            Parameters
+            ----------
+            collection: Collection
+                the Collection object to save
+            callback: callable, optional
+                called on the main thread with callback(saved) once the
+                save is finished, saved is False if it failed.
+        """
+        write, changes = cls.__prepare_save(collection)
+
+        if cls._save_executor is None:
+            cls._save_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="CollectionManager"
+            )
+
+        future = cls._save_executor.submit(write)
+        cls._save_futures.append(future)
+        future.add_done_callback(
+            lambda f: Clock.schedule_once(
+                lambda _dt: cls.__on_saved(collection, changes, f, callback)
+            )
+        )
+
+
+    @classmethod
+    def schedule_save(cls, collection):
+        """ Summary
+            -------
+            Saves a collection in the background (see save_async()),
+            once it hasn't been modified for SAVE_DELAY seconds, so that
+            a series of changes is saved only once.
+
+            Parameters
+            ----------
+            collection: Collection
+                the Collection object to save
+        """
+        if cls._save_trigger is None:
+            cls._save_trigger = Clock.create_trigger(
+                cls._save_scheduled, cls.SAVE_DELAY
+            )
+
+        if cls._scheduled is not None and cls._scheduled is not collection:
+            cls._save_scheduled()
+
+        cls._scheduled = collection
+        # restart the delay
+        cls._save_trigger.cancel()
+        cls._save_trigger()
+
+
+    @classmethod
+    def wait(cls):
+        """ Summary
+            -------
+            Saves the collection waiting for schedule_save()'s delay
+            now, and returns once all the saves are written.
+        """
+        if cls._scheduled is not None:
+            cls.save(cls._scheduled)
+
+        cls.__wait_saves()
+
+
+    @classmethod
+    def export_json(cls, collection, file_path=None):
+        """ Summary
+            -------
+            Writes a collection to a JSON meta file, whatever the STORE.
+
+            Parameters
+            ----------
+            collection: Collection
+                the collection to export
+            file_path: str, optional
+                path to the JSON file, the meta file of the work
+                directory if None
+        """
+        if file_path is None:
+            file_path = os.path.join(
+                collection.work_directory,
+                cls.__get_meta_filename(collection)
+            )
+
+        # the records are still to be saved in the STORE
+        collection.mark_changed(cls.__store_records(collection))
+        cls._write_json(cls._to_dict(collection), file_path)
+
+
     @classmethod
     def fix_version_conflict(cls, json_string):
         """ Summary
@@ -162,9 +359,17 @@ class CollectionManager():
             coll_dict["collection"] = updated_coll
 
 
-        if version == "Alpha-1.0.1":
+        # new collections used to be saved with "Untitled Collection" as
+        # their version, they are Alpha-1.1 files
+        if version in (
+            "Alpha-1.0", "Alpha-1.0.1", "Alpha-1.1", "Untitled Collection"
+        ):
             # upgrade the save file to the next version
-            pass
+            # Alpha-1.2 remembers the size and modification time of the
+            # files, to detect changes in the work directory. Leaving
+            # them empty forces a full check on the next load.
+            coll_dict["version"] = "Alpha-1.2"
+            coll_dict["file_records"] = dict()
 
 
         # turn the dictionary back to a JSON string
@@ -174,15 +379,50 @@ class CollectionManager():
 
 
     @classmethod
-    def __load_meta(cls, path):
+    def __load_store(cls, path, meta_filename):
+        """ Summary
+            -------
+            Loads the collection from the STORE. The meta file is
+            imported when the database is missing, out of date, or
+            can't be read (e.g. written with another schema). The
+            collection is rebuilt from the images of the directory if
+            the meta file is empty too.
+        """
+        if cls.STORE not in cls.STORES:
+            raise ValueError("Unknown collection store %s" % cls.STORE)
+
+        if cls.STORE == "sqlite":
+            meta_path = os.path.join(path, meta_filename)
+            db_path = SQLiteStore.get_path(meta_path)
+
+            if SQLiteStore.is_current(db_path, meta_path):
+                try:
+                    return SQLiteStore.load(db_path, path)
+                except (ValueError, sqlite3.DatabaseError):
+                    Logger.exception(
+                        "Collection: Couldn't read %s, it is rebuilt"
+                        % db_path
+                    )
+                    # written again once the collection is loaded
+                    os.remove(db_path)
+
+            Logger.info("Collection: Importing %s" % meta_filename)
+
+            # the meta file isn't written while the database is used
+            if os.path.getsize(meta_path) == 0:
+                return Collection(path, cls.VERSION, list())
+
+        return cls.__load_meta(path, meta_filename)
+
+
+    @classmethod
+    def __load_meta(cls, path, meta_filename):
         """ Summary
             -------
             Deserializes the data from the meta file and updates the
             collection.
         """
         # read the existing meta file
-        meta_filename = cls._get_meta_filename(path)
-
         with open(os.path.join(path, meta_filename), "r") as meta:
             coll_json = meta.read()
             coll_dict = json.loads(coll_json)
@@ -208,23 +448,49 @@ class CollectionManager():
         version = coll_dict["version"]
 
         # retrieve the collection list
+        # cast each object in the JSON list to a CollectionImage. The
+        # constructor is much faster than the from_dict() of
+        # dataclasses_json. Unknown keys are ignored, like from_dict().
+        image_fields = [f.name for f in fields(CollectionImage)]
         collection = [
-            # cast each object in the JSON list to a CollectionImage
-            # pylint: disable=no-member
-            CollectionImage.from_dict(item) for item in coll_dict["collection"]
+            CollectionImage(**{
+                name: item[name] for name in image_fields if name in item
+            })
+            for item in coll_dict["collection"]
         ]
 
-        return Collection(path, version, collection)
+        return Collection(
+            path,
+            version,
+            collection,
+            coll_dict.get("file_records", dict())
+        )
 
 
     @classmethod
-    def __check_files(cls, collection):
+    def __check_files(cls, collection, image_entries):
         """ Summary
             -------
             Runs through the files in the work directory and adds any
             image that is not yet in our collection. Removes any image
             whose file no longer exists -> data loss on renaming a file
 
+            The size and modification time of each file are kept in the
+            collection's file records, with the properties, palette and
+            hashes of the image (see ImageInfo, ColorPalette and
+            PerceptualHash). The record of a file is reset when its size
+            or modification time changed. Every file is checked, as
+            modifying a file in place doesn't modify the directory; the
+            stat of each entry is all it costs.
+
+            Arguments
+            ---------
+            collection : Collection
+                the collection to check
+            image_entries : dict(str, os.DirEntry)
+                the image files of the work directory, as returned by
+                _scan_directory()
+
             Returns
             -------
             checked_collection : Collection
@@ -238,31 +504,78 @@ class CollectionManager():
                 % type(collection)
             )
 
-        dir_contents = os.listdir(collection.work_directory)
-
         # filter the collection list to remove from the collection
         # references to files that no longer exist
-        collection.collection = [i for i in collection.collection if i.filename in dir_contents]
-
-        for filename in dir_contents:
-            # reject all files with the wrong extension (case
-            # insensitive)
-            if filename.lower().endswith(CollectionUtils.AUTHORIZED_IMAGE_FORMATS):
-                new_image = CollectionImage(filename)
-
-                # this works since we overloaded the equal operator in
-                # CollectionImage !
-                if new_image not in collection.collection:
-                    # add the new image
-                    collection.collection.append(new_image)
+        collection.set_collection([
+            i for i in collection.get_collection()
+            if i.filename in image_entries
+        ])
+
+        for filename in image_entries:
+            if collection.get_image(filename) is None:
+                # add the new image
+                collection.append_image(CollectionImage(filename))
+
+        # refresh the file records. Editing a file in place doesn't
+        # change the directory, each file is checked.
+        records = dict()
+        for filename, entry in image_entries.items():
+            record = collection.file_records.get(filename)
+            stat = entry.stat()
+
+            # the properties, palette and hash stored in the record are
+            # kept as long as the file is the same
+            if record is None or (record.get("size"), record.get("mtime")) != (
+                stat.st_size, stat.st_mtime_ns
+            ):
+                record = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+            records[filename] = record
+
+        collection.file_records = records
 
         return collection
 
 
     @classmethod
     def __write_meta(cls, collection):
-        """ Serializes this collection and saves it in the project meta
-            file in the work directory
+        """ Serializes the whole collection and saves it in the STORE """
+        # type safety check
+        if not isinstance(collection, Collection):
+            raise TypeError(
+                "collection must be of type Collection, not %s"
+                % type(collection)
+            )
+
+        cls.__store_records(collection)
+
+        if cls.STORE == "sqlite":
+            SQLiteStore.save(collection, cls.__get_db_path(collection))
+        else:
+            cls._write_json(
+                cls._to_dict(collection),
+                os.path.join(
+                    collection.work_directory,
+                    cls.__get_meta_filename(collection)
+                )
+            )
+
+
+    @classmethod
+    def __prepare_save(cls, collection):
+        """ Summary
+            -------
+            Reads the data to save from the collection, on the main
+            thread.
+
+            Returns
+            -------
+            write : callable
+                writes the data, can be called from any thread
+            changes : tuple(set, set)
+                the (changed, removed) images (see
+                Collection.mark_changed()), to save again if the write
+                fails
         """
         # type safety check
         if not isinstance(collection, Collection):
@@ -271,32 +584,185 @@ class CollectionManager():
                 % type(collection)
             )
 
-        meta_file_path = os.path.join(
-            collection.work_directory,
-            cls._get_meta_filename(collection.work_directory)
+        if cls._scheduled is collection:
+            cls._save_trigger.cancel()
+            cls._scheduled = None
+
+        changed, removed = collection.pop_changes()
+        changed_records = cls.__store_records(collection)
+
+        if cls.STORE == "sqlite":
+            write = partial(
+                SQLiteStore.write_changes,
+                cls.__get_db_path(collection),
+                SQLiteStore.get_changes(
+                    collection,
+                    [collection.get_image(filename) for filename in changed],
+                    removed,
+                    changed | changed_records
+                )
+            )
+        else:
+            # the JSON file is written in full anyway
+            write = partial(
+                cls._write_json,
+                cls._to_dict(collection),
+                os.path.join(
+                    collection.work_directory,
+                    cls.__get_meta_filename(collection)
+                )
+            )
+
+        return write, (changed | changed_records, removed)
+
+
+    @classmethod
+    def _save_scheduled(cls, *_args):
+        # not name mangled: the Clock looks the callback up by its name
+        collection, cls._scheduled = cls._scheduled, None
+        cls.save_async(collection)
+
+
+    @classmethod
+    def __on_saved(cls, collection, changes, future, callback):
+        """ Summary
+            -------
+            Runs on the main thread when a save_async() is finished.
+            The changes are saved again at the next save if it failed.
+        """
+        cls._save_futures.remove(future)
+
+        try:
+            future.result()
+        except Exception:
+            Logger.exception("Collection: Collection couldn't be saved")
+            collection.mark_changed(*changes)
+            saved = False
+        else:
+            Logger.info("Collection: Collection saved")
+            saved = True
+
+        if callback is not None:
+            callback(saved)
+
+
+    @classmethod
+    def __wait_saves(cls):
+        wait(cls._save_futures)
+
+
+    @classmethod
+    def __store_records(cls, collection):
+        """ Saves in the file records the properties, palettes and hashes
+            of the images computed since the last save, and returns the
+            filenames of the records which changed
+        """
+        work_dir = collection.work_directory
+        records = collection.file_records
+
+        return (
+            ImageInfo.store(work_dir, records)
+            | ColorPalette.store(work_dir, records)
+            | PerceptualHash.store(work_dir, records)
+        )
+
+
+    @classmethod
+    def __get_meta_filename(cls, collection):
+        meta_filename = cls._get_meta_filename(collection.work_directory)
+
+        # prevent creating a file named "False"
+        if not meta_filename:
+            raise FileNotFoundError(
+                "No meta file found in %s" % collection.work_directory
+            )
+
+        return meta_filename
+
+
+    @classmethod
+    def __get_db_path(cls, collection):
+        return SQLiteStore.get_path(os.path.join(
+            collection.work_directory, cls.__get_meta_filename(collection)
+        ))
+
+
+    @classmethod
+    def _to_dict(cls, collection):
+        """ Summary
+            -------
+            The data of the JSON meta file of a collection.
+
+            The dictionary is built by hand: it is much faster than the
+            to_json() of dataclasses_json. The file records are copied,
+            so the collection can be modified while the dictionary is
+            written in another thread.
+        """
+        image_fields = [f.name for f in fields(CollectionImage)]
+
+        return {
+            "work_directory": collection.work_directory,
+            "version": collection.version,
+            "collection": [
+                {name: getattr(image, name) for name in image_fields}
+                for image in collection.get_collection()
+            ],
+            "file_records": {
+                filename: dict(record)
+                for filename, record in collection.file_records.items()
+            },
+        }
+
+
+    @classmethod
+    def _write_json(cls, data, file_path):
+        """ Summary
+            -------
+            Writes the data of a meta file (see _to_dict()) to a JSON
+            file.
+
+            The JSON is minified: json only uses its C encoder without
+            indentation. It is encoded in one call rather than streamed
+            to the file, for the same reason.
+
+            The file is replaced atomically: the JSON is written to a
+            temporary file in the same directory, which is then renamed.
+        """
+        formatted_json = json.dumps(data, separators=(",", ":"))
+
+        directory, filename = os.path.split(file_path)
+        # the temporary file doesn't end with META_EXTENSION, it can't be
+        # mistaken for a meta file
+        handle, temp_path = tempfile.mkstemp(
+            prefix="." + filename, suffix=".tmp", dir=directory or None
         )
 
-        # create metadata file in the project directory
-        with open(meta_file_path, "w") as meta_file:
-            # convert the collection to JSON
-            json_data = json.loads(collection.to_json())
-            # convert to string and minify JSON file
-            #formatted_json = json.dumps(json_data, separators=(',', ':'))
-            #prettified
-            formatted_json = json.dumps(json_data, indent=4)
+        try:
+            with os.fdopen(handle, "w") as meta_file:
+                meta_file.write(formatted_json)
+                meta_file.flush()
+                os.fsync(meta_file.fileno())
+
+            # keep the permissions of the previous meta file
+            if os.path.exists(file_path):
+                shutil.copymode(file_path, temp_path)
 
-            if not formatted_json.strip():
-                # prevent data from being erased
-                raise RuntimeError("Tried to write an empty Collection")
+            os.replace(temp_path, file_path)
 
-            meta_file.write(formatted_json)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
 
 
     @classmethod
     def __create_meta(cls, path):
         # default filename is collection.arty
-        path = os.path.join(path, "collection" + cls.META_EXTENSION)
-        open(path, "a").close()
+        meta_filename = "collection" + cls.META_EXTENSION
+        open(os.path.join(path, meta_filename), "a").close()
+        cls._meta_filenames[path] = meta_filename
 
 
     @classmethod
@@ -305,8 +771,55 @@ class CollectionManager():
             Gets the first file with the correct extension. If none are
             found, returns False
         """
-        for fname in os.listdir(path):
-            if fname.endswith(cls.META_EXTENSION):
-                return fname
-        # if no collection meta file is found
-        return False
+        # we already know the meta file of this directory
+        meta_filename = cls._meta_filenames.get(path)
+        if meta_filename and os.path.isfile(os.path.join(path, meta_filename)):
+            return meta_filename
+
+        return cls._scan_directory(path)[0]
+
+
+    @classmethod
+    def _scan_directory(cls, path):
+        """ Summary
+            -------
+            Lists the work directory in a single pass.
+
+            Arguments
+            ---------
+            path : str
+                path to the collection directory
+
+            Returns
+            -------
+            meta_filename : str or False
+                the first file with the meta extension, False if there
+                is none
+            image_entries : dict(str, os.DirEntry)
+                filename -> entry of each file with an authorized image
+                format
+
+            Raises
+            ------
+            FileNotFoundError
+                if the directory doesn't exist
+        """
+        meta_filename = False
+        image_entries = dict()
+
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if (not meta_filename
+                        and entry.name.endswith(cls.META_EXTENSION)):
+                    meta_filename = entry.name
+                # reject all files with the wrong extension (case
+                # insensitive)
+                elif entry.name.lower().endswith(
+                    CollectionUtils.AUTHORIZED_IMAGE_FORMATS
+                ):
+                    image_entries[entry.name] = entry
+
+        if meta_filename:
+            cls._meta_filenames[path] = meta_filename
+
+        return meta_filename, image_entries
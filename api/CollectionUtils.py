@@ -51,8 +51,27 @@ class CollectionUtils():
         """,
     }
 
+    # regexes used to parse datations, compiled once
+    # detect AP/AD
+    # NOTE: IN FRENCH !
+    _APAD_REGEX = re.compile(
+        r"((av\.?(ant)?)|(ap\.?(r[eè]s)?))\s?j\.?-?c\.?",
+        flags=re.IGNORECASE
+    )
+    # detect AP
+    _AP_REGEX = re.compile(r"ap(?:r[eè]s)")
+    # detect numeric values (case sensitive)
+    _NUM_VALUES_REGEX = re.compile(r"\b[IVX]+|\b\d+")
+    # detect roman numerals
+    _ROMAN_REGEX = re.compile(r"[IVX]+")
+    # detect if values are given in centuries
+    _CENTURY_REGEX = re.compile(
+        r"(\bsi[eè]cles?\b)|(\bs\.?\b)",
+        flags=re.IGNORECASE
+    )
+
     @classmethod
-    def filter(cls, img_list, mode="any", datation_min=-5000, datation_max=5000, **kwargs):
+    def filter(cls, img_list, mode="any", datation_min=-5000, datation_max=5000, index=None, **kwargs):
         """ Summary
             -------
             Filters a list of CollectionImages based on metadata
@@ -67,6 +86,14 @@ class CollectionUtils():
                 fields.
                 (e.g. any: artist OR title must match; all: artist
                 AND title must match)
+            datation_min : int, default=-5000
+                Minimal numeric datation of the images
+            datation_max : int, default=5000
+                Maximal numeric datation of the images
+            index : SearchIndex, optional
+                Index of the collection the images belong to (see
+                Collection.get_search_index()), to avoid parsing the
+                metadata of every image.
             kwargs:
                 Any attribute of CollectionImage (multiple allowed)
 
@@ -87,12 +114,6 @@ class CollectionUtils():
             Add a proper method for filtering by datation, such as "get
             all artworks in a range of dates (e.g. 1000-1200)"
         """
-        # type check our list
-        if not all(isinstance(i, CollectionImage) for i in img_list):
-            raise TypeError(
-                "All elements of img_list must be of type CollecitionImage"
-            )
-
         # check that the mode chosen is valid
         if mode not in ("any", "all"):
             raise ValueError("mode must be either 'any' or 'all'")
@@ -102,10 +123,21 @@ class CollectionUtils():
             if not hasattr(CollectionImage, attr):
                 raise ValueError("CollectionImage has no attribute %s" % attr)
 
+        if index is not None:
+            return cls._filter_with_index(
+                img_list, index, mode, datation_min, datation_max, **kwargs
+            )
+
+        # type check our list
+        if not all(isinstance(i, CollectionImage) for i in img_list):
+            raise TypeError(
+                "All elements of img_list must be of type CollecitionImage"
+            )
+
         # pre-filter for datation
         img_list = [
-            i for i in img_list if 
-            datation_min <= cls._datation_to_numeric(i.datation) <= datation_max
+            i for i in img_list if
+            datation_min <= i.get_numeric_datation() <= datation_max
         ]
 
         # for each image in the collection, retain if at least one of
@@ -138,6 +170,35 @@ class CollectionUtils():
         ]
 
 
+    @classmethod
+    def _filter_with_index(cls, img_list, index, mode, datation_min, datation_max, **kwargs):
+        """ Summary
+            -------
+            Same as filter(), but looks up the matching images in a
+            SearchIndex instead of going through the metadata of every
+            image.
+        """
+        matching = index.datation_range(datation_min, datation_max)
+
+        # sets of images matching each attribute we are actually
+        # filtering for
+        attr_matches = [
+            index.match(attr, value)
+            for attr, value in kwargs.items() if value.strip()
+        ]
+
+        if mode == "all":
+            # all([]) is True: with no attribute, every image matches
+            for attr_match in attr_matches:
+                matching = matching & attr_match
+        else:
+            # any([]) is False: with no attribute, no image matches
+            matching = matching & set().union(*attr_matches)
+
+        # keep the order of the list
+        return [image for image in img_list if image.filename in matching]
+
+
     @classmethod
     def sort(cls, img_list, attribute, reverse=False):
         """ Summary
@@ -179,7 +240,7 @@ class CollectionUtils():
             # datation string
             return sorted(
                 img_list,
-                key=lambda i: cls._datation_to_numeric(getattr(i, attribute)),
+                key=lambda i: i.get_numeric_datation(),
                 reverse=reverse
             )
 
@@ -255,45 +316,29 @@ class CollectionUtils():
                 "1er quart du 19ème siècle" -> 1800
                 etc.
         """
-        # detect AP/AD
-        # NOTE: IN FRENCH !
-        apad_regex = re.compile(
-            r"((av\.?(ant)?)|(ap\.?(r[eè]s)?))\s?j\.?-?c\.?",
-            flags=re.IGNORECASE
-        )
-
-        # detect numeric values (case sensitive)
-        num_values = re.compile(r"\b[IVX]+|\b\d+")
-
-        # detect if values are given in centuries
-        century = re.compile(
-            r"(\bsi[eè]cles?\b)|(\bs\.?\b)",
-            flags=re.IGNORECASE
-        )
-
         apad = 1
 
         # get AP/AD
         # AP -> negative number, AD -> positive number
-        if re.search(apad_regex, datation_string):
+        if cls._APAD_REGEX.search(datation_string):
             # check wether it is AP or AD
-            apad = 1 if re.search(r"ap(?:r[eè]s)", datation_string) else -1
+            apad = 1 if cls._AP_REGEX.search(datation_string) else -1
 
         values = list()
 
         # get all numeric values given in the string
-        matches = re.findall(num_values, datation_string)
+        matches = cls._NUM_VALUES_REGEX.findall(datation_string)
         if len(matches) > 0:
             # for each value
             for value in matches:
                 # translate to int
-                if re.match(r"[IVX]+", value):
+                if cls._ROMAN_REGEX.match(value):
                     values.append(cls._roman_to_int(value))
                 else:
                     values.append(int(value))
 
         # check if the values are given in centuries
-        if re.search(century, datation_string):
+        if cls._CENTURY_REGEX.search(datation_string):
             # multiply each value by 100 (as each digit means a century)
             values = [i * 100 if apad == -1 else (i - 1) * 100 for i in values]
 
@@ -0,0 +1,159 @@
+#pylint: disable=invalid-name
+"""
+    ColorIndex module
+    -----------------
+    Index of the palettes of a collection, to find the images with
+    similar colors.
+"""
+import numpy as np
+
+from api.ColorPalette import ColorPalette
+from api.ColorSpace import ColorSpace
+
+
+class ColorIndex():
+    """ Summary
+        -------
+        Index of the palettes of the images (see ColorPalette), kept in
+        a single NumPy array of CIELAB colors, so that a query compares
+        a palette with the whole collection in a few vectorized
+        operations.
+
+        Two palettes are compared with the symmetric Chamfer distance:
+        the mean distance from each color of a palette to the closest
+        color of the other, both ways. Distances are CIELAB distances
+        (Delta E 76), which are close to the perceived differences.
+
+        Methods
+        -------
+        query(palette, count)
+            The images whose palettes are the closest to a palette
+        get_index(collection)
+            The index of the cached palettes of a collection
+
+        Attributes
+        ----------
+        filenames : list(str)
+            The indexed images, in the order of the rows of the index
+    """
+
+    # collection's work directory -> (palettes version, index)
+    _indexes = dict()
+
+
+    def __init__(self, palettes):
+        """ Summary
+            -------
+            Builds the index
+
+            Arguments
+            ---------
+            palettes : dict
+                filename -> palette (list of RGB tuples, see
+                ColorPalette.get_colors())
+        """
+        self.filenames = [
+            filename for filename, palette in palettes.items() if palette
+        ]
+        num_colors = max(
+            (len(palettes[filename]) for filename in self.filenames),
+            default=1
+        )
+
+        # palettes with less colors are padded, the padding is masked
+        rgb = np.zeros((len(self.filenames), num_colors, 3), dtype=np.uint8)
+        self._mask = np.zeros((len(self.filenames), num_colors), dtype=bool)
+
+        for row, filename in enumerate(self.filenames):
+            palette = palettes[filename]
+            rgb[row, :len(palette)] = palette
+            self._mask[row, :len(palette)] = True
+
+        self._colors = ColorSpace.rgb_to_lab(rgb).astype(np.float32)
+        # squared norms, used by every query
+        self._squared_norms = (self._colors ** 2).sum(axis=2)
+
+
+    def __len__(self):
+        return len(self.filenames)
+
+
+    def query(self, palette, count=None):
+        """ Summary
+            -------
+            Finds the images whose palettes are the closest to a palette
+
+            Arguments
+            ---------
+            palette : list(tuple)
+                RGB colors (0-255)
+            count : int, optional
+                Maximum number of results. All the indexed images are
+                returned if None.
+
+            Returns
+            -------
+            list(tuple(str, float))
+                (filename, distance) of the closest images, closest
+                first
+        """
+        if not palette or not self.filenames:
+            return list()
+
+        query = ColorSpace.rgb_to_lab(palette).astype(np.float32)
+
+        # (images, colors of the image, colors of the query) squared
+        # distances, with |a - b|^2 = |a|^2 - 2 a.b + |b|^2. The square
+        # roots are only taken on the minimums.
+        distances = self._colors @ (-2 * query.T)
+        distances += self._squared_norms[:, :, None]
+        distances += (query ** 2).sum(axis=1)
+
+        # from each color of the images to the query...
+        to_query = np.sqrt(np.maximum(distances.min(axis=2), 0))
+        to_query = (to_query * self._mask).sum(axis=1) / self._mask.sum(axis=1)
+        # ...and from each color of the query to the images
+        distances[~self._mask] = np.inf
+        from_query = np.sqrt(
+            np.maximum(distances.min(axis=1), 0)
+        ).mean(axis=1)
+
+        scores = (to_query + from_query) / 2
+
+        if count is not None and count < len(scores):
+            closest = np.argpartition(scores, count)[:count]
+        else:
+            closest = np.arange(len(scores))
+        closest = closest[np.argsort(scores[closest], kind="stable")]
+
+        return [(self.filenames[row], float(scores[row])) for row in closest]
+
+
+    @classmethod
+    def get_index(cls, collection):
+        """ Summary
+            -------
+            Returns the index of the cached palettes of a collection.
+            The index is only rebuilt when new palettes were computed
+            since the last call. Files are not read: images whose
+            palette isn't cached yet are not in the index.
+
+            Arguments
+            ---------
+            collection : Collection
+                The collection to index
+
+            Returns
+            -------
+            ColorIndex
+        """
+        version = ColorPalette.get_version()
+        cached = cls._indexes.get(collection.work_directory)
+
+        if cached is None or cached[0] != version:
+            index = cls(ColorPalette.get_recorded(
+                collection.work_directory, collection.file_records
+            ))
+            cached = cls._indexes[collection.work_directory] = (version, index)
+
+        return cached[1]
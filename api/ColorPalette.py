@@ -0,0 +1,510 @@
+#pylint: disable=invalid-name
+"""
+    ColorPalette module
+    -------------------
+    Computes the palettes of dominant colors of the images, caches them,
+    and computes them in the background for a whole collection.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from api.ColorSpace import ColorSpace
+from api.ImageReader import ImageReader
+from api.KMeans import KMeans
+from api.RecordCache import RecordCache
+
+
+class ColorPalette():
+    """ Summary
+        -------
+        Static class computing the palettes of dominant colors of the
+        images.
+
+        Palettes are cached by path, and invalidated when the file's
+        modification time or size change, so the palette of an image is
+        only computed once per version. The cache can be saved in the
+        file records of a collection (see store() and restore()), with
+        the engine which computed the palettes.
+
+        The palettes are computed with one of the ENGINES, chosen with
+        ENGINE:
+            adaptive
+                Pillow's adaptive quantization (median cut) of a
+                thumbnail of the image
+            kmeans
+                k-means clustering of the pixels of a small version of
+                the image, in RGB. Images are processed by batches.
+            kmeans-lab
+                Same, in CIELAB: the clusters group colors that look
+                alike, rather than colors with close RGB values.
+
+        Methods
+        -------
+        get_colors(image_path)
+            Returns the palette of an image, computing it if needed.
+        get_colors_batch(image_paths)
+            Returns the palettes of several images, computing the
+            missing ones at once.
+        get_recorded(work_dir, file_records)
+            Returns the cached palettes of the images of a collection.
+        get_version()
+            Returns a number which changes whenever the cache changes.
+        get_cached(image_path)
+            Returns the palette of an image if it is already known.
+        load(image_path, callback)
+            Computes the palette of an image in the background, once
+            even if it is requested several times meanwhile.
+        precompute(work_dir, filenames)
+            Computes in the background the palettes of all the images
+            of a collection.
+        restore(work_dir, file_records)
+            Fills the cache with the palettes saved in file records.
+        store(work_dir, file_records)
+            Saves the cached palettes in file records.
+
+        Notes
+        -----
+        load() and precompute() must be called from the main thread.
+    """
+    NUM_COLORS = 7
+    RESIZE = 100
+
+    ENGINES = ("adaptive", "kmeans", "kmeans-lab")
+    ENGINE = "adaptive"
+
+    # size the images are resized to for k-means, regardless of their
+    # aspect ratio: all the images of a batch have the same number of
+    # pixels
+    KMEANS_SIZE = (48, 48)
+    # number of images clustered at once by precompute()
+    BATCH_SIZE = 32
+
+    # file records keys of the palette of an image, and of the engine
+    # that computed it
+    RECORD_KEY = "palette"
+    ENGINE_RECORD_KEY = "palette_engine"
+
+    # (palette, engine) of the images. JSON turns the colors into lists,
+    # and the records saved before the engines were added have none.
+    _cache = RecordCache(
+        RECORD_KEY,
+        decode=lambda colors, engine: (
+            [tuple(color) for color in colors], engine or "adaptive"
+        ),
+        extra_keys=(ENGINE_RECORD_KEY,)
+    )
+
+    # palettes requested by the user (load()) don't wait behind the
+    # ones of the whole collection (precompute())
+    _executor = None
+    # absolute path -> future of the palettes being computed by load()
+    _loading = dict()
+    _background_executor = None
+    _background_jobs = list()
+
+
+    @classmethod
+    def get_colors(cls, image_path):
+        """ Summary
+            -------
+            Gets the palette of an image
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image of which the palette is
+                wanted.
+
+            Returns
+            -------
+            list(tuple):
+                A list of tuples containing the RGB values of the color,
+                in a range from 0 to 255.
+        """
+        stat = os.stat(image_path)
+        colors = cls._get_cached(image_path, stat)
+
+        if colors is None:
+            colors = cls._compute_palettes([image_path])[0]
+            cls._set_cached(image_path, stat, colors)
+
+        return colors
+
+
+    @classmethod
+    def get_colors_batch(cls, image_paths):
+        """ Summary
+            -------
+            Gets the palettes of several images. The ones which aren't
+            cached are computed in one batch.
+
+            Arguments
+            ---------
+            image_paths : list(str)
+                Absolute paths to the images
+
+            Returns
+            -------
+            list
+                The palette of each image (see get_colors()), None for
+                the images which couldn't be read.
+        """
+        palettes = [None] * len(image_paths)
+        # index -> stat of the images to compute
+        missing = dict()
+
+        for idx, image_path in enumerate(image_paths):
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                continue
+
+            palettes[idx] = cls._get_cached(image_path, stat)
+            if palettes[idx] is None:
+                missing[idx] = stat
+
+        computed = cls._compute_palettes(
+            [image_paths[idx] for idx in missing], skip_errors=True
+        )
+
+        for (idx, stat), colors in zip(missing.items(), computed):
+            if colors is not None:
+                cls._set_cached(image_paths[idx], stat, colors)
+            palettes[idx] = colors
+
+        return palettes
+
+
+    @classmethod
+    def get_cached(cls, image_path):
+        """ Summary
+            -------
+            Returns the palette of an image if it was already computed
+            for the current version of the file, None otherwise.
+        """
+        try:
+            return cls._get_cached(image_path, os.stat(image_path))
+        except OSError:
+            return None
+
+
+    @classmethod
+    def get_recorded(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Returns the cached palettes of the images of a collection
+            which match the version of the files in the file records
+            (see RecordCache.get_recorded()), computed with the current
+            ENGINE.
+
+            Returns
+            -------
+            dict
+                filename -> palette, for the images whose palette is
+                cached
+        """
+        return {
+            filename: colors
+            for filename, (colors, engine)
+            in cls._cache.get_recorded(work_dir, file_records).items()
+            if engine == cls.ENGINE
+        }
+
+
+    @classmethod
+    def get_version(cls):
+        """ Summary
+            -------
+            Returns a number which changes whenever a palette is added
+            to the cache, so users of the cache (e.g. ColorIndex) know
+            when they are out of date.
+        """
+        return cls._cache.version
+
+
+    @classmethod
+    def load(cls, image_path, callback=None):
+        """ Summary
+            -------
+            Computes the palette of an image in a worker thread. If it
+            is already being computed, the callback waits for the same
+            job.
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+            callback : callable, optional
+                Called on the main thread with callback(colors). colors
+                is an empty list if the palette couldn't be computed.
+        """
+        future = cls._loading.get(image_path)
+
+        if future is None:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="ColorPalette"
+                )
+
+            future = cls._executor.submit(cls.get_colors, image_path)
+            cls._loading[image_path] = future
+            future.add_done_callback(
+                lambda f: Clock.schedule_once(
+                    lambda _dt: cls._on_loaded(image_path, f)
+                )
+            )
+
+        if callback is not None:
+            future.add_done_callback(
+                lambda f: Clock.schedule_once(
+                    lambda _dt: callback(cls._get_result(image_path, f))
+                )
+            )
+
+
+    @classmethod
+    def precompute(cls, work_dir, filenames):
+        """ Summary
+            -------
+            Computes in the background the palettes of images which
+            aren't cached yet. The jobs of a previous call that didn't
+            start yet are cancelled.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            filenames : iterable(str)
+                Filenames of the images, relative to work_dir
+        """
+        for future in cls._background_jobs:
+            future.cancel()
+
+        if cls._background_executor is None:
+            cls._background_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="ColorPaletteBackground"
+            )
+
+        image_paths = [
+            os.path.join(work_dir, filename) for filename in filenames
+        ]
+        cls._background_jobs = [
+            cls._background_executor.submit(
+                cls._precompute_batch,
+                image_paths[start:start + cls.BATCH_SIZE]
+            )
+            for start in range(0, len(image_paths), cls.BATCH_SIZE)
+        ]
+
+
+    @classmethod
+    def restore(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Fills the cache with the palettes saved in the file records
+            of a collection (see RecordCache.restore()).
+        """
+        cls._cache.restore(work_dir, file_records)
+
+
+    @classmethod
+    def store(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Saves the cached palettes in the file records of a
+            collection (see RecordCache.store()).
+
+            Returns
+            -------
+            set(str)
+                The filenames of the records which changed
+        """
+        return cls._cache.store(work_dir, file_records)
+
+
+    @classmethod
+    def _get_cached(cls, image_path, stat):
+        cached = cls._cache.get(image_path, stat)
+
+        # palettes of another engine are computed again
+        if cached is not None and cached[1] == cls.ENGINE:
+            return cached[0]
+
+        return None
+
+
+    @classmethod
+    def _set_cached(cls, image_path, stat, colors):
+        cls._cache.set(image_path, stat, (colors, cls.ENGINE))
+
+
+    @classmethod
+    def _precompute_batch(cls, image_paths):
+        """ Summary
+            -------
+            Runs in the background worker. Errors are only logged, the
+            palettes will be computed again when the images are
+            displayed.
+        """
+        try:
+            cls.get_colors_batch(image_paths)
+        except Exception:
+            Logger.exception("ColorPalette: Couldn't compute palettes")
+
+
+    @classmethod
+    def _on_loaded(cls, image_path, future):
+        """ Summary
+            -------
+            Runs on the main thread once a palette of load() is
+            computed. The errors are logged by the callbacks.
+        """
+        if cls._loading.get(image_path) is future:
+            del cls._loading[image_path]
+
+
+    @staticmethod
+    def _get_result(image_path, future):
+        try:
+            return future.result()
+        except Exception:
+            Logger.exception(
+                "ColorPalette: Couldn't compute the palette of %s" % image_path
+            )
+            return list()
+
+
+    @classmethod
+    def _compute_palettes(cls, image_paths, skip_errors=False):
+        """ Summary
+            -------
+            Computes the palettes of images with the current ENGINE.
+
+            Arguments
+            ---------
+            image_paths : list(str)
+                Absolute paths to the images
+            skip_errors : bool
+                If True, the palette of an image which couldn't be read
+                is None. Otherwise the error is raised.
+
+            Returns
+            -------
+            list
+                The palette of each image
+        """
+        if cls.ENGINE not in cls.ENGINES:
+            raise ValueError("Unknown palette engine %s" % cls.ENGINE)
+
+        palettes = [None] * len(image_paths)
+        images = dict()
+
+        for idx, image_path in enumerate(image_paths):
+            try:
+                if cls.ENGINE == "adaptive":
+                    # Resize image to speed up processing
+                    images[idx] = ImageReader.read_thumbnail(
+                        image_path, (cls.RESIZE, cls.RESIZE)
+                    )
+                else:
+                    images[idx] = ImageReader.read_resized(
+                        image_path, cls.KMEANS_SIZE
+                    )
+            except Exception:
+                if not skip_errors:
+                    raise
+                Logger.warning(
+                    "ColorPalette: Couldn't read %s" % image_path
+                )
+
+        if cls.ENGINE == "adaptive":
+            for idx, img in images.items():
+                palettes[idx] = cls._adaptive_palette(img)
+
+        elif images:
+            computed = cls._kmeans_palettes(
+                list(images.values()), lab=cls.ENGINE == "kmeans-lab"
+            )
+            for idx, colors in zip(images, computed):
+                palettes[idx] = colors
+
+        return palettes
+
+
+    @classmethod
+    def _adaptive_palette(cls, img):
+        """ Summary
+            -------
+            Computes the palette of an image by adaptive quantization.
+
+            Adapted from : https://gist.github.com/zollinger/1722663
+        """
+        # Reduce to palette
+        paletted = img.convert(
+            'P',
+            palette=Image.ADAPTIVE,
+            colors=cls.NUM_COLORS
+        )
+
+        # Find dominant colors
+        palette = paletted.getpalette()
+        color_counts = sorted(paletted.getcolors(), reverse=True)
+        colors = list()
+        # images with few colors give a shorter palette
+        for _count, palette_index in color_counts[:cls.NUM_COLORS]:
+            dominant_color = palette[palette_index*3:palette_index*3+3]
+            colors.append(tuple(dominant_color))
+
+        return colors
+
+
+    @classmethod
+    def _kmeans_palettes(cls, images, lab=False):
+        """ Summary
+            -------
+            Computes the palettes of a batch of images of the same size
+            by k-means clustering of their pixels.
+
+            Arguments
+            ---------
+            images : list(PIL.Image.Image)
+                RGB images, all of the same size
+            lab : bool
+                If True, the pixels are clustered in CIELAB rather than
+                in RGB.
+
+            Returns
+            -------
+            list
+                The palette of each image
+        """
+        # (batch, pixels, 3)
+        pixels = np.stack([
+            np.asarray(img, dtype=np.uint8).reshape(-1, 3) for img in images
+        ])
+        if lab:
+            pixels = ColorSpace.rgb_to_lab(pixels)
+
+        centers, counts = KMeans.fit(pixels, cls.NUM_COLORS)
+
+        if lab:
+            centers = ColorSpace.lab_to_rgb(centers)
+        else:
+            centers = np.clip(np.round(centers), 0, 255).astype(np.uint8)
+
+        palettes = list()
+        for image_centers, image_counts in zip(centers, counts):
+            # most frequent colors first, without the empty clusters
+            order = np.argsort(-image_counts, kind="stable")
+            palettes.append([
+                tuple(int(v) for v in image_centers[k])
+                for k in order if image_counts[k] > 0
+            ])
+
+        return palettes
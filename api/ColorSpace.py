@@ -0,0 +1,111 @@
+"""
+    Conversions between color spaces, vectorized with NumPy
+"""
+import numpy as np
+
+
+class ColorSpace():
+    """ Summary
+        -------
+        Static class converting colors between sRGB and CIELAB (D65).
+
+        In CIELAB, the euclidean distance between two colors is close to
+        the difference perceived by the eye, which is not the case in
+        RGB.
+
+        Methods
+        -------
+        rgb_to_lab(rgb)
+            Converts sRGB colors (0-255) to CIELAB
+        lab_to_rgb(lab)
+            Converts CIELAB colors to sRGB (0-255)
+    """
+
+    # sRGB (linear) -> XYZ, D65 white point
+    _RGB_TO_XYZ = np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ])
+    _XYZ_TO_RGB = np.linalg.inv(_RGB_TO_XYZ)
+    _WHITE = _RGB_TO_XYZ.sum(axis=1)
+
+    _EPSILON = 216 / 24389
+    _KAPPA = 24389 / 27
+
+
+    @classmethod
+    def rgb_to_lab(cls, rgb):
+        """ Summary
+            -------
+            Converts sRGB colors to CIELAB
+
+            Arguments
+            ---------
+            rgb : array_like
+                Colors in the last dimension (..., 3), in 0-255
+
+            Returns
+            -------
+            np.ndarray
+                (..., 3) array of float L*, a*, b* values
+        """
+        rgb = np.asarray(rgb, dtype=np.float64) / 255
+
+        # undo the gamma of sRGB
+        linear = np.where(
+            rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4
+        )
+        xyz = linear @ cls._RGB_TO_XYZ.T / cls._WHITE
+
+        f = np.where(
+            xyz > cls._EPSILON,
+            np.cbrt(xyz),
+            (cls._KAPPA * xyz + 16) / 116
+        )
+
+        return np.stack([
+            116 * f[..., 1] - 16,
+            500 * (f[..., 0] - f[..., 1]),
+            200 * (f[..., 1] - f[..., 2]),
+        ], axis=-1)
+
+
+    @classmethod
+    def lab_to_rgb(cls, lab):
+        """ Summary
+            -------
+            Converts CIELAB colors to sRGB. Colors out of the sRGB gamut
+            are clipped.
+
+            Arguments
+            ---------
+            lab : array_like
+                Colors in the last dimension (..., 3)
+
+            Returns
+            -------
+            np.ndarray
+                (..., 3) array of uint8 R, G, B values
+        """
+        lab = np.asarray(lab, dtype=np.float64)
+
+        f_y = (lab[..., 0] + 16) / 116
+        f = np.stack([
+            f_y + lab[..., 1] / 500,
+            f_y,
+            f_y - lab[..., 2] / 200,
+        ], axis=-1)
+
+        xyz = np.where(
+            f ** 3 > cls._EPSILON, f ** 3, (116 * f - 16) / cls._KAPPA
+        ) * cls._WHITE
+        linear = np.clip(xyz @ cls._XYZ_TO_RGB.T, 0, 1)
+
+        rgb = np.where(
+            linear <= 0.0031308,
+            linear * 12.92,
+            1.055 * linear ** (1 / 2.4) - 0.055
+        )
+
+        return np.round(rgb * 255).astype(np.uint8)
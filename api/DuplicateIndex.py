@@ -0,0 +1,201 @@
+#pylint: disable=invalid-name
+"""
+    DuplicateIndex module
+    ---------------------
+    Index of the perceptual hashes of a collection, to find the near
+    duplicates of an image.
+"""
+from api.BKTree import BKTree
+from api.PerceptualHash import PerceptualHash
+
+
+class DuplicateIndex():
+    """ Summary
+        -------
+        Index of the perceptual hashes of the images (see
+        PerceptualHash) in a BK-tree, so that the near duplicates of an
+        image are found without comparing it with the whole collection.
+
+        Two images are near duplicates when the Hamming distance between
+        their HASH is at most MAX_DISTANCES[HASH]. pHash is the default:
+        on resized, re-encoded and retouched copies it stays within 6
+        bits of the original, while different images are more than 12
+        bits apart. aHash and dHash are faster to compute but confuse
+        more images.
+
+        Methods
+        -------
+        add(filename, hashes)
+            Adds an image to the index
+        query(hashes)
+            The images whose hashes are close to the given ones
+        get_groups()
+            The groups of near duplicates of the index
+        get_index(collection)
+            The index of the cached hashes of a collection
+
+        Attributes
+        ----------
+        hashes : dict
+            filename -> (aHash, dHash, pHash) of the indexed images
+    """
+
+    HASHES = ("ahash", "dhash", "phash")
+    HASH = "phash"
+    MAX_DISTANCES = {"ahash": 5, "dhash": 8, "phash": 10}
+
+    # collection's work directory -> (hashes version, index)
+    _indexes = dict()
+
+
+    def __init__(self, hashes=None):
+        """ Summary
+            -------
+            Builds the index
+
+            Arguments
+            ---------
+            hashes : dict, optional
+                filename -> (aHash, dHash, pHash) (see
+                PerceptualHash.get_hashes())
+        """
+        self.hashes = dict()
+        # HASH may change later on, the index keeps the one of its tree
+        self._hash = self.HASH
+        self._position = self.HASHES.index(self._hash)
+        self._tree = BKTree()
+
+        for filename, image_hashes in (hashes or dict()).items():
+            self.add(filename, image_hashes)
+
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+    def add(self, filename, hashes):
+        """ Summary
+            -------
+            Adds an image to the index
+
+            Arguments
+            ---------
+            filename : str
+                Filename of the image
+            hashes : tuple(int, int, int)
+                (aHash, dHash, pHash) of the image
+
+            Raises
+            ------
+            ValueError
+                If the image is already indexed
+        """
+        if filename in self.hashes:
+            raise ValueError("%s is already indexed" % filename)
+
+        self.hashes[filename] = hashes
+        self._tree.add(hashes[self._position], filename)
+
+
+    def query(self, hashes, exclude=None):
+        """ Summary
+            -------
+            Finds the near duplicates of an image
+
+            Arguments
+            ---------
+            hashes : tuple(int, int, int)
+                (aHash, dHash, pHash) of the image
+            exclude : str, optional
+                Filename left out of the results, e.g. the image itself
+
+            Returns
+            -------
+            list(tuple(str, int))
+                (filename, distance) of the near duplicates, closest
+                first
+        """
+        return [
+            (filename, distance) for distance, filename in self._tree.search(
+                hashes[self._position], self.MAX_DISTANCES[self._hash]
+            )
+            if filename != exclude
+        ]
+
+
+    def get_groups(self):
+        """ Summary
+            -------
+            Groups the indexed images with their near duplicates. Near
+            duplicates of near duplicates are in the same group.
+
+            Returns
+            -------
+            list(list(str))
+                The groups of at least two images, each in the order of
+                the index
+        """
+        groups = list()
+        grouped = set()
+
+        for filename in self.hashes:
+            if filename in grouped:
+                continue
+
+            group = [filename]
+            grouped.add(filename)
+
+            # grows the group with the near duplicates of its images
+            for member in group:
+                for duplicate, _distance in self.query(self.hashes[member]):
+                    if duplicate not in grouped:
+                        group.append(duplicate)
+                        grouped.add(duplicate)
+
+            if len(group) > 1:
+                groups.append(group)
+
+        return groups
+
+
+    @classmethod
+    def get_index(cls, collection):
+        """ Summary
+            -------
+            Returns the index of the cached hashes of a collection. Only
+            the newly hashed images are added to the index, it is built
+            again when hashes changed. Files are not read: images which
+            aren't hashed yet are not in the index.
+
+            Arguments
+            ---------
+            collection : Collection
+                The collection to index
+
+            Returns
+            -------
+            DuplicateIndex
+        """
+        version = PerceptualHash.get_version()
+        cached = cls._indexes.get(collection.work_directory)
+
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        hashes = PerceptualHash.get_recorded(
+            collection.work_directory, collection.file_records
+        )
+
+        if cached is not None and cached[1]._hash == cls.HASH and all(
+            hashes.get(filename) == image_hashes
+            for filename, image_hashes in cached[1].hashes.items()
+        ):
+            index = cached[1]
+            for filename, image_hashes in hashes.items():
+                if filename not in index.hashes:
+                    index.add(filename, image_hashes)
+        else:
+            index = cls(hashes)
+
+        cls._indexes[collection.work_directory] = (version, index)
+        return index
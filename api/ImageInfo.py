@@ -0,0 +1,168 @@
+#pylint: disable=invalid-name
+"""
+    ImageInfo module
+    ----------------
+    Reads the properties of image files (dimensions, format, EXIF...)
+    from their headers, without decoding the pixels.
+"""
+import os
+
+from PIL import ExifTags, Image
+
+from api.RecordCache import RecordCache
+
+
+class ImageInfo():
+    """ Summary
+        -------
+        Static class probing image files. Pillow only reads the header
+        of a file when opening it, so getting the properties of an image
+        doesn't decode it.
+
+        The results are cached by path, and invalidated when the file's
+        modification time or size change, so a file is only probed once
+        per version. The cache can be saved in the file records of a
+        collection (see store() and restore()), so the files aren't
+        probed again in the next sessions.
+
+        The properties of an image are given as a dict:
+            size : tuple(int, int)
+                (width, height) of the image in pixels
+            format : str
+                File format as identified by Pillow (e.g. "JPEG")
+            mode : str
+                Pillow's pixel format (e.g. "RGB", "L", "RGBA")
+            exif : dict(str, str)
+                Readable EXIF tags (tag name -> value)
+
+        Methods
+        -------
+        get_info(image_path)
+            Returns the properties of an image.
+        get_size(image_path)
+            Returns the dimensions of an image in pixels.
+        restore(work_dir, file_records)
+            Fills the cache with the properties saved in file records.
+        store(work_dir, file_records)
+            Saves the cached properties in file records.
+
+        Notes
+        -----
+        The methods are thread safe.
+    """
+
+    # file records key of the properties of an image
+    RECORD_KEY = "info"
+    # EXIF values longer than this (thumbnails, maker notes...) are
+    # not kept
+    MAX_EXIF_LENGTH = 256
+
+    # JSON turns the size into a list
+    _cache = RecordCache(
+        RECORD_KEY, decode=lambda info: dict(info, size=tuple(info["size"]))
+    )
+
+
+    @classmethod
+    def get_info(cls, image_path):
+        """ Summary
+            -------
+            Returns the properties of an image
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+
+            Returns
+            -------
+            dict
+                see ImageInfo. It is shared: don't modify it.
+
+            Raises
+            ------
+            OSError
+                If the file couldn't be read or isn't an image.
+        """
+        stat = os.stat(image_path)
+        info = cls._cache.get(image_path, stat)
+
+        if info is None:
+            info = cls._probe(image_path)
+            cls._cache.set(image_path, stat, info)
+
+        return info
+
+
+    @classmethod
+    def get_size(cls, image_path):
+        """ Summary
+            -------
+            Returns the dimensions of an image
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+
+            Returns
+            -------
+            tuple(int, int)
+                (width, height) of the image in pixels
+
+            Raises
+            ------
+            OSError
+                If the file couldn't be read or isn't an image.
+        """
+        return cls.get_info(image_path)["size"]
+
+
+    @classmethod
+    def restore(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Fills the cache with the properties saved in the file
+            records of a collection (see RecordCache.restore()).
+        """
+        cls._cache.restore(work_dir, file_records)
+
+
+    @classmethod
+    def store(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Saves the cached properties of the images in the file
+            records of a collection (see RecordCache.store()).
+
+            Returns
+            -------
+            set(str)
+                The filenames of the records which changed
+        """
+        return cls._cache.store(work_dir, file_records)
+
+
+    @classmethod
+    def _probe(cls, image_path):
+        """ Summary
+            -------
+            Reads the properties of an image from its header
+        """
+        with Image.open(image_path) as img:
+            exif = dict()
+            for tag, value in img.getexif().items():
+                # binary data isn't useful to display
+                if isinstance(value, bytes):
+                    continue
+
+                value = str(value).strip("\x00 ")
+                if value and len(value) <= cls.MAX_EXIF_LENGTH:
+                    exif[ExifTags.TAGS.get(tag, str(tag))] = value
+
+            return {
+                "size": img.size,
+                "format": img.format,
+                "mode": img.mode,
+                "exif": exif,
+            }
@@ -0,0 +1,189 @@
+#pylint: disable=invalid-name
+"""
+    ImageReader module
+    ------------------
+    Decodes downsampled versions of images (thumbnails, palettes,
+    export) without decoding more pixels than needed.
+"""
+import math
+
+from PIL import Image
+
+from api.ImageInfo import ImageInfo
+from api.TiffReader import TiffReader
+
+
+class ImageReader():
+    """ Summary
+        -------
+        Static class reading images at a reduced size.
+
+        JPEGs can be decoded directly at 1/2, 1/4 or 1/8 of their size
+        from the DCT coefficients (Image.draft()). Very large TIFFs are
+        reduced one band at a time (see TiffReader). Other formats are
+        decoded in full, then reduced with a fast box filter before the
+        final, more expensive resampling.
+
+        In every case the image is kept at least REDUCING_GAP times
+        bigger than the target size until the final resampling, so the
+        result looks the same as resampling the full image.
+
+        Methods
+        -------
+        read_resized(image_path, size, background)
+            Reads an image resized to the given size, in RGB.
+        read_thumbnail(image_path, max_size, background)
+            Reads an image downsampled to fit in the given size, in RGB.
+        to_rgb(img, background)
+            Converts an image to RGB, flattening transparency.
+    """
+
+    REDUCING_GAP = 2.0
+
+
+    @classmethod
+    def read_resized(cls, image_path, size, background=(0, 0, 0)):
+        """ Summary
+            -------
+            Reads an image resized to the given size, in RGB.
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+            size : tuple(int, int)
+                (width, height) of the result
+            background : tuple(int, int, int)
+                RGB color of the background of transparent images
+
+            Returns
+            -------
+            PIL.Image.Image
+                The loaded image. The file is closed.
+
+            Raises
+            ------
+            OSError
+                If the image couldn't be read.
+        """
+        size = tuple(size)
+
+        with Image.open(image_path) as original:
+            reader = TiffReader.open(original)
+
+            if reader is not None:
+                img = cls.to_rgb(
+                    reader.read_reduced(cls._get_min_size(size)), background
+                )
+            else:
+                cls._draft(original, size)
+                img = cls.to_rgb(original, background)
+
+                # cheap integer downscale first
+                factor = int(min(
+                    img.width / size[0], img.height / size[1]
+                ) / cls.REDUCING_GAP)
+                if factor > 1:
+                    img = img.reduce(factor)
+
+            if img.size != size:
+                img = img.resize(size, Image.LANCZOS)
+
+            # the original is unusable once closed
+            if img is original:
+                img = img.copy()
+
+        return img
+
+
+    @classmethod
+    def read_thumbnail(cls, image_path, max_size, background=(0, 0, 0)):
+        """ Summary
+            -------
+            Reads an image downsampled to fit in the given size, keeping
+            its aspect ratio, in RGB. Smaller images are not enlarged.
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+            max_size : tuple(int, int)
+                Maximum (width, height) of the result
+            background : tuple(int, int, int)
+                RGB color of the background of transparent images
+
+            Returns
+            -------
+            PIL.Image.Image
+                The loaded image. The file is closed.
+        """
+        width, height = ImageInfo.get_size(image_path)
+
+        scale = min(1, max_size[0] / width, max_size[1] / height)
+        size = (
+            max(1, round(width * scale)),
+            max(1, round(height * scale))
+        )
+
+        return cls.read_resized(image_path, size, background)
+
+
+    @staticmethod
+    def to_rgb(img, background=(0, 0, 0)):
+        """ Summary
+            -------
+            Converts an image to RGB. Transparent images are flattened on
+            a background color.
+
+            Arguments
+            ---------
+            img : PIL.Image.Image
+                The image to convert
+            background : tuple(int, int, int)
+                RGB color of the background
+
+            Returns
+            -------
+            PIL.Image.Image
+                The image in RGB, img itself if it already was.
+        """
+        if img.mode in ("RGBA", "LA") or (
+            img.mode == "P" and "transparency" in img.info
+        ):
+            img = img.convert("RGBA")
+            flattened = Image.new("RGB", img.size, background)
+            flattened.paste(img, mask=img.split()[-1])
+            return flattened
+
+        if img.mode != "RGB":
+            return img.convert("RGB")
+
+        return img
+
+
+    @classmethod
+    def _get_min_size(cls, size):
+        """ Summary
+            -------
+            Size under which an image isn't reduced before the final
+            resampling
+        """
+        return (
+            math.ceil(size[0] * cls.REDUCING_GAP),
+            math.ceil(size[1] * cls.REDUCING_GAP)
+        )
+
+
+    @classmethod
+    def _draft(cls, img, size):
+        """ Summary
+            -------
+            Configures the decoder of an image that isn't loaded yet to
+            decode it at a reduced scale, if its format allows it.
+        """
+        min_size = cls._get_min_size(size)
+
+        if img.format == "JPEG":
+            # picks the smallest scale that is still bigger than
+            # min_size
+            img.draft("RGB", min_size)
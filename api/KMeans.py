@@ -0,0 +1,128 @@
+"""
+    Batched k-means clustering, vectorized with NumPy
+"""
+import numpy as np
+
+
+class KMeans():
+    """ Summary
+        -------
+        Static class clustering several sets of points at once, e.g. the
+        pixels of a batch of images, with Lloyd's algorithm.
+
+        The centers are initialized deterministically, at evenly spaced
+        quantiles of the first coordinate (the lightness in CIELAB, red
+        in RGB), so the same input always gives the same clusters.
+
+        Methods
+        -------
+        fit(points, num_clusters)
+            Clusters each set of points of a batch.
+    """
+
+    MAX_ITERATIONS = 20
+    # stop once no center moves more than this
+    TOLERANCE = 0.5
+
+
+    @classmethod
+    def fit(cls, points, num_clusters, max_iterations=MAX_ITERATIONS):
+        """ Summary
+            -------
+            Clusters each set of points of a batch.
+
+            Arguments
+            ---------
+            points : np.ndarray
+                (batch, num_points, dimensions) array of floats. All the
+                sets of the batch have the same number of points.
+            num_clusters : int
+                Number of clusters per set
+            max_iterations : int
+                Maximum number of iterations of Lloyd's algorithm
+
+            Returns
+            -------
+            centers : np.ndarray
+                (batch, num_clusters, dimensions) array, the center of
+                each cluster
+            counts : np.ndarray
+                (batch, num_clusters) array, the number of points in
+                each cluster. Clusters can be empty when a set has less
+                than num_clusters distinct points.
+        """
+        points = np.asarray(points, dtype=np.float32)
+        num_points = points.shape[1]
+
+        # deterministic initialization
+        order = np.argsort(points[..., 0], axis=1, kind="stable")
+        quantiles = (
+            (np.arange(num_clusters) + 0.5) * num_points / num_clusters
+        ).astype(int)
+        centers = np.take_along_axis(
+            points, order[:, quantiles, None], axis=1
+        )
+
+        for _ in range(max_iterations):
+            labels = cls._assign(points, centers)
+            sums, counts = cls._accumulate(points, labels, num_clusters)
+
+            # empty clusters keep their center
+            new_centers = np.where(
+                counts[..., None] > 0,
+                sums / np.maximum(counts, 1)[..., None],
+                centers
+            )
+
+            shift = np.abs(new_centers - centers).max()
+            centers = new_centers
+
+            if shift < cls.TOLERANCE:
+                break
+
+        labels = cls._assign(points, centers)
+        _sums, counts = cls._accumulate(points, labels, num_clusters)
+
+        return centers, counts
+
+
+    @staticmethod
+    def _assign(points, centers):
+        """ Summary
+            -------
+            Index of the closest center of each point
+        """
+        # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, |p|^2 doesn't change the
+        # closest center
+        distances = (
+            (centers ** 2).sum(axis=2)[:, None, :]
+            - 2 * points @ centers.transpose(0, 2, 1)
+        )
+        return distances.argmin(axis=2)
+
+
+    @staticmethod
+    def _accumulate(points, labels, num_clusters):
+        """ Summary
+            -------
+            Sums and counts the points of each cluster, for all the sets
+            of the batch at once
+        """
+        batch, _num_points, dimensions = points.shape
+
+        # give each cluster of the batch its own bin
+        bins = (
+            labels + np.arange(batch)[:, None] * num_clusters
+        ).ravel()
+        size = batch * num_clusters
+
+        counts = np.bincount(bins, minlength=size)
+        sums = np.stack([
+            np.bincount(bins, points[..., d].ravel(), minlength=size)
+            for d in range(dimensions)
+        ], axis=-1)
+
+        return (
+            sums.reshape(batch, num_clusters, dimensions).astype(np.float32),
+            counts.reshape(batch, num_clusters)
+        )
@@ -0,0 +1,324 @@
+#pylint: disable=invalid-name
+"""
+    PerceptualHash module
+    ---------------------
+    Computes perceptual hashes of the images, caches them, and computes
+    them in the background for a whole collection.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from api.ImageReader import ImageReader
+from api.RecordCache import RecordCache
+
+
+class PerceptualHash():
+    """ Summary
+        -------
+        Static class computing perceptual hashes of the images: 64 bits
+        integers which stay close (in Hamming distance) when an image is
+        resized, re-encoded or slightly retouched, unlike a checksum of
+        the file.
+
+        Three hashes are computed from a small grayscale version of the
+        image:
+            aHash
+                each pixel of an 8x8 version compared with the mean
+            dHash
+                each pixel of a 9x8 version compared with its right
+                neighbour
+            pHash
+                the 8x8 lowest frequencies of the discrete cosine
+                transform of a 32x32 version, compared with their median
+
+        The hashes are cached like the palettes of ColorPalette: by
+        path, for a version (modification time, size) of the file, and
+        can be saved in the file records of a collection.
+
+        Methods
+        -------
+        get_hashes(image_path)
+            Returns the hashes of an image, computing them if needed.
+        get_cached(image_path)
+            Returns the hashes of an image if they are already known.
+        get_recorded(work_dir, file_records)
+            Returns the cached hashes of the images of a collection.
+        get_version()
+            Returns a number which changes whenever the cache changes.
+        load(image_path, callback)
+            Computes the hashes of an image in the background.
+        precompute(work_dir, filenames)
+            Computes in the background the hashes of all the images of
+            a collection.
+        restore(work_dir, file_records)
+            Fills the cache with the hashes saved in file records.
+        store(work_dir, file_records)
+            Saves the cached hashes in file records.
+
+        Notes
+        -----
+        load() and precompute() must be called from the main thread.
+    """
+    HASH_SIZE = 8
+    # size of the image of which pHash takes the DCT
+    DCT_SIZE = 32
+
+    # file records key of the (aHash, dHash, pHash) of an image
+    RECORD_KEY = "hashes"
+    # number of images hashed by a background job
+    BATCH_SIZE = 32
+
+    # (aHash, dHash, pHash) of the images, saved as hexadecimal strings
+    _cache = RecordCache(
+        RECORD_KEY,
+        encode=lambda hashes: ["%016x" % value for value in hashes],
+        decode=lambda hashes: tuple(int(value, 16) for value in hashes)
+    )
+
+    # hashes requested by the user (load()) don't wait behind the ones
+    # of the whole collection (precompute())
+    _executor = None
+    _background_executor = None
+    _background_jobs = list()
+
+    # orthonormal DCT-II matrix: dct(x) = _DCT @ x
+    _DCT = np.sqrt(2 / DCT_SIZE) * np.cos(
+        np.pi / DCT_SIZE
+        * np.arange(DCT_SIZE)[:, None]
+        * (np.arange(DCT_SIZE)[None, :] + 0.5)
+    )
+    _DCT[0] /= np.sqrt(2)
+
+
+    @classmethod
+    def get_hashes(cls, image_path):
+        """ Summary
+            -------
+            Gets the perceptual hashes of an image
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+
+            Returns
+            -------
+            tuple(int, int, int)
+                (aHash, dHash, pHash), 64 bits each
+
+            Raises
+            ------
+            OSError
+                If the image couldn't be read.
+        """
+        stat = os.stat(image_path)
+        hashes = cls._cache.get(image_path, stat)
+
+        if hashes is None:
+            hashes = cls._compute_hashes(image_path)
+            cls._cache.set(image_path, stat, hashes)
+
+        return hashes
+
+
+    @classmethod
+    def get_cached(cls, image_path):
+        """ Summary
+            -------
+            Returns the hashes of an image if they were already computed
+            for the current version of the file, None otherwise.
+        """
+        try:
+            return cls._cache.get(image_path, os.stat(image_path))
+        except OSError:
+            return None
+
+
+    @classmethod
+    def get_recorded(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Returns the cached hashes of the images of a collection
+            which match the version of the files in the file records
+            (see RecordCache.get_recorded()).
+
+            Returns
+            -------
+            dict
+                filename -> (aHash, dHash, pHash), for the images whose
+                hashes are cached
+        """
+        return cls._cache.get_recorded(work_dir, file_records)
+
+
+    @classmethod
+    def get_version(cls):
+        """ Summary
+            -------
+            Returns a number which changes whenever hashes are added to
+            the cache, so users of the cache (e.g. DuplicateIndex) know
+            when they are out of date.
+        """
+        return cls._cache.version
+
+
+    @classmethod
+    def load(cls, image_path, callback):
+        """ Summary
+            -------
+            Computes the hashes of an image in a worker thread.
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+            callback : callable
+                Called on the main thread with callback(hashes). hashes
+                is None if the image couldn't be hashed.
+        """
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="PerceptualHash"
+            )
+
+        future = cls._executor.submit(cls.get_hashes, image_path)
+        future.add_done_callback(
+            lambda f: Clock.schedule_once(
+                lambda _dt: callback(cls._get_result(image_path, f))
+            )
+        )
+
+
+    @classmethod
+    def precompute(cls, work_dir, filenames):
+        """ Summary
+            -------
+            Computes in the background the hashes of images which
+            aren't cached yet. The jobs of a previous call that didn't
+            start yet are cancelled.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            filenames : iterable(str)
+                Filenames of the images, relative to work_dir
+        """
+        for future in cls._background_jobs:
+            future.cancel()
+
+        if cls._background_executor is None:
+            cls._background_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="PerceptualHashBackground"
+            )
+
+        image_paths = [
+            os.path.join(work_dir, filename) for filename in filenames
+        ]
+        cls._background_jobs = [
+            cls._background_executor.submit(
+                cls._precompute_batch,
+                image_paths[start:start + cls.BATCH_SIZE]
+            )
+            for start in range(0, len(image_paths), cls.BATCH_SIZE)
+        ]
+
+
+    @classmethod
+    def restore(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Fills the cache with the hashes saved in the file records of
+            a collection (see RecordCache.restore()).
+        """
+        cls._cache.restore(work_dir, file_records)
+
+
+    @classmethod
+    def store(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Saves the cached hashes in the file records of a collection
+            (see RecordCache.store()).
+
+            Returns
+            -------
+            set(str)
+                The filenames of the records which changed
+        """
+        return cls._cache.store(work_dir, file_records)
+
+
+    @classmethod
+    def _precompute_batch(cls, image_paths):
+        """ Summary
+            -------
+            Runs in the background worker. Images which can't be read
+            are only logged.
+        """
+        for image_path in image_paths:
+            try:
+                cls.get_hashes(image_path)
+            except Exception:
+                Logger.warning(
+                    "PerceptualHash: Couldn't hash %s" % image_path
+                )
+
+
+    @staticmethod
+    def _get_result(image_path, future):
+        try:
+            return future.result()
+        except Exception:
+            Logger.exception("PerceptualHash: Couldn't hash %s" % image_path)
+            return None
+
+
+    @classmethod
+    def _compute_hashes(cls, image_path):
+        """ Summary
+            -------
+            Computes the (aHash, dHash, pHash) of an image
+        """
+        # the aspect ratio is not kept: a cropped copy isn't a duplicate
+        img = ImageReader.read_resized(
+            image_path, (cls.DCT_SIZE, cls.DCT_SIZE), (255, 255, 255)
+        ).convert("L")
+
+        small = np.asarray(
+            img.resize((cls.HASH_SIZE, cls.HASH_SIZE), Image.BOX),
+            dtype=np.float64
+        )
+        a_hash = cls._to_int(small > small.mean())
+
+        wide = np.asarray(
+            img.resize((cls.HASH_SIZE + 1, cls.HASH_SIZE), Image.BOX),
+            dtype=np.float64
+        )
+        d_hash = cls._to_int(wide[:, 1:] > wide[:, :-1])
+
+        pixels = np.asarray(img, dtype=np.float64)
+        frequencies = (cls._DCT @ pixels @ cls._DCT.T)[
+            :cls.HASH_SIZE, :cls.HASH_SIZE
+        ]
+        # the first coefficient is the mean brightness, it would skew
+        # the median
+        median = np.median(frequencies.ravel()[1:])
+        p_hash = cls._to_int(frequencies > median)
+
+        return a_hash, d_hash, p_hash
+
+
+    @staticmethod
+    def _to_int(bits):
+        """ Packs an array of booleans into an integer """
+        value = 0
+        for bit in bits.ravel():
+            value = (value << 1) | int(bit)
+        return value
@@ -8,13 +8,17 @@
 
 import os
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 
-import PIL
 from pptx import Presentation
 from pptx.util import Cm
 
 from api.CollectionImage import CollectionImage
 from api.Geometry import Geometry
+from api.ImageInfo import ImageInfo
+from api.ImageReader import ImageReader
 
 #pylint: disable=too-few-public-methods
 class Powerpoint():
@@ -32,13 +36,34 @@ class Powerpoint():
             Creates a Powerpoint slide from a CollectionImage
     """
 
+    MAX_WORKERS = min(4, os.cpu_count() or 1)
+    # number of images prepared ahead of the slide being built
+    PREFETCH = 2 * MAX_WORKERS
+
+    # default resolution and quality of the downsampled images
+    EXPORT_DPI = 150
+    JPEG_QUALITY = 85
+    # background used to flatten transparent images
+    BACKGROUND_COLOR = (255, 255, 255)
+
     @classmethod
-    def create_presentation(cls, images_list, work_dir, output_path):
+    def create_presentation(
+        cls, images_list, work_dir, output_path,
+        progress_callback=None, cancel_event=None,
+        target_dpi=None, jpeg_quality=JPEG_QUALITY
+    ):
         """ Summary
             -------
             Creates a Powerpoint presentation with all the
             CollectionImages in a list
 
+            The images are read and their layout computed by a pool of
+            worker threads, a few slides ahead of the slide being
+            built. The slides themselves are built in the calling
+            thread, python-pptx not being thread safe. As this can take
+            a while for big selections, call it from a background
+            thread in the app.
+
             Arguments
             ---------
             images_list : list(CollectionImage)
@@ -48,87 +73,244 @@ class Powerpoint():
                 we can find the images on the user's disk.
             output_path : str
                 Absolute path to where to put the generated Powerpoint
+            progress_callback : callable, optional
+                Called with progress_callback(done, total) after each
+                slide, from the calling thread.
+            cancel_event : threading.Event, optional
+                When set, the export stops before the next slide and
+                nothing is written.
+            target_dpi : int, optional
+                If given, images with a higher resolution than
+                target_dpi once placed on their slide are downsampled
+                and re-encoded to JPEG before being embedded, which
+                makes the presentation a lot lighter. Otherwise the
+                original files are embedded.
+            jpeg_quality : int, optional
+                JPEG quality of the downsampled images (1-95)
+
+            Returns
+            -------
+            bool
+                True if the presentation was saved, False if the export
+                was cancelled.
         """
         if not all(isinstance(i, CollectionImage) for i in images_list):
             raise TypeError("images_list must contain only CollectionImages")
 
         # create presentation
         prs = Presentation()
+        # all the slides have the same size
+        slide_size = (prs.slide_width, prs.slide_height)
+
+        total = len(images_list)
+        images = iter(images_list)
+        # (image, future of its prepared file and layout), in slide order
+        pending = deque()
+
+        with ThreadPoolExecutor(
+            max_workers=cls.MAX_WORKERS,
+            thread_name_prefix="Powerpoint"
+        ) as executor:
+
+            def prepare_next():
+                image = next(images, None)
+                if image is not None:
+                    pending.append((image, executor.submit(
+                        cls._prepare_image,
+                        os.path.join(work_dir, image.filename),
+                        slide_size,
+                        target_dpi,
+                        jpeg_quality
+                    )))
+
+            # only prepare a few images in advance, so that the memory
+            # used doesn't grow with the size of the selection
+            for _ in range(cls.PREFETCH):
+                prepare_next()
+
+            try:
+                for done in range(1, total + 1):
+                    if cancel_event is not None and cancel_event.is_set():
+                        return False
+
+                    image, future = pending.popleft()
+                    prepare_next()
+
+                    params, image_file = future.result()
+                    cls._add_slide(prs, image, params, image_file)
+
+                    if progress_callback is not None:
+                        progress_callback(done, total)
+            finally:
+                for _image, future in pending:
+                    future.cancel()
 
-        for image in images_list:
-            img_path = os.path.join(work_dir, image.filename)
-
-            # create blank slide
-            blank_slide_layout = prs.slide_layouts[6]
-            slide = prs.slides.add_slide(blank_slide_layout)
-
-            # compute layout parameters
-            params = cls._get_layout_params(img_path)
-
-            # create an image using these parameters
-
-            left    =   params["image"]["left"]
-            top     =   params["image"]["top"]
-            height  =   params["image"]["height"]
-
-            slide.shapes.add_picture(img_path, left, top, height=height)
-
-            # create a legend text box using these parameters
-
-            left    =   params["text"]["left"]
-            top     =   params["text"]["top"]
-            height  =   params["text"]["height"]
-            width   =   params["text"]["width"]
-
-            text_box = slide.shapes.add_textbox(left, top, width, height)
-
-            # here the pptx interface is a bit ugly to use.
-            # but basically our text frame contains all the text
-            # separated in paragraphs
-            text_frame = text_box.text_frame
-            text_frame.word_wrap = True
-            # this removes all paragraphs present except one empty
-            # paragraph
-            text_frame.clear()
-            # so we can write in this one paragraph
-            paragraph = text_frame.paragraphs[0]
-
-            legend = image.to_legend()
-
-            # to apply formatting such as italics defined between [i][/i]
-            # tags, we must decompose the text and reassemble the segments
-            # as pptx' run to be able to apply italics 
-            # format italics
-            # NOTE: supports only ONE set of italics tags
-            italics = re.search(r"\[i\](.*)\[/i\]", legend)
-            if italics:
-                start_run = paragraph.add_run()
-                start_run.text = legend[:italics.start()]
-                
-                italics_run = paragraph.add_run()
-                italics_run.text = italics.group(1)
-                font = italics_run.font
-                font.italic = True
-
-                end_run = paragraph.add_run()
-                end_run.text = legend[italics.end():]
+        prs.save(output_path)
+
+        return True
+
+
+    @staticmethod
+    def _add_slide(prs, image, params, image_file):
+        """ Summary
+            -------
+            Adds a slide with an image and its legend to a presentation
+
+            Arguments
+            ---------
+            prs : pptx.Presentation
+                The presentation to add the slide to
+            image : CollectionImage
+                The image of the slide, for its legend
+            params : dict
+                Layout parameters, see _get_layout_params()
+            image_file : file-like object
+                The content of the image file
+        """
+        # create blank slide
+        blank_slide_layout = prs.slide_layouts[6]
+        slide = prs.slides.add_slide(blank_slide_layout)
+
+        # create an image using the layout parameters
+
+        left    =   params["image"]["left"]
+        top     =   params["image"]["top"]
+        height  =   params["image"]["height"]
+
+        slide.shapes.add_picture(image_file, left, top, height=height)
+
+        # create a legend text box using these parameters
+
+        left    =   params["text"]["left"]
+        top     =   params["text"]["top"]
+        height  =   params["text"]["height"]
+        width   =   params["text"]["width"]
+
+        text_box = slide.shapes.add_textbox(left, top, width, height)
+
+        # here the pptx interface is a bit ugly to use.
+        # but basically our text frame contains all the text
+        # separated in paragraphs
+        text_frame = text_box.text_frame
+        text_frame.word_wrap = True
+        # this removes all paragraphs present except one empty
+        # paragraph
+        text_frame.clear()
+        # so we can write in this one paragraph
+        paragraph = text_frame.paragraphs[0]
+
+        legend = image.to_legend()
+
+        # to apply formatting such as italics defined between [i][/i]
+        # tags, we must decompose the text and reassemble the segments
+        # as pptx' run to be able to apply italics 
+        # format italics
+        # NOTE: supports only ONE set of italics tags
+        italics = re.search(r"\[i\](.*)\[/i\]", legend)
+        if italics:
+            start_run = paragraph.add_run()
+            start_run.text = legend[:italics.start()]
             
-            else:
-                text_frame.paragraphs[0].text = image.to_legend()
+            italics_run = paragraph.add_run()
+            italics_run.text = italics.group(1)
+            font = italics_run.font
+            font.italic = True
+
+            end_run = paragraph.add_run()
+            end_run.text = legend[italics.end():]
+        
+        else:
+            text_frame.paragraphs[0].text = image.to_legend()
+
+        # autofit text to the text box
+        # text_frame.fit_text(
+        #     font_family='Arial',
+        #     max_size=18,
+        #     bold=False,
+        #     italic=False
+        # )
 
-            # autofit text to the text box
-            # text_frame.fit_text(
-            #     font_family='Arial',
-            #     max_size=18,
-            #     bold=False,
-            #     italic=False
-            # )
 
-        prs.save(output_path)
+    @classmethod
+    def _prepare_image(
+        cls, img_path, slide_size, target_dpi=None, jpeg_quality=JPEG_QUALITY
+    ):
+        """ Summary
+            -------
+            Runs in a worker thread. Computes the layout of the slide of
+            an image and reads the image file (downsampled if a
+            target_dpi is given), so that the thread building the
+            slides doesn't wait for the disk.
+
+            Returns
+            -------
+            tuple
+                (layout parameters, file-like object of the image)
+        """
+        params = cls._get_layout_params(img_path, slide_size)
+
+        image_data = None
+        if target_dpi is not None:
+            image_data = cls._resample_image(
+                img_path, params["image"]["height"], target_dpi, jpeg_quality
+            )
+
+        # embed the original
+        if image_data is None:
+            with open(img_path, "rb") as image_file:
+                image_data = BytesIO(image_file.read())
+
+        return params, image_data
+
+
+    @classmethod
+    def _resample_image(cls, img_path, height, target_dpi, jpeg_quality):
+        """ Summary
+            -------
+            Downsamples an image to the resolution it needs to have
+            target_dpi once placed on its slide, and encodes it to JPEG.
+
+            Arguments
+            ---------
+            img_path : str
+                Absolute path to the image
+            height : pptx.util.Length
+                Height of the image on the slide
+            target_dpi : int
+                Resolution of the image on the slide
+            jpeg_quality : int
+                JPEG quality (1-95)
+
+            Returns
+            -------
+            BytesIO or None
+                The JPEG file, None if the image already has a lower
+                resolution than target_dpi.
+        """
+        target_height = max(1, round(height.inches * target_dpi))
+        img_width, img_height = ImageInfo.get_size(img_path)
+
+        if img_height <= target_height:
+            return None
+
+        target_size = (
+            max(1, round(img_width * target_height / img_height)),
+            target_height
+        )
+
+        img = ImageReader.read_resized(
+            img_path, target_size, cls.BACKGROUND_COLOR
+        )
+
+        image_data = BytesIO()
+        img.save(image_data, "JPEG", quality=jpeg_quality)
+        image_data.seek(0)
+
+        return image_data
 
 
     @staticmethod
-    def _get_layout_params(img_path, margin=1, textbox_height=1.5):
+    def _get_layout_params(img_path, slide_size, margin=1, textbox_height=1.5):
         """ Summary
             -------
             Calculates the top, left, and height parameters of our image
@@ -138,6 +320,8 @@ class Powerpoint():
             ---------
             img_path : str
                 Absolute path to our image
+            slide_size : tuple(pptx.util.Length, pptx.util.Length)
+                Width and height of the slides of the presentation
             margin : float
                 Margin size in cm
             textbox_height : float
@@ -158,20 +342,19 @@ class Powerpoint():
             the only thing we need to know to determine the layout is
             its aspect ratio.
         """
-        # dummy presentation to get access to slide width and height
-        prs = Presentation()
+        slide_width, slide_height = slide_size
 
-        image_open = PIL.Image.open(img_path)
-        image_size = image_open.size
+        # only reads the header of the image
+        image_size = ImageInfo.get_size(img_path)
         # canvas is the slide minus the margin and space for the text
         # values in cm
-        canvas_width = prs.slide_width.cm - margin * 2
-        canvas_height = prs.slide_height.cm - margin * 3 - textbox_height
+        canvas_width = slide_width.cm - margin * 2
+        canvas_height = slide_height.cm - margin * 3 - textbox_height
 
         width, height = Geometry.fit_to_container(image_size, (canvas_width, canvas_height))
 
         top = margin + (canvas_height - height) / 2
-        left = (prs.slide_width.cm - width) / 2
+        left = (slide_width.cm - width) / 2
 
         params = {
             "image": {
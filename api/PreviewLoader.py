@@ -0,0 +1,143 @@
+#pylint: disable=invalid-name
+"""
+    PreviewLoader module
+    --------------------
+    Decodes the previews of the collection panel in the background, and
+    prefetches the ones of the images next to the displayed one.
+"""
+import os
+from collections import OrderedDict
+
+from api.ColorPalette import ColorPalette
+from api.ImageInfo import ImageInfo
+from api.ImageReader import ImageReader
+from api.TextureLoader import TextureLoader
+
+
+class PreviewLoader(TextureLoader):
+    """ Summary
+        -------
+        Static class loading the previews of the images displayed in the
+        CollectionPanel (see TextureLoader).
+        A preview is the image downsampled to fit in PREVIEW_SIZE (see
+        ImageReader). The last MAX_TEXTURES textures are kept.
+
+        While an image is displayed, the images next to it in the grid
+        are prefetched: their previews are decoded and their palettes
+        and sizes computed ahead, so that stepping to them doesn't wait
+        for the files to be read.
+
+        Methods
+        -------
+        load(image_path, callback, owner)
+            Requests the texture of the preview of an image.
+        cancel_all(keep, owner)
+            Cancels the requests of a widget, except the ones for the
+            given images.
+        prefetch(image_paths)
+            Prepares the images which may be displayed next.
+
+        Notes
+        -----
+        All the methods must be called from the main thread.
+    """
+
+    # the preview takes about half of the panel, which takes a third of
+    # the window
+    PREVIEW_SIZE = (1024, 1024)
+    # a single worker, so prefetching doesn't compete with the grid's
+    # thumbnails and the palettes
+    MAX_WORKERS = 1
+    # a 1024x1024 preview takes 3 MB of video memory
+    MAX_TEXTURES = 16
+
+    _executor = None
+    _jobs = dict()
+    _textures = OrderedDict()
+
+
+    @classmethod
+    def load(cls, image_path, callback, owner=None):
+        """ Summary
+            -------
+            Requests the texture of the preview of an image. The
+            callback is called on the main thread once it is decoded.
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+            callback : callable
+                Called with callback(texture). texture is None if the
+                preview couldn't be loaded. If the texture was already
+                decoded, the callback is called right away.
+            owner : object, optional
+                The widget making the request, whose requests can be
+                cancelled at once (see cancel_all())
+        """
+        cls._load(image_path, (image_path,), callback, owner)
+
+
+    @classmethod
+    def cancel_all(cls, keep=(), owner=None):
+        """ Summary
+            -------
+            Withdraws the requests of a widget for all the images which
+            are not in keep, e.g. when another image is displayed. The
+            jobs nobody waits for anymore are cancelled.
+
+            Arguments
+            ---------
+            keep : iterable(str)
+                Absolute paths to the images whose requests must go on
+            owner : object, optional
+                The widget whose requests are withdrawn (see load()),
+                all the requests if None
+        """
+        cls._cancel_all(keep, owner)
+
+
+    @classmethod
+    def prefetch(cls, image_paths):
+        """ Summary
+            -------
+            Decodes the previews, palettes and sizes of images which may
+            be displayed next. The prefetching jobs of the other images
+            which didn't start yet are cancelled.
+
+            Arguments
+            ---------
+            image_paths : list(str)
+                Absolute paths to the images, the most likely to be
+                displayed first
+        """
+        for image_path, (future, callbacks) in list(cls._jobs.items()):
+            # nobody waits for an image which is no longer next to the
+            # displayed one
+            if not callbacks and image_path not in image_paths:
+                if future.cancel():
+                    del cls._jobs[image_path]
+
+        for image_path in image_paths:
+            cls._load(image_path, (image_path,))
+            # shared with the Palette of the panel if it is displayed
+            # before the palette is computed
+            ColorPalette.load(image_path)
+
+
+    @classmethod
+    def _decode(cls, image_path):
+        """ Summary
+            -------
+            Runs in the worker thread. Decodes the preview of an image
+            to raw RGB data (see TextureLoader._decode()), and computes
+            the size of the image, which is cached by ImageInfo.
+        """
+        # taken before decoding, so that an image modified meanwhile
+        # isn't mistaken for the decoded one
+        stat = os.stat(image_path)
+
+        ImageInfo.get_size(image_path)
+        img = ImageReader.read_thumbnail(image_path, cls.PREVIEW_SIZE)
+
+        return stat.st_mtime_ns, stat.st_size, img.size, img.tobytes()
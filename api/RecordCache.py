@@ -0,0 +1,252 @@
+#pylint: disable=invalid-name
+"""
+    RecordCache module
+    ------------------
+    Caches values computed from image files (properties, palettes,
+    hashes...) for a version of the files, and saves them in the file
+    records of the collections.
+"""
+import os
+import threading
+
+
+class RecordCache():
+    """ Summary
+        -------
+        Cache of values computed from image files, by absolute path. A
+        value is kept for a version of the file, its modification time
+        and size, so it is computed again when the file changes.
+
+        The cache can be saved in the file records of a collection (see
+        store() and restore()), under record_key, so the values aren't
+        computed again in the next sessions. Only the values computed
+        since the last store() are saved: the records of a collection
+        are checked when it is loaded (see CollectionManager.load()),
+        so the values they hold are up to date.
+
+        Arguments
+        ---------
+        record_key : str
+            File records key of the value
+        encode : callable
+            encode(value) returns what is saved under record_key, or a
+            tuple of what is saved under record_key and extra_keys. By
+            default the value is saved as is.
+        decode : callable
+            decode(field, *extra_fields) returns the value saved in a
+            file record, from its record_key field and its extra_keys
+            fields (None if missing). By default the value saved under
+            record_key.
+        extra_keys : tuple(str)
+            Other file records keys saved with the value
+
+        Methods
+        -------
+        clear()
+            Empties the cache.
+        get(image_path, stat)
+            Returns the value of a version of a file if it is cached.
+        get_recorded(work_dir, file_records)
+            Returns the cached values of the images of a collection.
+        restore(work_dir, file_records)
+            Fills the cache with the values saved in file records.
+        set(image_path, stat, value)
+            Caches the value of a version of a file.
+        store(work_dir, file_records)
+            Saves the cached values in file records.
+
+        Attributes
+        ----------
+        version : int
+            Incremented whenever values are added to the cache, so users
+            of the cache know when they are out of date.
+
+        Notes
+        -----
+        The methods are thread safe.
+    """
+
+    def __init__(self, record_key, encode=None, decode=None, extra_keys=()):
+        self.record_key = record_key
+        self.record_keys = (record_key,) + tuple(extra_keys)
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda field: field)
+        self.version = 0
+
+        # absolute path -> (mtime, size of the file, value)
+        self._cache = dict()
+        # absolute paths of the values which aren't saved yet
+        self._unsaved = set()
+        self._lock = threading.Lock()
+
+
+    def clear(self):
+        """ Summary
+            -------
+            Empties the cache
+        """
+        with self._lock:
+            self._cache.clear()
+            self._unsaved.clear()
+            self.version += 1
+
+
+    def get(self, image_path, stat):
+        """ Summary
+            -------
+            Returns the value of a file if it was cached for the version
+            given by stat (see os.stat()), None otherwise.
+        """
+        with self._lock:
+            cached = self._cache.get(image_path)
+
+        if cached is not None and cached[:2] == (
+            stat.st_mtime_ns, stat.st_size
+        ):
+            return cached[2]
+
+        return None
+
+
+    def set(self, image_path, stat, value):
+        """ Summary
+            -------
+            Caches the value of the version of a file given by stat (see
+            os.stat()).
+        """
+        with self._lock:
+            self._cache[image_path] = (stat.st_mtime_ns, stat.st_size, value)
+            self._unsaved.add(image_path)
+            self.version += 1
+
+
+    def get_recorded(self, work_dir, file_records):
+        """ Summary
+            -------
+            Returns the cached values of the images of a collection
+            which match the version of the files in the file records.
+            Unlike get(), the files are not accessed.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            file_records : dict
+                filename -> {"size": int, "mtime": int, ...} (see
+                Collection.file_records)
+
+            Returns
+            -------
+            dict
+                filename -> value, for the images whose value is cached
+        """
+        values = dict()
+
+        with self._lock:
+            for filename, record in file_records.items():
+                cached = self._cache.get(os.path.join(work_dir, filename))
+
+                if cached is not None and cached[:2] == (
+                    record["mtime"], record["size"]
+                ):
+                    values[filename] = cached[2]
+
+        return values
+
+
+    def restore(self, work_dir, file_records):
+        """ Summary
+            -------
+            Fills the cache with the values saved in the file records of
+            a collection.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            file_records : dict
+                filename -> {"size": int, "mtime": int, ...} (see
+                Collection.file_records)
+        """
+        with self._lock:
+            for filename, record in file_records.items():
+                if self.record_key not in record:
+                    continue
+
+                value = self.decode(
+                    *(record.get(key) for key in self.record_keys)
+                )
+                # JSON turned the tuples into lists. The record gets the
+                # same fields as the cache, so store() sees they didn't
+                # change.
+                record.update(self._to_fields(value))
+                self._cache[os.path.join(work_dir, filename)] = (
+                    record["mtime"], record["size"], value
+                )
+
+            self.version += 1
+
+
+    def store(self, work_dir, file_records):
+        """ Summary
+            -------
+            Saves the values cached since the last store() in the file
+            records of a collection, when they match the version of the
+            file in the records. The values of the files which aren't in
+            the records yet (or not in this version) are saved by a
+            later store().
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            file_records : dict
+                filename -> {"size": int, "mtime": int, ...} (see
+                Collection.file_records)
+
+            Returns
+            -------
+            set(str)
+                The filenames of the records which changed
+        """
+        changed = set()
+        prefix = os.path.join(work_dir, "")
+
+        with self._lock:
+            for image_path in list(self._unsaved):
+                if not image_path.startswith(prefix):
+                    continue
+
+                filename = image_path[len(prefix):]
+                record = file_records.get(filename)
+                cached = self._cache[image_path]
+
+                if record is None or cached[:2] != (
+                    record["mtime"], record["size"]
+                ):
+                    continue
+
+                self._unsaved.discard(image_path)
+                fields = self._to_fields(cached[2])
+
+                if any(
+                    record.get(key) != fields.get(key)
+                    for key in self.record_keys
+                ):
+                    changed.add(filename)
+                    record.update(fields)
+
+        return changed
+
+
+    def _to_fields(self, value):
+        """ Summary
+            -------
+            Returns the fields of a file record saving a value, as a
+            dict
+        """
+        fields = self.encode(value)
+        if len(self.record_keys) == 1:
+            fields = (fields,)
+
+        return dict(zip(self.record_keys, fields))
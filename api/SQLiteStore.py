@@ -0,0 +1,349 @@
+#pylint: disable=invalid-name
+"""
+    SQLiteStore module
+    ------------------
+    Stores collections in an SQLite database, next to their JSON meta
+    file.
+"""
+import json
+import os
+import sqlite3
+from contextlib import closing
+from dataclasses import fields
+
+from api.Collection import Collection
+from api.CollectionImage import CollectionImage
+from api.SearchIndex import SearchIndex
+
+
+class SQLiteStore():
+    """ Summary
+        -------
+        Static class saving and loading collections to and from an
+        SQLite database (see CollectionManager.STORE).
+
+        Unlike the JSON meta file, which is written in full at every
+        save, the rows of the images and of their file records can be
+        updated one by one. The normalized (accent folded, lowercased)
+        metadata and the numeric datation of the images are stored
+        along with them, and indexed.
+
+        Methods
+        -------
+        get_path(meta_path)
+            Path to the database of a meta file
+        is_current(db_path, meta_path)
+            Whether a database is more recent than its meta file
+        load(db_path, work_dir)
+            Loads a collection from a database
+        save(collection, db_path)
+            Writes a whole collection in a database
+        update_images(collection, db_path, images, removed, records)
+            Writes some images of a collection and their file records
+        get_changes(collection, images, removed, records)
+            Rows written by update_images()
+        write_changes(db_path, changes)
+            Writes the rows returned by get_changes()
+    """
+
+    EXTENSION = ".db"
+    # increment when changing the tables
+    SCHEMA_VERSION = 1
+
+    TEXT_FIELDS = tuple(
+        f.name for f in fields(CollectionImage) if f.name != "filename"
+    )
+    # normalized fields indexed for sorting
+    SORT_FIELDS = ("title", "artist")
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS images (
+            filename TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            numeric_datation INTEGER NOT NULL,
+            {columns}
+        );
+        CREATE TABLE IF NOT EXISTS file_records (
+            filename TEXT PRIMARY KEY,
+            record TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS images_position ON images (position);
+        CREATE INDEX IF NOT EXISTS images_datation
+            ON images (numeric_datation, position);
+        {indexes}
+    """.format(
+        columns=",\n".join(
+            "{0} TEXT, {0}_key TEXT".format(field) for field in TEXT_FIELDS
+        ),
+        indexes="\n".join(
+            "CREATE INDEX IF NOT EXISTS images_{0} "
+            "ON images ({0}_key, position);".format(field)
+            for field in SORT_FIELDS
+        )
+    )
+
+    _UPSERT_IMAGE = """
+        INSERT INTO images (filename, position, numeric_datation, {columns})
+        VALUES (?, {position}, ?, {values})
+        ON CONFLICT (filename) DO UPDATE SET
+            numeric_datation = excluded.numeric_datation,
+            {updates}
+    """.format(
+        columns=", ".join(
+            "{0}, {0}_key".format(field) for field in TEXT_FIELDS
+        ),
+        # new images go at the end of the collection
+        position="(SELECT COALESCE(MAX(position) + 1, 0) FROM images)",
+        values=", ".join("?, ?" for _field in TEXT_FIELDS),
+        updates=", ".join(
+            "{0} = excluded.{0}, {0}_key = excluded.{0}_key".format(field)
+            for field in TEXT_FIELDS
+        )
+    )
+
+
+    @classmethod
+    def get_path(cls, meta_path):
+        """ Summary
+            -------
+            Path to the database stored next to a meta file (e.g.
+            collection.arty -> collection.arty.db)
+        """
+        return meta_path + cls.EXTENSION
+
+
+    @classmethod
+    def is_current(cls, db_path, meta_path):
+        """ Summary
+            -------
+            Whether a database exists, and is at least as recent as the
+            JSON meta file. A more recent meta file was exported or
+            replaced since the database was written, it must be imported
+            again.
+        """
+        try:
+            db_mtime = os.stat(db_path).st_mtime_ns
+        except OSError:
+            return False
+
+        try:
+            return db_mtime >= os.stat(meta_path).st_mtime_ns
+        except OSError:
+            return True
+
+
+    @classmethod
+    def load(cls, db_path, work_dir):
+        """ Summary
+            -------
+            Loads a collection from a database
+
+            Arguments
+            ---------
+            db_path : str
+                Path to the database
+            work_dir : str
+                Path to the collection's directory
+
+            Returns
+            -------
+            Collection
+
+            Raises
+            ------
+            ValueError
+                If the database was written with another schema
+        """
+        with closing(cls._connect(db_path)) as connection:
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+
+            if json.loads(meta.get("schema", "0")) != cls.SCHEMA_VERSION:
+                raise ValueError("Unknown collection database schema")
+
+            names = ("filename",) + cls.TEXT_FIELDS
+            images = [
+                CollectionImage(**dict(zip(names, row)))
+                for row in connection.execute(
+                    "SELECT %s FROM images ORDER BY position"
+                    % ", ".join(names)
+                )
+            ]
+
+            file_records = {
+                filename: json.loads(record)
+                for filename, record in connection.execute(
+                    "SELECT filename, record FROM file_records"
+                )
+            }
+
+        return Collection(
+            work_dir,
+            json.loads(meta["version"]),
+            images,
+            file_records
+        )
+
+
+    @classmethod
+    def save(cls, collection, db_path):
+        """ Summary
+            -------
+            Writes a whole collection in a database, in one transaction
+
+            Arguments
+            ---------
+            collection : Collection
+                The collection to save
+            db_path : str
+                Path to the database, created if needed
+        """
+        with closing(cls._connect(db_path)) as connection:
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                    cls._meta_rows(collection)
+                )
+
+                connection.execute("DELETE FROM images")
+                connection.executemany(
+                    "INSERT INTO images VALUES (?, ?, ?, %s)"
+                    % ", ".join("?, ?" for _field in cls.TEXT_FIELDS),
+                    (
+                        (image.filename, position) + cls._values(image)
+                        for position, image in enumerate(
+                            collection.get_collection()
+                        )
+                    )
+                )
+
+                connection.execute("DELETE FROM file_records")
+                connection.executemany(
+                    "INSERT INTO file_records VALUES (?, ?)",
+                    (
+                        (filename, json.dumps(record))
+                        for filename, record in collection.file_records.items()
+                    )
+                )
+
+
+    @classmethod
+    def update_images(
+        cls, collection, db_path, images, removed=(), records=None
+    ):
+        """ Summary
+            -------
+            Writes some images of a collection and their file records,
+            and removes others, in one transaction. The other rows are
+            left untouched. New images are added at the end.
+
+            Arguments
+            ---------
+            collection : Collection
+                The collection the images belong to
+            db_path : str
+                Path to the database, written by save() beforehand
+            images : list(CollectionImage)
+                The images to write
+            removed : iterable(str)
+                Filenames of the images to remove
+            records : iterable(str), optional
+                Filenames of the file records to write, the ones of the
+                images if None
+        """
+        cls.write_changes(
+            db_path, cls.get_changes(collection, images, removed, records)
+        )
+
+
+    @classmethod
+    def get_changes(cls, collection, images, removed=(), records=None):
+        """ Summary
+            -------
+            Same as update_images(), in two steps: get_changes() reads
+            the collection and returns the rows to write, which
+            write_changes() writes. The collection can be modified
+            while write_changes() runs in another thread.
+
+            Returns
+            -------
+            dict
+                The rows of each table to write or remove
+        """
+        if records is None:
+            records = [image.filename for image in images]
+
+        return {
+            "meta": cls._meta_rows(collection),
+            "images": [
+                (image.filename,) + cls._values(image) for image in images
+            ],
+            "records": [
+                (filename, json.dumps(collection.file_records[filename]))
+                for filename in records
+                if filename in collection.file_records
+            ],
+            "removed": [(filename,) for filename in removed],
+        }
+
+
+    @classmethod
+    def write_changes(cls, db_path, changes):
+        """ Summary
+            -------
+            Writes the rows returned by get_changes(), in one
+            transaction
+        """
+        with closing(cls._connect(db_path)) as connection:
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                    changes["meta"]
+                )
+                connection.executemany(cls._UPSERT_IMAGE, changes["images"])
+                connection.executemany(
+                    "INSERT OR REPLACE INTO file_records VALUES (?, ?)",
+                    changes["records"]
+                )
+
+                for table in ("images", "file_records"):
+                    connection.executemany(
+                        "DELETE FROM %s WHERE filename = ?" % table,
+                        changes["removed"]
+                    )
+
+
+    @classmethod
+    def _connect(cls, db_path):
+        connection = sqlite3.connect(db_path)
+        connection.executescript(cls._SCHEMA)
+        return connection
+
+
+    @classmethod
+    def _meta_rows(cls, collection):
+        return [
+            (key, json.dumps(value)) for key, value in (
+                ("schema", cls.SCHEMA_VERSION),
+                ("version", collection.version),
+            )
+        ]
+
+
+    @classmethod
+    def _values(cls, collection_image):
+        """ Summary
+            -------
+            Numeric datation, value and normalized value of each text
+            field of an image, in the order of the columns
+        """
+        values = [collection_image.get_numeric_datation()]
+
+        for field in cls.TEXT_FIELDS:
+            value = getattr(collection_image, field) or ""
+            values += (value, SearchIndex.normalize(value))
+
+        return tuple(values)
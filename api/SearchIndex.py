@@ -0,0 +1,376 @@
+#pylint: disable=invalid-name
+"""
+    SearchIndex module
+    ------------------
+    Index of the metadata of a collection, to filter it without
+    re-parsing the metadata of every image at each query.
+"""
+from bisect import bisect_left, bisect_right
+from dataclasses import fields
+from functools import lru_cache
+
+from unidecode import unidecode
+
+from api.CollectionImage import CollectionImage
+
+
+class SearchIndex():
+    """ Summary
+        -------
+        Index of the metadata of the images of a collection.
+
+        Images are kept sorted by numeric datation, so that the images
+        in a range of dates are found with a binary search.
+
+        The text fields are normalized (accent folded and lowercased)
+        once per edit. For each field, the index maps every distinct
+        normalized value to the images that have it, and for the
+        TRIGRAM_FIELDS, every trigram (3 consecutive characters) to the
+        values containing it. Looking for a substring then only means
+        checking the values that contain all of its trigrams.
+
+        The index must be notified of every change in the collection,
+        which Collection does when it is modified through its methods
+        (see Collection.get_search_index()).
+
+        Methods
+        -------
+        add(collection_image)
+            Adds an image to the index
+        remove(collection_image)
+            Removes an image from the index
+        update(collection_image)
+            Updates the index after the metadata of an image changed
+        datation_range(datation_min, datation_max)
+            Filenames of the images dated within a range
+        match(attribute, query)
+            Filenames of the images whose attribute contains a string
+        search(query, attributes)
+            Filenames of the images where any attribute contains a
+            string
+        contains(filename, query, attributes)
+            Whether any attribute of an image contains a string
+        normalize(text)
+            Accent folds and lowercases a string
+    """
+
+    # fields indexed by trigrams. Other fields are searched by going
+    # through their distinct values.
+    TRIGRAM_FIELDS = (
+        "title", "artist", "technique", "material", "style",
+        "conservation_site", "production_site",
+    )
+    TEXT_FIELDS = tuple(f.name for f in fields(CollectionImage))
+
+    def __init__(self, images=()):
+        # filename -> numeric datation, as indexed
+        self._datations = dict()
+        # numeric datations in ascending order, and the filename of the
+        # image at the same position
+        self._sorted_datations = list()
+        self._sorted_filenames = list()
+
+        # filename -> {field: normalized value}, as indexed
+        self._normalized = dict()
+        # field -> {normalized value: set of filenames}
+        self._values = {field: dict() for field in self.TEXT_FIELDS}
+        # field -> {trigram: set of normalized values}
+        self._trigrams = {field: dict() for field in self.TRIGRAM_FIELDS}
+
+        # build the datation index in one sort rather than one insertion
+        # per image
+        images = list(images)
+        for image in images:
+            self._datations[image.filename] = image.get_numeric_datation()
+            self._add_text(image)
+
+        for value, filename in sorted(
+            (value, filename) for filename, value in self._datations.items()
+        ):
+            self._sorted_datations.append(value)
+            self._sorted_filenames.append(filename)
+
+
+    def add(self, collection_image):
+        """ Summary
+            -------
+            Adds an image to the index
+
+            Arguments
+            ---------
+            collection_image : CollectionImage
+                The image to index
+        """
+        value = collection_image.get_numeric_datation()
+        self._datations[collection_image.filename] = value
+
+        idx = bisect_right(self._sorted_datations, value)
+        self._sorted_datations.insert(idx, value)
+        self._sorted_filenames.insert(idx, collection_image.filename)
+
+        self._add_text(collection_image)
+
+
+    def remove(self, collection_image):
+        """ Summary
+            -------
+            Removes an image from the index. Does nothing if the image
+            isn't indexed.
+
+            Arguments
+            ---------
+            collection_image : CollectionImage
+                The image to remove
+        """
+        value = self._datations.pop(collection_image.filename, None)
+        if value is None:
+            return
+
+        # look for the image among the images with the same datation
+        start = bisect_left(self._sorted_datations, value)
+        end = bisect_right(self._sorted_datations, value, lo=start)
+        idx = self._sorted_filenames.index(
+            collection_image.filename, start, end
+        )
+
+        del self._sorted_datations[idx]
+        del self._sorted_filenames[idx]
+
+        self._remove_text(collection_image.filename)
+
+
+    def update(self, collection_image):
+        """ Summary
+            -------
+            Updates the index after the metadata of an image changed
+
+            Arguments
+            ---------
+            collection_image : CollectionImage
+                The modified image
+        """
+        if collection_image.filename not in self._datations:
+            self.add(collection_image)
+            return
+
+        value = self._datations[collection_image.filename]
+
+        if value != collection_image.get_numeric_datation():
+            self.remove(collection_image)
+            self.add(collection_image)
+            return
+
+        # only re-index the text fields that changed
+        normalized = self._normalized[collection_image.filename]
+        for field in self.TEXT_FIELDS:
+            new_value = self.normalize(getattr(collection_image, field) or "")
+
+            if new_value != normalized[field]:
+                self._unindex_value(
+                    field, normalized[field], collection_image.filename
+                )
+                self._index_value(field, new_value, collection_image.filename)
+                normalized[field] = new_value
+
+
+    def datation_range(self, datation_min, datation_max):
+        """ Summary
+            -------
+            Gives the images whose numeric datation is within a range
+
+            Arguments
+            ---------
+            datation_min : int
+                Lower bound of the range (included)
+            datation_max : int
+                Upper bound of the range (included)
+
+            Returns
+            -------
+            set(str)
+                Filenames of the images dated within the range
+        """
+        start = bisect_left(self._sorted_datations, datation_min)
+        end = bisect_right(self._sorted_datations, datation_max)
+
+        return set(self._sorted_filenames[start:end])
+
+
+    def match(self, attribute, query):
+        """ Summary
+            -------
+            Gives the images whose attribute contains a string (accent
+            and case insensitive)
+
+            Arguments
+            ---------
+            attribute : str
+                Any attribute of CollectionImage
+            query : str
+                The string to look for
+
+            Returns
+            -------
+            set(str)
+                Filenames of the matching images
+        """
+        query = self.normalize(query)
+        values = self._values[attribute]
+
+        if len(query) >= 3 and attribute in self._trigrams:
+            trigrams = self._trigrams[attribute]
+            postings = list()
+
+            for trigram in self._get_trigrams(query):
+                if trigram not in trigrams:
+                    # no value contains this trigram
+                    return set()
+                postings.append(trigrams[trigram])
+
+            # start from the rarest trigram
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = values
+
+        filenames = set()
+        for value in candidates:
+            # the trigrams can all be in a value without the query
+            # being a substring of it, so we check
+            if query in value:
+                filenames.update(values[value])
+
+        return filenames
+
+
+    def search(self, query, attributes=TEXT_FIELDS):
+        """ Summary
+            -------
+            Gives the images where at least one of the attributes
+            contains a string (accent and case insensitive)
+
+            Arguments
+            ---------
+            query : str
+                The string to look for
+            attributes : iterable(str)
+                Attributes of CollectionImage to look into
+
+            Returns
+            -------
+            set(str)
+                Filenames of the matching images
+        """
+        filenames = set()
+        for attribute in attributes:
+            filenames.update(self.match(attribute, query))
+
+        return filenames
+
+
+    def contains(self, filename, query, attributes=TEXT_FIELDS):
+        """ Summary
+            -------
+            Checks a single image, without going through the index.
+            Cheaper than search() when only a few images are left to
+            check, e.g. to refine the results of a previous query.
+
+            Arguments
+            ---------
+            filename : str
+                Filename of an indexed image
+            query : str
+                The string to look for
+            attributes : iterable(str)
+                Attributes of CollectionImage to look into
+
+            Returns
+            -------
+            bool
+                True if at least one of the attributes contains query
+        """
+        query = self.normalize(query)
+        normalized = self._normalized[filename]
+
+        return any(query in normalized[attribute] for attribute in attributes)
+
+
+    @staticmethod
+    @lru_cache(maxsize=2**16)
+    def normalize(text):
+        """ Summary
+            -------
+            Accent folds and lowercases a string (e.g. "Élève" ->
+            "eleve")
+        """
+        # a lot of values (artists, techniques...) are shared between
+        # images, hence the cache
+        if text.isascii():
+            return text.lower()
+        return unidecode(text).lower()
+
+
+    def _add_text(self, collection_image):
+        normalized = dict()
+
+        for field in self.TEXT_FIELDS:
+            value = self.normalize(getattr(collection_image, field) or "")
+            normalized[field] = value
+            self._index_value(field, value, collection_image.filename)
+
+        self._normalized[collection_image.filename] = normalized
+
+
+    def _remove_text(self, filename):
+        normalized = self._normalized.pop(filename)
+
+        for field, value in normalized.items():
+            self._unindex_value(field, value, filename)
+
+
+    def _index_value(self, field, value, filename):
+        # empty fields never match
+        if not value:
+            return
+
+        values = self._values[field]
+        filenames = values.get(value)
+
+        if filenames is None:
+            filenames = values[value] = set()
+
+            trigrams = self._trigrams.get(field)
+            if trigrams is not None:
+                for i in range(len(value) - 2):
+                    trigram = value[i:i + 3]
+                    values_with_trigram = trigrams.get(trigram)
+                    if values_with_trigram is None:
+                        trigrams[trigram] = {value}
+                    else:
+                        values_with_trigram.add(value)
+
+        filenames.add(filename)
+
+
+    def _unindex_value(self, field, value, filename):
+        if not value:
+            return
+
+        values = self._values[field]
+        values[value].discard(filename)
+
+        # no image has this value anymore
+        if not values[value]:
+            del values[value]
+
+            if field in self._trigrams:
+                trigrams = self._trigrams[field]
+                for trigram in self._get_trigrams(value):
+                    trigrams[trigram].discard(value)
+                    if not trigrams[trigram]:
+                        del trigrams[trigram]
+
+
+    @staticmethod
+    def _get_trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
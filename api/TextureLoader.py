@@ -0,0 +1,249 @@
+#pylint: disable=invalid-name
+"""
+    TextureLoader module
+    --------------------
+    Base of the loaders decoding images in worker threads, and handing
+    the resulting textures back to the main thread.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import Clock
+from kivy.graphics.texture import Texture
+from kivy.logger import Logger
+
+
+class TextureLoader():
+    """ Summary
+        -------
+        Base of the static classes loading the textures of images in
+        the background (see ThumbnailLoader and PreviewLoader).
+        The images are decoded by worker threads (Pillow releases the
+        GIL while decoding) with the _decode() of the subclass, then
+        the texture is created on the main thread, as required by
+        OpenGL, and given to the callbacks waiting for it.
+        The last MAX_TEXTURES textures are kept. They are dropped by
+        prune_textures() once the image they were decoded from was
+        modified, the files are not accessed when they are looked up.
+
+        Methods
+        -------
+        get_texture(image_path)
+            Returns the texture of an image if it is already decoded.
+        prune_textures(work_dir, file_records)
+            Forgets the textures which are out of date.
+
+        Notes
+        -----
+        Each subclass has its own _jobs and _textures.
+        All the methods must be called from the main thread.
+    """
+
+    MAX_WORKERS = 1
+    MAX_TEXTURES = 16
+
+    _executor = None
+    # absolute path of the image -> (future, list of (callback, owner))
+    _jobs = None
+    # absolute path of the image -> (mtime, size of the file, texture),
+    # least recently used first
+    _textures = None
+
+
+    @classmethod
+    def get_texture(cls, image_path):
+        """ Summary
+            -------
+            Returns the decoded texture of an image, None if it isn't
+            decoded.
+        """
+        cached = cls._textures.get(image_path)
+        if cached is None:
+            return None
+
+        cls._textures.move_to_end(image_path)
+        return cached[2]
+
+
+    @classmethod
+    def prune_textures(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Forgets the textures of the images which aren't in a
+            collection, or were modified since they were decoded, e.g.
+            when a collection is opened. The files are not accessed.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            file_records : dict
+                filename -> {"size": int, "mtime": int, ...} (see
+                Collection.file_records)
+        """
+        prefix = os.path.join(work_dir, "")
+
+        for image_path, cached in list(cls._textures.items()):
+            record = None
+            if image_path.startswith(prefix):
+                record = file_records.get(image_path[len(prefix):])
+
+            if record is None or cached[:2] != (
+                record["mtime"], record["size"]
+            ):
+                del cls._textures[image_path]
+
+
+    @classmethod
+    def _load(cls, image_path, decode_args, callback=None, owner=None):
+        """ Summary
+            -------
+            Requests the texture of an image. The callback is called
+            right away if it is already decoded. Otherwise the image is
+            decoded with _decode(*decode_args), unless it already is,
+            and the callback is called once it is done.
+
+            Arguments
+            ---------
+            image_path : str
+                Absolute path to the image
+            decode_args : tuple
+                Arguments of _decode()
+            callback : callable, optional
+                Called with callback(texture). texture is None if the
+                image couldn't be decoded.
+            owner : object, optional
+                The widget making the request, whose requests can be
+                withdrawn at once (see _cancel_all())
+        """
+        texture = cls.get_texture(image_path)
+        if texture is not None:
+            if callback is not None:
+                callback(texture)
+            return
+
+        if image_path not in cls._jobs:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.MAX_WORKERS,
+                    thread_name_prefix=cls.__name__
+                )
+
+            future = cls._executor.submit(cls._decode, *decode_args)
+            cls._jobs[image_path] = (future, list())
+
+            future.add_done_callback(
+                # done callbacks run in the worker thread: schedule the
+                # end of the job on the main thread
+                lambda f: Clock.schedule_once(
+                    lambda _dt: cls._on_decoded(image_path, f)
+                )
+            )
+
+        if callback is not None:
+            cls._jobs[image_path][1].append((callback, owner))
+
+
+    @classmethod
+    def _cancel(cls, image_path, callback):
+        """ Summary
+            -------
+            Withdraws a request made with _load(). If no other callback
+            waits for this image, the job is cancelled if it didn't
+            start yet.
+        """
+        if image_path not in cls._jobs:
+            return
+
+        future, callbacks = cls._jobs[image_path]
+        callbacks[:] = [
+            (other, owner) for other, owner in callbacks if other != callback
+        ]
+
+        if not callbacks and future.cancel():
+            del cls._jobs[image_path]
+
+
+    @classmethod
+    def _cancel_all(cls, keep=(), owner=None):
+        """ Summary
+            -------
+            Withdraws the requests of a widget for all the images which
+            are not in keep. The jobs nobody waits for anymore are
+            cancelled if they didn't start yet. The others go on, their
+            textures are kept.
+
+            Arguments
+            ---------
+            keep : iterable(str)
+                Absolute paths to the images whose requests must go on
+            owner : object, optional
+                The widget whose requests are withdrawn (see _load()),
+                all the requests if None
+        """
+        keep = set(keep)
+
+        for image_path, (future, callbacks) in list(cls._jobs.items()):
+            if image_path in keep:
+                continue
+
+            callbacks[:] = [
+                (callback, other) for callback, other in callbacks
+                if owner is not None and other is not owner
+            ]
+
+            if not callbacks and future.cancel():
+                del cls._jobs[image_path]
+
+
+    @staticmethod
+    def _decode(*args):
+        """ Summary
+            -------
+            Runs in a worker thread. Decodes an image to raw RGB data.
+
+            Returns
+            -------
+            tuple
+                (mtime, size of the image file, size, data of the
+                decoded image). The stat of the file is taken before
+                decoding it, so that an image modified meanwhile isn't
+                mistaken for the decoded one.
+        """
+        raise NotImplementedError
+
+
+    @classmethod
+    def _on_decoded(cls, image_path, future):
+        """ Summary
+            -------
+            Runs on the main thread once an image is decoded: creates
+            its texture and gives it to the callbacks.
+        """
+        job = cls._jobs.get(image_path)
+        # the job was cancelled (or replaced by a new one) meanwhile
+        if job is None or job[0] is not future:
+            return
+        del cls._jobs[image_path]
+
+        texture = None
+        try:
+            mtime, file_size, size, data = future.result()
+
+            texture = Texture.create(size=size, colorfmt="rgb")
+            texture.blit_buffer(data, colorfmt="rgb", bufferfmt="ubyte")
+            # Pillow rows go top to bottom, OpenGL's bottom to top
+            texture.flip_vertical()
+
+            cls._textures[image_path] = (mtime, file_size, texture)
+            cls._textures.move_to_end(image_path)
+            while len(cls._textures) > cls.MAX_TEXTURES:
+                cls._textures.popitem(last=False)
+
+        except Exception:
+            Logger.exception(
+                "%s: Unable to load <%s>" % (cls.__name__, image_path)
+            )
+
+        for callback, _owner in job[1]:
+            callback(texture)
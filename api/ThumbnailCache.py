@@ -0,0 +1,210 @@
+#pylint: disable=invalid-name
+"""
+    ThumbnailCache module
+    ---------------------
+    Generates and stores on disk small versions of the images of a
+    collection, so the grid doesn't have to decode the originals every
+    time a collection is opened.
+"""
+import hashlib
+import os
+import threading
+
+from kivy.logger import Logger
+
+from api.ImageReader import ImageReader
+
+
+class ThumbnailCache():
+    """ Summary
+        -------
+        Static class managing the thumbnail cache of a collection.
+        Thumbnails are stored in a hidden directory next to the
+        collection's meta file, and are named after a key computed from
+        the filename, the modification time and the size of the
+        original, so a modified image automatically gets a new
+        thumbnail.
+
+        Methods
+        -------
+        get_thumbnail(work_dir, filename)
+            Returns the path to the thumbnail of an image, generating
+            it if needed.
+        get_cache_directory(work_dir)
+            Returns the path to the cache directory of a collection.
+        prune(work_dir, file_records)
+            Removes the thumbnails which don't belong to any of the
+            given images.
+        make_key(filename, mtime, size)
+            Returns the key of a version of an image in the cache.
+        write_file(file_path, write)
+            Writes a file of the cache atomically.
+    """
+
+    CACHE_DIRECTORY = ".arty-cache"
+    THUMBNAIL_DIRECTORY = "thumbnails"
+    # tiles are 240dp high, this leaves some room for HiDPI screens
+    THUMBNAIL_SIZE = (480, 480)
+    THUMBNAIL_EXTENSION = ".jpg"
+    JPEG_QUALITY = 85
+    # background used to flatten transparent images, as JPEG doesn't
+    # support transparency
+    BACKGROUND_COLOR = (0, 0, 0)
+
+    @classmethod
+    def get_thumbnail(cls, work_dir, filename):
+        """ Summary
+            -------
+            Returns the path to the thumbnail of an image. If the
+            thumbnail doesn't exist yet (or the original was modified),
+            it is generated.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            filename : str
+                Filename of the image, relative to work_dir
+
+            Returns
+            -------
+            str
+                Absolute path to the thumbnail
+
+            Raises
+            ------
+            OSError
+                If the original image couldn't be read.
+        """
+        image_path = os.path.join(work_dir, filename)
+        thumbnail_path = os.path.join(
+            cls._get_thumbnail_directory(work_dir),
+            cls._get_cache_key(image_path) + cls.THUMBNAIL_EXTENSION
+        )
+
+        if not os.path.isfile(thumbnail_path):
+            cls._create_thumbnail(image_path, thumbnail_path)
+
+        return thumbnail_path
+
+
+    @classmethod
+    def get_cache_directory(cls, work_dir):
+        """ Summary
+            -------
+            Returns the path to the cache directory of a collection,
+            creating it if it doesn't exist.
+        """
+        cache_dir = os.path.join(work_dir, cls.CACHE_DIRECTORY)
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
+
+
+    @classmethod
+    def prune(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Removes from the cache the thumbnails of images that were
+            modified or that no longer exist.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            file_records : dict
+                filename -> {"size": int, "mtime": int} of the images
+                currently in the collection (see
+                Collection.file_records)
+        """
+        thumbnail_dir = os.path.join(
+            work_dir, cls.CACHE_DIRECTORY, cls.THUMBNAIL_DIRECTORY
+        )
+        if not os.path.isdir(thumbnail_dir):
+            return
+
+        valid_thumbnails = {
+            cls.make_key(filename, record["mtime"], record["size"])
+            + cls.THUMBNAIL_EXTENSION
+            for filename, record in file_records.items()
+        }
+
+        for entry in os.scandir(thumbnail_dir):
+            if entry.name not in valid_thumbnails:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    Logger.warning(
+                        "ThumbnailCache: Couldn't remove %s" % entry.path
+                    )
+
+
+    @staticmethod
+    def make_key(filename, mtime, size):
+        """ Summary
+            -------
+            Returns the key of a version of an image in the cache,
+            computed from its filename, modification time and size.
+        """
+        key = "%s:%d:%d" % (filename, mtime, size)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+    @staticmethod
+    def write_file(file_path, write):
+        """ Summary
+            -------
+            Writes a file through a temporary file, so that a crash (or
+            another instance of the app) never leaves a half written
+            file in the cache.
+
+            Arguments
+            ---------
+            file_path : str
+                Path to the file
+            write : callable
+                write(path) writes the file at path
+        """
+        temp_path = file_path + ".tmp%d-%d" % (
+            os.getpid(), threading.get_ident()
+        )
+        write(temp_path)
+        os.replace(temp_path, file_path)
+
+
+    @classmethod
+    def _get_thumbnail_directory(cls, work_dir):
+        thumbnail_dir = os.path.join(
+            cls.get_cache_directory(work_dir), cls.THUMBNAIL_DIRECTORY
+        )
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        return thumbnail_dir
+
+
+    @classmethod
+    def _get_cache_key(cls, image_path):
+        """ Summary
+            -------
+            Computes the key of an image in the cache, from its
+            filename, modification time and size.
+        """
+        stat = os.stat(image_path)
+        return cls.make_key(
+            os.path.basename(image_path), stat.st_mtime_ns, stat.st_size
+        )
+
+
+    @classmethod
+    def _create_thumbnail(cls, image_path, thumbnail_path):
+        """ Summary
+            -------
+            Decodes an image at a reduced size and saves it as a JPEG
+            thumbnail.
+        """
+        img = ImageReader.read_thumbnail(
+            image_path, cls.THUMBNAIL_SIZE, cls.BACKGROUND_COLOR
+        )
+
+        cls.write_file(
+            thumbnail_path,
+            lambda path: img.save(path, "JPEG", quality=cls.JPEG_QUALITY)
+        )
@@ -0,0 +1,127 @@
+#pylint: disable=invalid-name
+"""
+    ThumbnailLoader module
+    ----------------------
+    Decodes the thumbnails of the collection grid on a pool of worker
+    threads, and hands the resulting textures back to the main thread.
+"""
+import os
+from collections import OrderedDict
+
+from PIL import Image
+
+from api.TextureLoader import TextureLoader
+from api.ThumbnailCache import ThumbnailCache
+
+
+class ThumbnailLoader(TextureLoader):
+    """ Summary
+        -------
+        Static class loading thumbnails in the background (see
+        TextureLoader). Generating a thumbnail (see ThumbnailCache) and
+        decoding it are done by worker threads.
+        The last MAX_TEXTURES textures are kept, so that the tiles
+        recycled when the grid is scrolled, sorted or filtered don't
+        decode them again.
+
+        Methods
+        -------
+        load(work_dir, filename, callback, owner)
+            Requests the texture of the thumbnail of an image.
+        cancel(work_dir, filename, callback)
+            Withdraws a request made with load().
+        cancel_all(work_dir, keep, owner)
+            Cancels the requests of a widget, except the ones for the
+            given images.
+
+        Notes
+        -----
+        All the methods must be called from the main thread.
+    """
+
+    MAX_WORKERS = min(4, os.cpu_count() or 1)
+    # a 480x480 thumbnail takes about 700 KB of video memory
+    MAX_TEXTURES = 256
+
+    _executor = None
+    _jobs = dict()
+    _textures = OrderedDict()
+
+
+    @classmethod
+    def load(cls, work_dir, filename, callback, owner=None):
+        """ Summary
+            -------
+            Requests the texture of the thumbnail of an image. The
+            callback is called on the main thread once the thumbnail is
+            decoded.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            filename : str
+                Filename of the image, relative to work_dir
+            callback : callable
+                Called with callback(texture). texture is None if the
+                thumbnail couldn't be loaded. If the texture was already
+                decoded, the callback is called right away.
+            owner : object, optional
+                The widget making the request, whose requests can be
+                cancelled at once (see cancel_all())
+        """
+        cls._load(
+            os.path.join(work_dir, filename), (work_dir, filename),
+            callback, owner
+        )
+
+
+    @classmethod
+    def cancel(cls, work_dir, filename, callback):
+        """ Summary
+            -------
+            Withdraws a request made with load(). If no other callback
+            waits for this image, the job is cancelled if it didn't
+            start yet.
+        """
+        cls._cancel(os.path.join(work_dir, filename), callback)
+
+
+    @classmethod
+    def cancel_all(cls, work_dir, keep=(), owner=None):
+        """ Summary
+            -------
+            Withdraws the requests of a widget for all the images which
+            are not in keep, for example when the grid is sorted or
+            filtered. The jobs nobody waits for anymore are cancelled.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            keep : iterable(str)
+                Filenames of the images whose requests must go on.
+            owner : object, optional
+                The widget whose requests are withdrawn (see load()),
+                all the requests if None
+        """
+        cls._cancel_all(
+            [os.path.join(work_dir, filename) for filename in keep], owner
+        )
+
+
+    @staticmethod
+    def _decode(work_dir, filename):
+        """ Summary
+            -------
+            Runs in a worker thread. Gets the thumbnail of an image and
+            decodes it to raw RGB data (see TextureLoader._decode()).
+        """
+        # taken before the thumbnail, so that an image modified
+        # meanwhile isn't mistaken for the decoded one
+        stat = os.stat(os.path.join(work_dir, filename))
+        thumbnail_path = ThumbnailCache.get_thumbnail(work_dir, filename)
+
+        with Image.open(thumbnail_path) as img:
+            img = img.convert("RGB")
+            return stat.st_mtime_ns, stat.st_size, img.size, img.tobytes()
@@ -0,0 +1,398 @@
+#pylint: disable=invalid-name
+"""
+    TiffReader module
+    -----------------
+    Reads regions and reduced versions of very large TIFF files, one
+    strip or tile at a time, without decoding the whole image.
+"""
+import logging
+import math
+import struct
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, TiffImagePlugin, TiffTags
+
+from kivy.logger import Logger
+
+# Pillow logs each tag of the TIFFs it opens at the debug level, which
+# would be hundreds of records for each chunk decoded
+logging.getLogger(TiffImagePlugin.__name__).setLevel(logging.INFO)
+
+
+class TiffReader():
+    """ Summary
+        -------
+        Reads a TIFF file chunk by chunk. The pixels of a TIFF are
+        stored in strips (bands of rows) or tiles, each compressed
+        independently, and the offset of each of them is in the header
+        of the file: a region of the image only needs the chunks which
+        intersect it.
+
+        Uncompressed chunks are read through a memory map of the file,
+        so the pages the system reads are shared with its file cache.
+        Compressed ones are given one by one to libtiff, as single chunk
+        TIFFs. The most recently used chunks are kept, so that reading
+        consecutive bands of an image decodes each chunk once.
+
+        The reduced resolution pages of a pyramidal TIFF are used when
+        a reduced version of the image is asked.
+
+        Pillow decodes TIFFs whole, and the other formats can't be
+        read by parts: open() only returns a reader for the TIFFs of at
+        least MIN_PIXELS pixels with a supported layout (8 bits per
+        sample, interleaved samples).
+
+        Methods
+        -------
+        open(img)
+            Returns a reader for an opened image, if it is worth it
+        read_region(box, page)
+            Reads a region of the image
+        reduce(factor, page)
+            Reads the image reduced by an integer factor
+        read_reduced(min_size)
+            Reads the smallest reduction at least as large as a size
+
+        Attributes
+        ----------
+        size : tuple(int, int)
+            (width, height) of the image
+        pages : list(dict)
+            The full resolution page, then the reduced resolution ones,
+            largest first
+    """
+
+    # smaller images are decoded whole, as usual
+    MIN_PIXELS = 4096 * 4096
+    # rows of the result computed at once by reduce()
+    BAND_ROWS = 32
+
+    # NewSubfileType flag of the reduced resolution pages
+    _REDUCED_RESOLUTION = 1
+    # tags describing the encoding of the chunks, copied in the single
+    # chunk TIFFs decoded by libtiff
+    _CHUNK_TAGS = (258, 259, 262, 277, 284, 317, 338, 339, 347, 530, 531, 532)
+    # modes which can be read from uncompressed chunks as they are
+    _RAW_MODES = ("L", "RGB", "RGBA")
+
+
+    def __init__(self, img):
+        """ Summary
+            -------
+            Reads the layout of an opened TIFF image. Prefer open().
+
+            Arguments
+            ---------
+            img : PIL.TiffImagePlugin.TiffImageFile
+                The image, which must have been opened from a file
+
+            Raises
+            ------
+            ValueError
+                If the layout of the image isn't supported.
+        """
+        self.pages = list()
+
+        for frame in range(getattr(img, "n_frames", 1)):
+            img.seek(frame)
+            reduced = img.tag_v2.get(254, 0) & self._REDUCED_RESOLUTION
+
+            if frame == 0:
+                self.pages.append(self._read_layout(img))
+            elif reduced and img.mode == self.pages[0]["mode"]:
+                try:
+                    self.pages.append(self._read_layout(img))
+                except ValueError:
+                    pass
+        img.seek(0)
+
+        self.pages[1:] = sorted(
+            self.pages[1:], key=lambda page: page["size"], reverse=True
+        )
+        self.size = self.pages[0]["size"]
+
+        self._data = np.memmap(img.filename, dtype=np.uint8, mode="r")
+        # (page, chunk) -> image of the chunk, least recently used first
+        self._chunks = OrderedDict()
+
+
+    @classmethod
+    def open(cls, img):
+        """ Summary
+            -------
+            Returns a reader for an opened image, if it is a TIFF large
+            enough to be read by parts, with a supported layout.
+
+            Arguments
+            ---------
+            img : PIL.Image.Image
+                The image, opened from a file and not loaded yet
+
+            Returns
+            -------
+            TiffReader or None
+        """
+        if img.format != "TIFF" or img.width * img.height < cls.MIN_PIXELS:
+            return None
+
+        try:
+            return cls(img)
+        except (ValueError, KeyError, OSError) as error:
+            Logger.debug(
+                "TiffReader: %s is decoded whole (%s)" % (img.filename, error)
+            )
+            return None
+
+
+    def read_region(self, box, page=0):
+        """ Summary
+            -------
+            Reads a region of the image, decoding only the chunks which
+            intersect it
+
+            Arguments
+            ---------
+            box : tuple(int, int, int, int)
+                (left, top, right, bottom) of the region, in pixels of
+                the page
+            page : int, default=0
+                Index of the page in pages
+
+            Returns
+            -------
+            PIL.Image.Image
+                The region, in the mode of the page
+        """
+        layout = self.pages[page]
+        left, top, right, bottom = (int(value) for value in box)
+        chunk_width, chunk_height = layout["chunk_size"]
+
+        region = Image.new(layout["mode"], (right - left, bottom - top))
+
+        for row in range(
+            top // chunk_height, math.ceil(bottom / chunk_height)
+        ):
+            for col in range(
+                left // chunk_width, math.ceil(right / chunk_width)
+            ):
+                chunk = self._get_chunk(page, row * layout["cols"] + col)
+                # the parts out of the region are clipped
+                region.paste(chunk, (
+                    col * chunk_width - left, row * chunk_height - top
+                ))
+
+        return region
+
+
+    def reduce(self, factor, page=0):
+        """ Summary
+            -------
+            Reads the image reduced by an integer factor, like
+            Image.reduce(), one band of rows at a time
+
+            Arguments
+            ---------
+            factor : int
+                Reduction factor
+            page : int, default=0
+                Index of the page in pages
+
+            Returns
+            -------
+            PIL.Image.Image
+                The reduced image, in the mode of the page
+        """
+        width, height = self.pages[page]["size"]
+        reduced = Image.new(self.pages[page]["mode"], (
+            math.ceil(width / factor), math.ceil(height / factor)
+        ))
+
+        band_height = factor * self.BAND_ROWS
+        for top in range(0, height, band_height):
+            band = self.read_region(
+                (0, top, width, min(height, top + band_height)), page
+            )
+            if factor > 1:
+                band = band.reduce(factor)
+            reduced.paste(band, (0, top // factor))
+
+        return reduced
+
+
+    def read_reduced(self, min_size):
+        """ Summary
+            -------
+            Reads the smallest integer reduction of the image which is
+            at least as large as a size, from the smallest page which
+            is large enough
+
+            Arguments
+            ---------
+            min_size : tuple(int, int)
+                Minimal (width, height) of the result
+
+            Returns
+            -------
+            PIL.Image.Image
+        """
+        page = max(
+            idx for idx, layout in enumerate(self.pages)
+            if idx == 0 or (
+                layout["size"][0] >= min_size[0]
+                and layout["size"][1] >= min_size[1]
+            )
+        )
+        width, height = self.pages[page]["size"]
+
+        factor = max(1, int(min(width / min_size[0], height / min_size[1])))
+        return self.reduce(factor, page)
+
+
+    @classmethod
+    def _read_layout(cls, img):
+        """ Summary
+            -------
+            Reads the size, mode and chunks of the current page of a
+            TIFF
+
+            Raises
+            ------
+            ValueError
+                If the layout of the page isn't supported
+        """
+        tags = img.tag_v2
+        width, height = img.size
+
+        bits = tags.get(258, 1)
+        if not isinstance(bits, tuple):
+            bits = (bits,)
+        if any(value != 8 for value in bits):
+            raise ValueError("only 8 bits samples are supported")
+        if tags.get(284, 1) != 1:
+            raise ValueError("only interleaved samples are supported")
+
+        tiled = 322 in tags
+        if tiled:
+            chunk_size = (tags[322], tags[323])
+            offsets, counts = tags[324], tags[325]
+        else:
+            chunk_size = (width, min(height, tags.get(278, height)))
+            offsets, counts = tags[273], tags[279]
+
+        cols = math.ceil(width / chunk_size[0])
+        if len(offsets) < cols * math.ceil(height / chunk_size[1]):
+            raise ValueError("missing chunks")
+
+        raw = (
+            tags.get(259, 1) == 1
+            and tags.get(262) in (1, 2)
+            and img.mode in cls._RAW_MODES
+            # unassociated alpha
+            and (img.mode != "RGBA" or tags.get(338) in (2, (2,)))
+        )
+
+        return {
+            "size": (width, height),
+            "mode": img.mode,
+            "chunk_size": chunk_size,
+            "tiled": tiled,
+            "cols": cols,
+            "offsets": offsets,
+            "counts": counts,
+            "raw": raw,
+            "tags": {
+                tag: (tags[tag], tags.tagtype[tag])
+                for tag in cls._CHUNK_TAGS if tag in tags
+            },
+        }
+
+
+    def _get_chunk(self, page, index):
+        """ Summary
+            -------
+            Returns a decoded chunk of a page, cropped to the image
+        """
+        key = (page, index)
+        chunk = self._chunks.get(key)
+
+        if chunk is None:
+            chunk = self._decode_chunk(self.pages[page], index)
+
+            self._chunks[key] = chunk
+            # enough for the chunks of two rows of tiles, so the bands
+            # of reduce() decode each chunk once
+            while len(self._chunks) > 2 * self.pages[page]["cols"] + 1:
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(key)
+
+        return chunk
+
+
+    def _decode_chunk(self, layout, index):
+        """ Summary
+            -------
+            Decodes a chunk of a page, cropped to the image
+        """
+        width, height = layout["size"]
+        chunk_width, chunk_height = layout["chunk_size"]
+        row, col = divmod(index, layout["cols"])
+
+        # the last strip only has the remaining rows, tiles on the
+        # edges are padded
+        rows = chunk_height
+        if not layout["tiled"]:
+            rows = min(chunk_height, height - row * chunk_height)
+
+        offset = layout["offsets"][index]
+        data = self._data[offset:offset + layout["counts"][index]]
+
+        if layout["raw"]:
+            chunk = Image.frombuffer(
+                layout["mode"], (chunk_width, rows), data,
+                "raw", layout["mode"], 0, 1
+            )
+        else:
+            chunk = self._decode_compressed(layout, (chunk_width, rows), data)
+
+        # crops the padding of the tiles on the edges
+        visible = (
+            min(chunk_width, width - col * chunk_width),
+            min(rows, height - row * chunk_height)
+        )
+        if visible != chunk.size:
+            chunk = chunk.crop((0, 0) + visible)
+
+        return chunk
+
+
+    @classmethod
+    def _decode_compressed(cls, layout, size, data):
+        """ Summary
+            -------
+            Decodes a compressed chunk with libtiff, by wrapping it in a
+            TIFF of a single strip with the encoding tags of the page
+        """
+        ifd = TiffImagePlugin.ImageFileDirectory_v2()
+        for tag, (value, tag_type) in layout["tags"].items():
+            ifd[tag] = value
+            ifd.tagtype[tag] = tag_type
+
+        for tag, value in (
+            (256, size[0]), (257, size[1]), (278, size[1]),
+            (279, (len(data),)),
+            # Pillow writes the offset of the strip relative to the end
+            # of the directory, where the strip is
+            (273, (0,)),
+        ):
+            ifd[tag] = value
+            ifd.tagtype[tag] = TiffTags.LONG
+
+        header = b"II*\x00" + struct.pack("<I", 8)
+        chunk_file = BytesIO(header + ifd.tobytes(len(header)) + data.tobytes())
+
+        with Image.open(chunk_file) as chunk:
+            chunk.load()
+            return chunk.copy()
@@ -0,0 +1,427 @@
+#pylint: disable=invalid-name
+"""
+    TilePyramid module
+    ------------------
+    Cuts very large images into pyramids of tiles stored on disk, so
+    they can be displayed one region at a time (see TiledImage).
+"""
+import json
+import math
+import os
+import shutil
+
+from PIL import Image
+
+from kivy.logger import Logger
+
+from api.ImageReader import ImageReader
+from api.ThumbnailCache import ThumbnailCache
+from api.TiffReader import TiffReader
+
+
+class TilePyramid():
+    """ Summary
+        -------
+        Static class managing the tile pyramids of the images of a
+        collection, in the style of DeepZoom and IIIF image pyramids.
+
+        Level 0 of a pyramid is the image at full resolution, each
+        following level halves the previous one, up to a level which
+        fits in a single tile. Each level is cut into tiles of
+        TILE_SIZE x TILE_SIZE pixels (smaller on the right and bottom
+        edges), saved as JPEGs in the cache directory of the collection
+        (see ThumbnailCache):
+
+            <cache>/pyramids/<key>/<level>/<column>_<row>.jpg
+
+        The key is computed from the filename, modification time and
+        size of the image, like the key of its thumbnail. A manifest
+        is written once all the tiles are, a pyramid without it is
+        still being generated (or was interrupted).
+
+        Methods
+        -------
+        needs_tiles(size)
+            Whether an image is large enough to be displayed by tiles
+        get_levels(size)
+            Sizes of the levels of the pyramid of an image
+        get_level(size, displayed_width)
+            Level to display an image at a given width
+        get_tiles(size, level, region)
+            The tiles of a level covering a region of an image
+        get_directory(work_dir, filename)
+            Path to the pyramid of an image
+        get_tile_path(pyramid_dir, level, col, row)
+            Path to a tile of a pyramid
+        is_ready(pyramid_dir)
+            Whether all the tiles of a pyramid were generated
+        generate(work_dir, filename, on_level)
+            Generates the pyramid of an image
+        prune(work_dir, file_records)
+            Removes the pyramids of images modified or removed
+    """
+
+    TILE_SIZE = 512
+    # images whose largest side is bigger are displayed by tiles, a
+    # single texture would be too heavy (or not even supported) for the
+    # GPU
+    MIN_SIZE = 4096
+
+    PYRAMID_DIRECTORY = "pyramids"
+    TILE_EXTENSION = ".jpg"
+    JPEG_QUALITY = 90
+    MANIFEST = "pyramid.json"
+
+
+    @classmethod
+    def needs_tiles(cls, size):
+        """ Summary
+            -------
+            Whether an image is large enough to be displayed by tiles
+
+            Arguments
+            ---------
+            size : tuple(int, int)
+                (width, height) of the image
+        """
+        return max(size) > cls.MIN_SIZE
+
+
+    @classmethod
+    def get_levels(cls, size):
+        """ Summary
+            -------
+            Sizes of the levels of the pyramid of an image
+
+            Arguments
+            ---------
+            size : tuple(int, int)
+                (width, height) of the image
+
+            Returns
+            -------
+            list(tuple(int, int))
+                (width, height) of each level, from the full resolution
+                to the level which fits in a single tile
+        """
+        width, height = size
+        levels = [(width, height)]
+
+        while max(width, height) > cls.TILE_SIZE:
+            # rounded up, like Image.reduce()
+            width, height = (width + 1) // 2, (height + 1) // 2
+            levels.append((width, height))
+
+        return levels
+
+
+    @classmethod
+    def get_level(cls, size, displayed_width):
+        """ Summary
+            -------
+            Level to display an image at a given width: the smallest
+            level which is at least as large as the displayed image, so
+            tiles are never scaled up more than the full resolution.
+
+            Arguments
+            ---------
+            size : tuple(int, int)
+                (width, height) of the image
+            displayed_width : float
+                Width of the image on screen, in pixels
+
+            Returns
+            -------
+            int
+        """
+        num_levels = len(cls.get_levels(size))
+        if displayed_width <= 0:
+            return num_levels - 1
+
+        level = int(math.floor(math.log2(size[0] / displayed_width)))
+        return min(max(level, 0), num_levels - 1)
+
+
+    @classmethod
+    def get_tiles(cls, size, level, region=None):
+        """ Summary
+            -------
+            The tiles of a level covering a region of an image
+
+            Arguments
+            ---------
+            size : tuple(int, int)
+                (width, height) of the image
+            level : int
+                Level of the pyramid
+            region : tuple(float, float, float, float), optional
+                (left, top, right, bottom) of the region, in pixels of
+                the full resolution image. The whole image if None.
+
+            Returns
+            -------
+            list(tuple(int, int, tuple))
+                (column, row, box) of the tiles, where box is the
+                (left, top, right, bottom) of the tile in pixels of the
+                full resolution image
+        """
+        level_width, level_height = cls.get_levels(size)[level]
+        scale_x = size[0] / level_width
+        scale_y = size[1] / level_height
+
+        if region is None:
+            region = (0, 0, size[0], size[1])
+        left, top, right, bottom = region
+
+        cols = math.ceil(level_width / cls.TILE_SIZE)
+        rows = math.ceil(level_height / cls.TILE_SIZE)
+
+        first_col = max(0, int(left / scale_x // cls.TILE_SIZE))
+        last_col = min(cols, math.ceil(right / scale_x / cls.TILE_SIZE))
+        first_row = max(0, int(top / scale_y // cls.TILE_SIZE))
+        last_row = min(rows, math.ceil(bottom / scale_y / cls.TILE_SIZE))
+
+        tiles = list()
+        for row in range(first_row, last_row):
+            for col in range(first_col, last_col):
+                tiles.append((col, row, (
+                    col * cls.TILE_SIZE * scale_x,
+                    row * cls.TILE_SIZE * scale_y,
+                    min(level_width, (col + 1) * cls.TILE_SIZE) * scale_x,
+                    min(level_height, (row + 1) * cls.TILE_SIZE) * scale_y,
+                )))
+
+        return tiles
+
+
+    @classmethod
+    def get_directory(cls, work_dir, filename):
+        """ Summary
+            -------
+            Path to the pyramid of the current version of an image. The
+            pyramid may not exist yet.
+
+            Raises
+            ------
+            OSError
+                If the image doesn't exist.
+        """
+        stat = os.stat(os.path.join(work_dir, filename))
+
+        return os.path.join(
+            ThumbnailCache.get_cache_directory(work_dir),
+            cls.PYRAMID_DIRECTORY,
+            ThumbnailCache.make_key(filename, stat.st_mtime_ns, stat.st_size)
+        )
+
+
+    @classmethod
+    def get_tile_path(cls, pyramid_dir, level, col, row):
+        """ Summary
+            -------
+            Path to a tile of a pyramid
+        """
+        return os.path.join(
+            pyramid_dir, str(level), "%d_%d%s" % (col, row, cls.TILE_EXTENSION)
+        )
+
+
+    @classmethod
+    def is_ready(cls, pyramid_dir):
+        """ Summary
+            -------
+            Whether all the tiles of a pyramid were generated
+        """
+        return os.path.isfile(os.path.join(pyramid_dir, cls.MANIFEST))
+
+
+    @classmethod
+    def generate(cls, work_dir, filename, on_level=None):
+        """ Summary
+            -------
+            Generates the pyramid of an image, unless it is already
+            generated. The image is decoded once, the levels are
+            computed by halving it, and written from the smallest one,
+            so that a viewer can display the image roughly while the
+            largest levels are written. The full resolution of large
+            TIFFs isn't kept in memory, it is read by parts (see
+            TiffReader).
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            filename : str
+                Filename of the image, relative to work_dir
+            on_level : callable, optional
+                Called with on_level(level) once all the tiles of a
+                level are written, from the thread running generate()
+
+            Returns
+            -------
+            str
+                Path to the pyramid
+
+            Raises
+            ------
+            OSError
+                If the image couldn't be read or the tiles written.
+        """
+        pyramid_dir = cls.get_directory(work_dir, filename)
+        if cls.is_ready(pyramid_dir):
+            return pyramid_dir
+
+        def write_level(level, img):
+            cls._write_level(
+                pyramid_dir, level, img.size,
+                lambda top, bottom: img.crop((0, top, img.width, bottom))
+            )
+            if on_level is not None:
+                on_level(level)
+
+        with Image.open(os.path.join(work_dir, filename)) as original:
+            size = original.size
+            top_level = len(cls.get_levels(size)) - 1
+            reader = TiffReader.open(original) if top_level > 0 else None
+
+            if reader is None:
+                first_level = 0
+                img = cls._to_rgb(original)
+                # only the converted image is needed
+                if img is not original:
+                    original.close()
+            else:
+                # the full resolution of a huge TIFF isn't loaded, its
+                # tiles are read one row at a time
+                first_level = 1
+                img = cls._to_rgb(reader.reduce(2))
+
+            # the smallest level first, so that a viewer can display the
+            # image roughly while the others are written
+            if top_level > first_level:
+                write_level(
+                    top_level, img.reduce(2 ** (top_level - first_level))
+                )
+
+            if reader is not None:
+                cls._write_level(
+                    pyramid_dir, 0, size,
+                    lambda top, bottom: cls._to_rgb(
+                        reader.read_region((0, top, size[0], bottom))
+                    )
+                )
+                if on_level is not None:
+                    on_level(0)
+
+            # then from the largest level, which is dropped once the
+            # next one is computed: only two levels are in memory
+            for level in range(first_level, top_level):
+                write_level(level, img)
+                img = img.reduce(2)
+                # the full resolution is the largest part of the memory
+                original.close()
+
+            if top_level == first_level:
+                write_level(top_level, img)
+
+        ThumbnailCache.write_file(
+            os.path.join(pyramid_dir, cls.MANIFEST),
+            lambda path: cls._save_manifest(path, size, top_level + 1)
+        )
+
+        return pyramid_dir
+
+
+    @classmethod
+    def prune(cls, work_dir, file_records):
+        """ Summary
+            -------
+            Removes the pyramids of images that were modified or that no
+            longer exist.
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            file_records : dict
+                filename -> {"size": int, "mtime": int} of the images
+                currently in the collection (see
+                Collection.file_records)
+        """
+        pyramids_dir = os.path.join(
+            work_dir, ThumbnailCache.CACHE_DIRECTORY, cls.PYRAMID_DIRECTORY
+        )
+        if not os.path.isdir(pyramids_dir):
+            return
+
+        valid_pyramids = {
+            ThumbnailCache.make_key(filename, record["mtime"], record["size"])
+            for filename, record in file_records.items()
+        }
+
+        for entry in os.scandir(pyramids_dir):
+            if entry.name not in valid_pyramids:
+                try:
+                    shutil.rmtree(entry.path)
+                except OSError:
+                    Logger.warning(
+                        "TilePyramid: Couldn't remove %s" % entry.path
+                    )
+
+
+    @classmethod
+    def _write_level(cls, pyramid_dir, level, size, read_rows):
+        """ Summary
+            -------
+            Cuts a level of a pyramid into tiles and writes them, one
+            row of tiles at a time
+
+            Arguments
+            ---------
+            pyramid_dir : str
+                Path to the pyramid
+            level : int
+                Level of the pyramid
+            size : tuple(int, int)
+                (width, height) of the level
+            read_rows : callable
+                read_rows(top, bottom) -> RGB image of these rows of the
+                level
+        """
+        os.makedirs(os.path.join(pyramid_dir, str(level)), exist_ok=True)
+        width, height = size
+
+        for row in range(math.ceil(height / cls.TILE_SIZE)):
+            rows = read_rows(
+                row * cls.TILE_SIZE, min(height, (row + 1) * cls.TILE_SIZE)
+            )
+
+            for col in range(math.ceil(width / cls.TILE_SIZE)):
+                tile = rows.crop((
+                    col * cls.TILE_SIZE,
+                    0,
+                    min(width, (col + 1) * cls.TILE_SIZE),
+                    rows.height,
+                ))
+                ThumbnailCache.write_file(
+                    cls.get_tile_path(pyramid_dir, level, col, row),
+                    lambda path, tile=tile: tile.save(
+                        path, "JPEG", quality=cls.JPEG_QUALITY
+                    )
+                )
+
+
+    @staticmethod
+    def _to_rgb(img):
+        return ImageReader.to_rgb(img, ThumbnailCache.BACKGROUND_COLOR)
+
+
+    @classmethod
+    def _save_manifest(cls, path, size, num_levels):
+        with open(path, "w", encoding="utf-8") as manifest:
+            json.dump({
+                "size": list(size),
+                "tile_size": cls.TILE_SIZE,
+                "levels": num_levels,
+            }, manifest)
+
@@ -0,0 +1,103 @@
+"""
+    Collection store benchmark
+    --------------------------
+    Compares saving and loading a large collection in the JSON meta file
+    and in the SQLite store of CollectionManager.
+
+    Usage (from the root of the repository):
+        python benchmarks/collection_store.py [number of images]
+
+    The images don't exist on disk: only the meta data is written, in a
+    temporary directory.
+"""
+import os
+import sys
+import tempfile
+import time
+
+# make the api package importable when running the script directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#pylint: disable=wrong-import-position
+from api.Collection import Collection
+from api.CollectionImage import CollectionImage
+from api.CollectionManager import CollectionManager
+from api.SQLiteStore import SQLiteStore
+
+NUM_IMAGES = 100000
+
+
+def generate_collection(directory, count):
+    images = [
+        CollectionImage(
+            "image%06d.jpg" % idx,
+            title="Title %d" % idx,
+            artist="Artist %d" % (idx % 500),
+            datation="c. %d" % (1000 + idx % 900),
+            technique="Painting",
+            material="Oil on canvas",
+            notes="Some notes about the artwork. " * 4,
+        )
+        for idx in range(count)
+    ]
+    file_records = {
+        image.filename: {
+            "size": 123456,
+            "mtime": 1600000000000000000 + idx,
+            "info": {"size": [1200, 800], "format": "JPEG", "mode": "RGB"},
+            "palette": [[10, 20, 30]] * 7,
+            "palette_engine": "adaptive",
+            "hashes": ["0123456789abcdef"] * 3,
+        }
+        for idx, image in enumerate(images)
+    }
+    return Collection(
+        directory, CollectionManager.VERSION, images, file_records
+    )
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main(count):
+    with tempfile.TemporaryDirectory() as directory:
+        print("Generating a collection of %d images..." % count)
+        collection = generate_collection(directory, count)
+        meta_path = os.path.join(directory, "collection.arty")
+        db_path = SQLiteStore.get_path(meta_path)
+
+        start = time.perf_counter()
+        collection.to_json()
+        print("%-32s %8.2f s" % (
+            "to_json() (previous save)", time.perf_counter() - start
+        ))
+
+        print("%-32s %8.2f s" % ("JSON save", measure(
+            lambda: CollectionManager._write_json(
+                CollectionManager._to_dict(collection), meta_path
+            )
+        )))
+        print("%-32s %8.2f s" % (
+            "SQLite save", measure(SQLiteStore.save, collection, db_path)
+        ))
+
+        image = collection.get_collection()[count // 2]
+        image.title = "Edited"
+        print("%-32s %8.2f s" % (
+            "SQLite save of one image",
+            measure(SQLiteStore.update_images, collection, db_path, [image])
+        ))
+
+        print("%-32s %8.2f s" % (
+            "SQLite load", measure(SQLiteStore.load, db_path, directory)
+        ))
+
+        for name, path in (("JSON size", meta_path), ("SQLite size", db_path)):
+            print("%-32s %8.1f MB" % (name, os.path.getsize(path) / 1e6))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else NUM_IMAGES)
@@ -0,0 +1,135 @@
+"""
+    Decoding benchmark
+    ------------------
+    Compares decoding large images in full before downsampling them
+    with the reduced decoding of ImageReader, for the sizes used by the
+    palettes, the grid thumbnails and the PowerPoint export.
+
+    Usage (from the root of the repository):
+        python benchmarks/decoding.py [image ...]
+
+    Without arguments, a large JPEG is generated in a temporary
+    directory. Each case runs in a fresh process, so the peak memory of
+    one doesn't hide the others'. Peak memory isn't measured on Windows.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+# make the api package importable when running the script directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#pylint: disable=wrong-import-position
+from api.ImageReader import ImageReader
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+SIZES = {
+    "palette": (100, 100),
+    "thumbnail": (480, 480),
+    "export": (1500, 1500),
+}
+REPEAT = 3
+
+
+def full_decoding(image_path, size):
+    """ Decodes the whole image, then downsamples it """
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+    # reducing_gap=None disables Pillow's own draft() in thumbnail()
+    img.thumbnail(size, Image.LANCZOS, reducing_gap=None)
+    return img
+
+
+def reduced_decoding(image_path, size):
+    """ Decodes only what is needed for the target size """
+    return ImageReader.read_thumbnail(image_path, size)
+
+
+def get_peak_memory():
+    """ Peak resident memory of the process in MB """
+    if resource is None:
+        return float("nan")
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+def run_case(function, image_path, size, queue):
+    """ Runs in a child process """
+    baseline = get_peak_memory()
+
+    durations = list()
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function(image_path, size)
+        durations.append(time.perf_counter() - start)
+
+    queue.put((min(durations), get_peak_memory() - baseline))
+
+
+def measure(function, image_path, size):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=run_case, args=(function, image_path, size, queue)
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def generate_image(directory):
+    image_path = os.path.join(directory, "large.jpg")
+    print("Generating a 8000x6000 JPEG...")
+
+    img = Image.merge("RGB", [
+        Image.effect_noise((8000, 6000), sigma).convert("L")
+        for sigma in (20, 40, 60)
+    ])
+    img.save(image_path, quality=90)
+
+    return image_path
+
+
+def main(image_paths):
+    with tempfile.TemporaryDirectory() as directory:
+        if not image_paths:
+            image_paths = [generate_image(directory)]
+
+        for image_path in image_paths:
+            with Image.open(image_path) as img:
+                print("\n%s (%s, %dx%d)" % (
+                    os.path.basename(image_path), img.format, *img.size
+                ))
+
+            print("%-10s %12s %12s %14s %14s" % (
+                "case", "full (s)", "reduced (s)",
+                "full (MB)", "reduced (MB)"
+            ))
+
+            for name, size in SIZES.items():
+                full_time, full_memory = measure(
+                    full_decoding, image_path, size
+                )
+                reduced_time, reduced_memory = measure(
+                    reduced_decoding, image_path, size
+                )
+                print("%-10s %12.3f %12.3f %14.1f %14.1f" % (
+                    name, full_time, reduced_time, full_memory, reduced_memory
+                ))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,157 @@
+"""
+    Palette benchmark
+    -----------------
+    Compares the palette engines of ColorPalette for speed and quality.
+
+    Usage (from the root of the repository):
+        python benchmarks/palette.py [image ...]
+
+    Without arguments, a set of synthetic images (color blobs with
+    gradients and noise) is generated in a temporary directory.
+
+    Quality is measured with:
+    - the quantization error: mean CIELAB distance (Delta E 76) between
+      the pixels of the image and their closest palette color. Lower
+      is better.
+    - the instability: mean Delta E between the palette of an image and
+      the palette of a slightly altered copy (re-encoded, cropped by 2%,
+      with some noise). Lower is better.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+# make the api package importable when running the script directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#pylint: disable=wrong-import-position
+from api.ColorPalette import ColorPalette
+from api.ColorSpace import ColorSpace
+
+NUM_IMAGES = 64
+IMAGE_SIZE = (1200, 900)
+
+
+def generate_images(directory, count=NUM_IMAGES, seed=0):
+    rng = np.random.default_rng(seed)
+    paths = list()
+
+    for idx in range(count):
+        width, height = IMAGE_SIZE
+        y, x = np.mgrid[0:height, 0:width]
+
+        # a background gradient and a few blobs of random colors
+        start, end = rng.integers(0, 256, (2, 3))
+        t = (x / width)[..., None]
+        img = start * (1 - t) + end * t
+
+        for _ in range(rng.integers(3, 8)):
+            cx, cy = rng.integers(0, width), rng.integers(0, height)
+            radius = rng.integers(50, 350)
+            mask = (x - cx) ** 2 + (y - cy) ** 2 < radius ** 2
+            img[mask] = rng.integers(0, 256, 3)
+
+        img += rng.normal(0, 8, img.shape)
+        img = Image.fromarray(np.clip(img, 0, 255).astype(np.uint8))
+        img = img.filter(ImageFilter.GaussianBlur(2))
+
+        path = os.path.join(directory, "synthetic%03d.jpg" % idx)
+        img.save(path, quality=90)
+        paths.append(path)
+
+    return paths
+
+
+def alter(image_path, directory):
+    """ Slightly altered copy of an image """
+    rng = np.random.default_rng(1)
+
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+        width, height = img.size
+        img = img.crop((
+            width // 50, height // 50, width - width // 50, height - height // 50
+        ))
+
+    pixels = np.asarray(img, dtype=np.float64)
+    pixels += rng.normal(0, 4, pixels.shape)
+    img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    path = os.path.join(directory, "altered_" + os.path.basename(image_path))
+    img.save(path, quality=80)
+    return path
+
+
+def palette_distance(palette_a, palette_b):
+    """ Symmetric mean distance to the closest color of the other palette """
+    lab_a = ColorSpace.rgb_to_lab(palette_a)
+    lab_b = ColorSpace.rgb_to_lab(palette_b)
+    distances = np.linalg.norm(lab_a[:, None] - lab_b[None], axis=2)
+    return (distances.min(axis=1).mean() + distances.min(axis=0).mean()) / 2
+
+
+def quantization_error(image_path, palette):
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+        img.thumbnail((200, 200))
+
+    pixels = ColorSpace.rgb_to_lab(np.asarray(img).reshape(-1, 3))
+    colors = ColorSpace.rgb_to_lab(palette)
+    distances = np.linalg.norm(pixels[:, None] - colors[None], axis=2)
+    return distances.min(axis=1).mean()
+
+
+def compute(engine, paths):
+    ColorPalette.ENGINE = engine
+    ColorPalette._cache.clear()
+
+    start = time.perf_counter()
+    palettes = list()
+    for batch in range(0, len(paths), ColorPalette.BATCH_SIZE):
+        palettes += ColorPalette.get_colors_batch(
+            paths[batch:batch + ColorPalette.BATCH_SIZE]
+        )
+    duration = time.perf_counter() - start
+
+    return palettes, duration
+
+
+def main(image_paths):
+    with tempfile.TemporaryDirectory() as directory:
+        if not image_paths:
+            print("Generating %d images..." % NUM_IMAGES)
+            image_paths = generate_images(directory)
+
+        altered_paths = [alter(path, directory) for path in image_paths]
+
+        # decode everything once, so the first engine doesn't pay for a
+        # cold disk cache
+        compute("adaptive", image_paths + altered_paths)
+
+        print("%-12s %16s %14s %14s" % (
+            "engine", "ms per image", "error (dE)", "instability"
+        ))
+
+        for engine in ColorPalette.ENGINES:
+            palettes, duration = compute(engine, image_paths)
+            altered, _duration = compute(engine, altered_paths)
+
+            error = np.mean([
+                quantization_error(path, palette)
+                for path, palette in zip(image_paths, palettes)
+            ])
+            instability = np.mean([
+                palette_distance(a, b) for a, b in zip(palettes, altered)
+            ])
+
+            print("%-12s %16.2f %14.2f %14.2f" % (
+                engine, 1000 * duration / len(image_paths), error, instability
+            ))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -7,7 +7,16 @@
 
 import unittest
 
-from tests.CollectionTests import TestCollectionImage, TestCollection
+from tests.CollectionTests import (
+    TestCollectionImage, TestCollection, TestCollectionManager, TestSQLiteStore
+)
+from tests.ImageTests import (
+    TestThumbnailCache, TestThumbnailLoader, TestRecordCache, TestImageInfo,
+    TestColorPalette, TestColorIndex, TestPerceptualHash, TestDuplicateIndex,
+    TestImageReader, TestTilePyramid, TestTiffReader
+)
+from tests.PowerpointTests import TestPowerpoint
+from tests.WidgetTests import TestCollectionGridTile
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,16 @@
-import unittest
+import json
 import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
 
+from api.Collection import Collection
 from api.CollectionImage import CollectionImage
+from api.CollectionManager import CollectionManager
 from api.CollectionUtils import CollectionUtils
+from api.SQLiteStore import SQLiteStore
 
 class TestCollectionImage(unittest.TestCase):
 
@@ -18,6 +26,17 @@ class TestCollectionImage(unittest.TestCase):
         self.assertIn(img3, [img1, img2])
         self.assertNotIn(img2, [img1, img3])
         self.assertNotEqual(img1, img2)
+        self.assertNotEqual(img1, None)
+
+
+    def test_hash(self):
+        img1 = CollectionImage(filename="1", title="a")
+        img2 = CollectionImage(filename="1", title="b")
+
+        # hashing is consistent with equality
+        self.assertEqual(hash(img1), hash(img2))
+        self.assertEqual(1, len({img1, img2}))
+        self.assertIn(img2, {img1})
 
 
     def test_to_legend(self):
@@ -61,6 +80,69 @@ class TestCollectionImage(unittest.TestCase):
 
 
 class TestCollection(unittest.TestCase):
+    def test_index(self):
+        images = [CollectionImage(filename=str(i)) for i in range(5)]
+        collection = Collection("", "", list(images))
+
+        self.assertIs(images[3], collection.get_image("3"))
+        self.assertIsNone(collection.get_image("5"))
+
+        # update
+        updated = CollectionImage(filename="3", title="Updated")
+        collection.update_image(updated)
+        self.assertIs(updated, collection.get_image("3"))
+        self.assertIs(updated, collection.get_collection()[3])
+        with self.assertRaises(ValueError):
+            collection.update_image(CollectionImage(filename="5"))
+
+        # add
+        new_image = CollectionImage(filename="5")
+        collection.append_image(new_image)
+        self.assertIs(new_image, collection.get_image("5"))
+        with self.assertRaises(ValueError):
+            collection.append_image(CollectionImage(filename="5"))
+
+        # remove
+        collection.remove_image(images[1])
+        self.assertIsNone(collection.get_image("1"))
+        self.assertEqual(
+            ["0", "2", "3", "4", "5"],
+            [i.filename for i in collection.get_collection()]
+        )
+        for image in collection.get_collection():
+            self.assertIs(image, collection.get_image(image.filename))
+        with self.assertRaises(ValueError):
+            collection.remove_image(images[1])
+
+        # set
+        collection.set_collection(images[:2])
+        self.assertIs(images[1], collection.get_image("1"))
+        self.assertIsNone(collection.get_image("2"))
+
+        # the index isn't serialized
+        self.assertNotIn("_index", collection.to_json())
+
+
+    def test_changes(self):
+        images = [CollectionImage(filename=str(i)) for i in range(3)]
+        collection = Collection("", "", list(images))
+        self.assertEqual((set(), set()), collection.pop_changes())
+
+        collection.update_image(CollectionImage(filename="0", title="New"))
+        collection.append_image(CollectionImage(filename="3"))
+        collection.remove_image(images[1])
+        self.assertEqual(({"0", "3"}, {"1"}), collection.pop_changes())
+        self.assertEqual((set(), set()), collection.pop_changes())
+
+        # failed saves are marked again, unless the image came back or
+        # was removed since then
+        collection.remove_image(images[2])
+        collection.mark_changed({"0", "2"}, {"1"})
+        self.assertEqual(({"0"}, {"1", "2"}), collection.pop_changes())
+
+        collection.set_collection([images[0], images[1]])
+        self.assertEqual(({"0", "1"}, {"3"}), collection.pop_changes())
+
     def test_filter(self):
         test_image1 = CollectionImage(
                 filename ="48224.jpg",
@@ -110,6 +192,111 @@ class TestCollection(unittest.TestCase):
         )
 
 
+    def test_filter_index(self):
+        images = [
+            CollectionImage(filename="1", artist="Léonard de Vinci", title="Mona Lisa", technique="Huile sur toile"),
+            CollectionImage(filename="2", artist="Leonard de Vinci", title="Salvator Mundi", technique="Huile sur bois"),
+            CollectionImage(filename="3", artist="Leonard Baldaquin", title="Portrait de Mona Rosa"),
+            CollectionImage(filename="4", artist="Élisabeth Vigée Le Brun", title="Autoportrait"),
+        ]
+        collection = Collection("", "", list(images))
+        index = collection.get_search_index()
+
+        queries = [
+            dict(artist="leo"),
+            dict(artist="LÉONARD DE"),
+            dict(artist="de", title="mona", mode="all"),
+            dict(artist="vigee", title="mona", mode="any"),
+            dict(title="po"),
+            dict(technique="toile", artist="   "),
+            dict(artist="   ", mode="all"),
+            dict(artist="   ", mode="any"),
+            dict(artist="zzz"),
+        ]
+
+        def check():
+            for query in queries:
+                self.assertEqual(
+                    CollectionUtils.filter(images, **query),
+                    CollectionUtils.filter(images, index=index, **query)
+                )
+
+        check()
+
+        # the index follows the changes in the collection
+        images[3].title = "Portrait de Madame Mona"
+        collection.update_image(images[3])
+        images[0].artist = ""
+        collection.update_image(images[0])
+        check()
+
+        collection.remove_image(images[1])
+        images.pop(1)
+        check()
+
+
+    def test_search(self):
+        images = [
+            CollectionImage(filename="1", artist="Léonard de Vinci", title="Mona Lisa"),
+            CollectionImage(filename="2", artist="Claude Monet", title="Impression"),
+            CollectionImage(filename="3", title="La Joconde", notes="Mona Lisa"),
+        ]
+        index = Collection("", "", list(images)).get_search_index()
+        attributes = ("title", "artist")
+
+        self.assertEqual({"1", "2"}, index.search("mon", attributes))
+        self.assertEqual({"1", "3"}, index.search("mona lisa"))
+        self.assertEqual(set(), index.search("zzz", attributes))
+
+        # contains() agrees with search() on every image
+        for query in ("mon", "MONET", "léo", "joconde", "a"):
+            expected = index.search(query, attributes)
+            for image in images:
+                self.assertEqual(
+                    image.filename in expected,
+                    index.contains(image.filename, query, attributes)
+                )
+
+
+    def test_filter_datation(self):
+        images = [
+            CollectionImage(filename="1", datation="Xe siècle", artist="a"),
+            CollectionImage(filename="2", datation="1001", artist="b"),
+            CollectionImage(filename="3", datation="1525-1530", artist="a"),
+            CollectionImage(filename="4", datation="", artist="a"),
+            CollectionImage(filename="5", datation="1001", artist="a"),
+        ]
+        collection = Collection("", "", list(images))
+        index = collection.get_search_index()
+
+        for datation_min, datation_max in ((900, 1100), (0, 1001), (1002, 3000)):
+            expected = CollectionUtils.filter(
+                images, mode="all",
+                datation_min=datation_min, datation_max=datation_max
+            )
+            self.assertEqual(expected, CollectionUtils.filter(
+                images, mode="all", index=index,
+                datation_min=datation_min, datation_max=datation_max
+            ))
+
+        self.assertEqual(
+            [images[1], images[4]],
+            CollectionUtils.filter(
+                images, mode="all", index=index,
+                datation_min=1001, datation_max=1001
+            )
+        )
+
+        # the index follows the changes in the collection
+        images[4].datation = "XVIe siècle"
+        collection.update_image(images[4])
+        self.assertEqual(1500, images[4].get_numeric_datation())
+        collection.remove_image(images[1])
+        collection.append_image(CollectionImage(filename="6", datation="1510"))
+        self.assertEqual({"3", "5", "6"}, index.datation_range(1500, 1530))
+        self.assertEqual({"1"}, index.datation_range(900, 1100))
+
+
     def test_datation_to_numeric(self):
 
         tests = {
@@ -234,3 +421,268 @@ class TestCollection(unittest.TestCase):
         # delete temporary file
         os.remove(test_csv_file)
 
+
+
+class TestCollectionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        for name in ("a.jpg", "b.png", "notes.txt"):
+            with open(os.path.join(self.work_dir, name), "wb") as f:
+                f.write(b"not really an image")
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def test_load_without_images(self):
+        for name in ("a.jpg", "b.png"):
+            os.remove(os.path.join(self.work_dir, name))
+
+        collection = CollectionManager.load(self.work_dir)
+        self.assertEqual([], collection.get_collection())
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.work_dir, "collection.arty")
+        ))
+
+        # an empty directory isn't a collection
+        empty_dir = os.path.join(self.work_dir, "empty")
+        os.mkdir(empty_dir)
+        with self.assertRaises(FileNotFoundError):
+            CollectionManager.load(empty_dir)
+
+
+    def test_load(self):
+        collection = CollectionManager.load(self.work_dir)
+
+        self.assertEqual(
+            ["a.jpg", "b.png"],
+            sorted(i.filename for i in collection.get_collection())
+        )
+        self.assertEqual({"a.jpg", "b.png"}, set(collection.file_records))
+        self.assertEqual(19, collection.file_records["a.jpg"]["size"])
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.work_dir, "collection.arty")
+        ))
+
+        # metadata and records are kept between sessions, and changes in
+        # the directory are detected
+        collection.get_collection()[0].title = "Title"
+        CollectionManager.save(collection)
+        os.remove(os.path.join(self.work_dir, "b.png"))
+        with open(os.path.join(self.work_dir, "c.webp"), "wb") as f:
+            f.write(b"")
+
+        collection = CollectionManager.load(self.work_dir)
+
+        self.assertEqual(
+            ["a.jpg", "c.webp"],
+            sorted(i.filename for i in collection.get_collection())
+        )
+        self.assertEqual({"a.jpg", "c.webp"}, set(collection.file_records))
+        self.assertEqual(0, collection.file_records["c.webp"]["size"])
+        self.assertEqual("Title", collection.get_collection()[0].title)
+
+        # the records of the files left unchanged are kept, the ones of
+        # the files modified in place are refreshed
+        collection.file_records["a.jpg"]["cached"] = 1
+        collection.file_records["c.webp"]["cached"] = 2
+        CollectionManager.save(collection)
+        with open(os.path.join(self.work_dir, "c.webp"), "wb") as f:
+            f.write(b"modified")
+
+        collection = CollectionManager.load(self.work_dir)
+
+        self.assertEqual(1, collection.file_records["a.jpg"].get("cached"))
+        self.assertEqual(
+            {"size": 8, "mtime": os.stat(
+                os.path.join(self.work_dir, "c.webp")
+            ).st_mtime_ns},
+            collection.file_records["c.webp"]
+        )
+
+
+    def test_upgrade_version(self):
+        with open(os.path.join(self.work_dir, "old.arty"), "w") as f:
+            json.dump({
+                "work_directory": self.work_dir,
+                "version": "Alpha-1.1",
+                "collection": [{"filename": "a.jpg", "title": "Old"}]
+            }, f)
+
+        collection = CollectionManager.load(self.work_dir)
+
+        self.assertEqual(CollectionManager.VERSION, collection.version)
+        self.assertEqual("Old", collection.get_collection()[0].title)
+        self.assertEqual({"a.jpg", "b.png"}, set(collection.file_records))
+
+
+    def test_add_image(self):
+        collection = CollectionManager.load(self.work_dir)
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        source = os.path.join(source_dir, "dropped.jpg")
+        with open(source, "wb") as f:
+            f.write(b"dropped")
+
+        # the file is copied and recorded, like the ones found on load
+        collection.add_image(source)
+        stat = os.stat(os.path.join(self.work_dir, "dropped.jpg"))
+        self.assertEqual(
+            {"size": 7, "mtime": stat.st_mtime_ns},
+            collection.file_records["dropped.jpg"]
+        )
+        self.assertEqual({"dropped.jpg"}, collection.pop_changes()[0])
+
+
+    def test_save(self):
+        collection = CollectionManager.load(self.work_dir)
+        meta_path = os.path.join(self.work_dir, "collection.arty")
+
+        # a failed save leaves the meta file as it was, and no temporary
+        # file behind
+        with open(meta_path) as meta_file:
+            saved = meta_file.read()
+        collection.update_image(CollectionImage("a.jpg", title="Title"))
+        collection.file_records["a.jpg"]["unserializable"] = object()
+
+        with self.assertRaises(TypeError):
+            CollectionManager.save(collection)
+        with open(meta_path) as meta_file:
+            self.assertEqual(saved, meta_file.read())
+        self.assertEqual(
+            ["a.jpg", "b.png", "collection.arty", "notes.txt"],
+            sorted(os.listdir(self.work_dir))
+        )
+        # the changes are still to be saved
+        self.assertEqual({"a.jpg"}, collection.pop_changes()[0])
+
+        # saves in the background
+        del collection.file_records["a.jpg"]["unserializable"]
+        CollectionManager.save_async(collection)
+        CollectionManager.wait()
+
+        collection = CollectionManager.load(self.work_dir)
+        self.assertEqual("Title", collection.get_image("a.jpg").title)
+
+        # a save done right away replaces the one waiting for its delay
+        collection.update_image(CollectionImage("b.png", title="Other"))
+        CollectionManager.schedule_save(collection)
+        CollectionManager.save(collection)
+        self.assertIsNone(CollectionManager._scheduled)
+        self.assertEqual(set(), collection.pop_changes()[0])
+
+
+    def test_sqlite_store(self):
+        CollectionManager.STORE = "sqlite"
+        try:
+            collection = CollectionManager.load(self.work_dir)
+            meta_path = os.path.join(self.work_dir, "collection.arty")
+            db_path = SQLiteStore.get_path(meta_path)
+            self.assertTrue(os.path.isfile(db_path))
+
+            # only the images updated through the collection are written
+            image = CollectionImage("a.jpg", title="Title")
+            collection.update_image(image)
+            collection.get_image("b.png").title = "Not saved"
+            CollectionManager.save(collection)
+
+            collection = CollectionManager.load(self.work_dir)
+            self.assertEqual("Title", collection.get_image("a.jpg").title)
+            self.assertEqual("", collection.get_image("b.png").title)
+
+            # an exported meta file is more recent than the database,
+            # it is imported on the next load
+            collection.get_image("b.png").title = "Exported"
+            CollectionManager.export_json(collection)
+            os.utime(db_path, ns=(0, 0))
+
+            collection = CollectionManager.load(self.work_dir)
+            self.assertEqual("Exported", collection.get_image("b.png").title)
+            self.assertEqual({"a.jpg", "b.png"}, set(collection.file_records))
+        finally:
+            CollectionManager.STORE = "json"
+
+
+    def test_sqlite_rebuild(self):
+        CollectionManager.STORE = "sqlite"
+        try:
+            collection = CollectionManager.load(self.work_dir)
+            meta_path = os.path.join(self.work_dir, "collection.arty")
+            db_path = SQLiteStore.get_path(meta_path)
+
+            # a database with another schema is rebuilt from the images
+            with closing(sqlite3.connect(db_path)) as connection:
+                with connection:
+                    connection.execute(
+                        "UPDATE meta SET value = '0' WHERE key = 'schema'"
+                    )
+
+            collection = CollectionManager.load(self.work_dir)
+            self.assertEqual(
+                ["a.jpg", "b.png"],
+                sorted(i.filename for i in collection.get_collection())
+            )
+            self.assertEqual(
+                2, len(SQLiteStore.load(db_path, self.work_dir).file_records)
+            )
+
+            # an unreadable database is rebuilt from the meta file
+            collection.get_image("a.jpg").title = "Exported"
+            CollectionManager.export_json(collection)
+            with open(db_path, "wb") as db_file:
+                db_file.write(b"not a database")
+            os.utime(meta_path, ns=(0, 0))
+
+            collection = CollectionManager.load(self.work_dir)
+            self.assertEqual("Exported", collection.get_image("a.jpg").title)
+        finally:
+            CollectionManager.STORE = "json"
+
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, "collection.arty.db")
+
+        self.collection = Collection(self.work_dir, "Alpha-1.2", [
+            CollectionImage("1.jpg", title="Zèbre", datation="1850"),
+            CollectionImage("2.jpg", title="abeille", artist="Manet"),
+            CollectionImage("3.jpg", title="50% Zebra", datation="c. 1900"),
+        ], {"1.jpg": {"size": 1, "mtime": 2, "palette": [[0, 0, 0]]}})
+        SQLiteStore.save(self.collection, self.db_path)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def test_load(self):
+        collection = SQLiteStore.load(self.db_path, self.work_dir)
+
+        self.assertEqual(
+            self.collection.get_collection(), collection.get_collection()
+        )
+        self.assertEqual("Zèbre", collection.get_collection()[0].title)
+        self.assertEqual(self.collection.file_records, collection.file_records)
+
+
+    def test_update_images(self):
+        image = CollectionImage("2.jpg", title="Updated")
+        new_image = CollectionImage("4.jpg", title="New")
+        self.collection.update_image(image)
+        self.collection.append_image(new_image)
+
+        SQLiteStore.update_images(
+            self.collection, self.db_path, [image, new_image], ["1.jpg"]
+        )
+
+        collection = SQLiteStore.load(self.db_path, self.work_dir)
+        self.assertEqual(
+            ["2.jpg", "3.jpg", "4.jpg"],
+            [i.filename for i in collection.get_collection()]
+        )
+        self.assertEqual("Updated", collection.get_image("2.jpg").title)
+        self.assertEqual(dict(), collection.file_records)
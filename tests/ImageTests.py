@@ -0,0 +1,757 @@
+import json
+import os
+import shutil
+import tempfile
+import random
+import struct
+import unittest
+import zlib
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+from api.ColorIndex import ColorIndex
+from api.BKTree import BKTree
+from api.ColorPalette import ColorPalette
+from api.DuplicateIndex import DuplicateIndex
+from api.ImageInfo import ImageInfo
+from api.ImageReader import ImageReader
+from api.PerceptualHash import PerceptualHash
+from api.RecordCache import RecordCache
+from api.ThumbnailCache import ThumbnailCache
+from api.ThumbnailLoader import ThumbnailLoader
+from api.TiffReader import TiffReader
+from api.TilePyramid import TilePyramid
+
+
+class TestThumbnailCache(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        Image.new("RGB", (2000, 1000), (200, 10, 10)).save(
+            os.path.join(self.work_dir, "large.jpg")
+        )
+        Image.new("RGBA", (100, 300), (0, 0, 255, 128)).save(
+            os.path.join(self.work_dir, "alpha.png")
+        )
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def test_get_thumbnail(self):
+        thumbnail = ThumbnailCache.get_thumbnail(self.work_dir, "large.jpg")
+
+        self.assertTrue(os.path.isfile(thumbnail))
+        self.assertTrue(thumbnail.startswith(
+            os.path.join(self.work_dir, ThumbnailCache.CACHE_DIRECTORY)
+        ))
+
+        with Image.open(thumbnail) as img:
+            self.assertEqual(img.size, (480, 240))
+
+        # the second call reuses the thumbnail on disk
+        mtime = os.stat(thumbnail).st_mtime_ns
+        self.assertEqual(
+            thumbnail, ThumbnailCache.get_thumbnail(self.work_dir, "large.jpg")
+        )
+        self.assertEqual(mtime, os.stat(thumbnail).st_mtime_ns)
+
+        # transparent images are flattened
+        with Image.open(
+            ThumbnailCache.get_thumbnail(self.work_dir, "alpha.png")
+        ) as img:
+            self.assertEqual(img.mode, "RGB")
+
+
+    def test_prune(self):
+        large = ThumbnailCache.get_thumbnail(self.work_dir, "large.jpg")
+        alpha = ThumbnailCache.get_thumbnail(self.work_dir, "alpha.png")
+
+        stat = os.stat(os.path.join(self.work_dir, "alpha.png"))
+        ThumbnailCache.prune(self.work_dir, {
+            "alpha.png": {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        })
+
+        self.assertFalse(os.path.exists(large))
+        self.assertTrue(os.path.exists(alpha))
+
+
+class TestThumbnailLoader(unittest.TestCase):
+
+    def tearDown(self):
+        ThumbnailLoader._jobs.clear()
+        ThumbnailLoader._textures.clear()
+
+
+    def test_cancel_all(self):
+        grid, panel = object(), object()
+        jobs = {
+            filename: (Future(), [(print, owner) for owner in owners])
+            for filename, owners in (
+                ("a.jpg", [grid]), ("b.jpg", [grid, panel]),
+                ("c.jpg", [grid]), ("d.jpg", [panel]),
+            )
+        }
+        for filename, job in jobs.items():
+            ThumbnailLoader._jobs[os.path.join("/collection", filename)] = job
+
+        # only the requests of the grid are withdrawn
+        ThumbnailLoader.cancel_all("/collection", keep=["c.jpg"], owner=grid)
+
+        self.assertEqual(
+            ["b.jpg", "c.jpg", "d.jpg"],
+            sorted(os.path.basename(path) for path in ThumbnailLoader._jobs)
+        )
+        self.assertEqual([(print, panel)], jobs["b.jpg"][1])
+        self.assertTrue(jobs["a.jpg"][0].cancelled())
+        self.assertFalse(jobs["b.jpg"][0].cancelled())
+
+
+    def test_prune_textures(self):
+        for path in ("/collection/a.jpg", "/collection/b.jpg", "/other/a.jpg"):
+            ThumbnailLoader._textures[path] = (1, 2, path)
+
+        ThumbnailLoader.prune_textures("/collection", {
+            "a.jpg": {"size": 2, "mtime": 1},
+            "b.jpg": {"size": 3, "mtime": 1},
+        })
+
+        # the textures are used without accessing the files
+        self.assertEqual(
+            "/collection/a.jpg",
+            ThumbnailLoader.get_texture("/collection/a.jpg")
+        )
+        self.assertEqual(["/collection/a.jpg"], list(ThumbnailLoader._textures))
+
+
+class TestRecordCache(unittest.TestCase):
+
+    def test_records(self):
+        work_dir = "/collection"
+        stat = SimpleNamespace(st_mtime_ns=20, st_size=10)
+        file_records = {
+            "a.png": {"size": 10, "mtime": 20},
+            "b.png": {"size": 1, "mtime": 2, "value": [1], "unit": "cm"},
+            "c.png": {"size": 10, "mtime": 21},
+        }
+        cache = RecordCache(
+            "value",
+            encode=lambda value: (list(value[0]), value[1]),
+            decode=lambda value, unit: (tuple(value), unit or "px"),
+            extra_keys=("unit",)
+        )
+        for filename in ("a.png", "c.png", "d.png"):
+            cache.set(os.path.join(work_dir, filename), stat, ((1, 2), "mm"))
+
+        # only the values of the current version of a file are saved,
+        # the records of the files which weren't computed are left as
+        # they are
+        self.assertEqual({"a.png"}, cache.store(work_dir, file_records))
+        self.assertEqual(
+            {"size": 10, "mtime": 20, "value": [1, 2], "unit": "mm"},
+            file_records["a.png"]
+        )
+        self.assertEqual("cm", file_records["b.png"]["unit"])
+        self.assertNotIn("value", file_records["c.png"])
+
+        # the other values are saved once their file is recorded
+        file_records["c.png"]["mtime"] = 20
+        file_records["d.png"] = {"size": 10, "mtime": 20}
+        self.assertEqual(
+            {"c.png", "d.png"}, cache.store(work_dir, file_records)
+        )
+        self.assertEqual(set(), cache.store(work_dir, file_records))
+
+        # restored values are decoded, and aren't saved again
+        del file_records["b.png"]["unit"]
+        cache.clear()
+        file_records = json.loads(json.dumps(file_records))
+        cache.restore(work_dir, file_records)
+        self.assertEqual(
+            dict.fromkeys(("a.png", "c.png", "d.png"), ((1, 2), "mm"))
+            | {"b.png": ((1,), "px")},
+            cache.get_recorded(work_dir, file_records)
+        )
+        self.assertEqual(
+            ((1, 2), "mm"), cache.get(os.path.join(work_dir, "a.png"), stat)
+        )
+        self.assertEqual(set(), cache.store(work_dir, file_records))
+
+
+class TestImageInfo(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.image_path = os.path.join(self.work_dir, "image.png")
+        Image.new("RGB", (300, 200)).save(self.image_path)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def test_get_size(self):
+        self.assertEqual(ImageInfo.get_size(self.image_path), (300, 200))
+
+        # the cache is invalidated when the file changes
+        Image.new("RGB", (30, 20)).save(self.image_path)
+        stat = os.stat(self.image_path)
+        os.utime(
+            self.image_path,
+            ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9)
+        )
+        self.assertEqual(ImageInfo.get_size(self.image_path), (30, 20))
+
+        with self.assertRaises(OSError):
+            ImageInfo.get_size(os.path.join(self.work_dir, "missing.png"))
+
+
+    def test_get_info(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Arty Camera"   # Make
+        exif[0x927C] = b"\x00\x01"     # MakerNote, binary
+        jpeg_path = os.path.join(self.work_dir, "photo.jpg")
+        Image.new("L", (40, 50)).save(jpeg_path, exif=exif)
+
+        info = ImageInfo.get_info(jpeg_path)
+
+        self.assertEqual(info["size"], (40, 50))
+        self.assertEqual(info["format"], "JPEG")
+        self.assertEqual(info["mode"], "L")
+        self.assertEqual(info["exif"], {"Make": "Arty Camera"})
+
+
+    def test_records(self):
+        stat = os.stat(self.image_path)
+        file_records = {
+            "image.png": {"size": stat.st_size, "mtime": stat.st_mtime_ns},
+            "other.png": {"size": 0, "mtime": 0, "info": {"size": [1, 1]}},
+        }
+        info = ImageInfo.get_info(self.image_path)
+
+        # only the properties probed since the last store are saved
+        self.assertEqual(
+            {"image.png"}, ImageInfo.store(self.work_dir, file_records)
+        )
+        self.assertEqual(file_records["image.png"]["info"], info)
+        self.assertEqual(file_records["other.png"]["info"], {"size": [1, 1]})
+
+        # saved properties are used without reading the file again
+        file_records = json.loads(json.dumps(file_records))
+        file_records["image.png"]["info"]["format"] = "SAVED"
+        ImageInfo.restore(self.work_dir, file_records)
+        self.assertEqual(ImageInfo.get_info(self.image_path)["format"], "SAVED")
+        self.assertEqual(ImageInfo.get_size(self.image_path), (300, 200))
+
+
+class TestColorPalette(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.image_path = os.path.join(self.work_dir, "image.png")
+
+        # 3/4 red, 1/4 blue
+        img = Image.new("RGB", (400, 400), (255, 0, 0))
+        img.paste((0, 0, 255), (0, 0, 200, 200))
+        img.save(self.image_path)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def test_get_colors(self):
+        self.assertIsNone(ColorPalette.get_cached(self.image_path))
+
+        colors = ColorPalette.get_colors(self.image_path)
+
+        # the most frequent colors first
+        self.assertEqual(colors[:2], [(255, 0, 0), (0, 0, 255)])
+        self.assertLessEqual(len(colors), ColorPalette.NUM_COLORS)
+        self.assertEqual(ColorPalette.get_cached(self.image_path), colors)
+
+
+    def test_records(self):
+        stat = os.stat(self.image_path)
+        file_records = {
+            "image.png": {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        }
+        colors = ColorPalette.get_colors(self.image_path)
+
+        ColorPalette.store(self.work_dir, file_records)
+        file_records = json.loads(json.dumps(file_records))
+
+        ColorPalette._cache.clear()
+        ColorPalette.restore(self.work_dir, file_records)
+        self.assertEqual(ColorPalette.get_cached(self.image_path), colors)
+
+
+    def test_engines(self):
+        other_path = os.path.join(self.work_dir, "other.jpg")
+        Image.new("RGB", (300, 100), (250, 250, 0)).save(other_path)
+        paths = [self.image_path, other_path, "missing.png"]
+
+        try:
+            for engine in ("kmeans", "kmeans-lab"):
+                ColorPalette.ENGINE = engine
+                # palettes of another engine are not reused
+                self.assertIsNone(ColorPalette.get_cached(self.image_path))
+
+                palettes = ColorPalette.get_colors_batch(paths)
+
+                self.assertIsNone(palettes[2])
+                red_blue = palettes[0]
+                self.assertLessEqual(len(red_blue), ColorPalette.NUM_COLORS)
+                self.assertTrue(all(abs(a - b) <= 2 for a, b in zip(
+                    red_blue[0] + red_blue[1], (255, 0, 0, 0, 0, 255)
+                )))
+                self.assertEqual(len(palettes[1]), 1)
+
+                # batches give the same palettes as single images
+                ColorPalette._cache.clear()
+                self.assertEqual(
+                    palettes[1], ColorPalette.get_colors(other_path)
+                )
+        finally:
+            ColorPalette.ENGINE = "adaptive"
+
+        with self.assertRaises(OSError):
+            ColorPalette.get_colors(os.path.join(self.work_dir, "missing"))
+
+
+class TestColorIndex(unittest.TestCase):
+
+    def test_query(self):
+        index = ColorIndex({
+            "red.png": [(255, 0, 0), (250, 10, 10)],
+            "red_blue.png": [(255, 0, 0), (0, 0, 255)],
+            "blue.png": [(0, 0, 255)],
+            "unknown.png": [],
+        })
+
+        # images without palette are not indexed
+        self.assertEqual(len(index), 3)
+
+        results = index.query([(255, 0, 0)])
+        self.assertEqual(
+            [filename for filename, _score in results],
+            ["red.png", "red_blue.png", "blue.png"]
+        )
+        # the padding of the shorter palettes is ignored
+        self.assertAlmostEqual(index.query([(0, 0, 255)])[0][1], 0, places=2)
+
+        self.assertEqual(len(index.query([(0, 0, 255)], count=2)), 2)
+        self.assertEqual(index.query([]), [])
+
+
+    def test_get_index(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            image_path = os.path.join(work_dir, "image.png")
+            Image.new("RGB", (50, 50), (0, 255, 0)).save(image_path)
+            stat = os.stat(image_path)
+
+            class Collection():
+                work_directory = work_dir
+                file_records = {
+                    "image.png": {"size": stat.st_size, "mtime": stat.st_mtime_ns},
+                    "other.png": {"size": 1, "mtime": 1},
+                }
+
+            ColorPalette._cache.clear()
+            self.assertEqual(len(ColorIndex.get_index(Collection)), 0)
+
+            # rebuilt once new palettes are cached
+            ColorPalette.get_colors(image_path)
+            index = ColorIndex.get_index(Collection)
+            self.assertEqual(index.filenames, ["image.png"])
+            self.assertIs(ColorIndex.get_index(Collection), index)
+        finally:
+            shutil.rmtree(work_dir)
+
+
+class TestPerceptualHash(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def _save(self, filename, img):
+        path = os.path.join(self.work_dir, filename)
+        img.save(path)
+        return path
+
+
+    def test_get_hashes(self):
+        img = Image.effect_noise((400, 300), 80).convert("RGB")
+        original = self._save("original.png", img)
+        smaller = self._save("smaller.jpg", img.resize((200, 150)))
+        other = self._save(
+            "other.png", Image.effect_noise((400, 300), 80).convert("RGB")
+        )
+
+        hashes = PerceptualHash.get_hashes(original)
+        self.assertEqual(len(hashes), 3)
+        self.assertTrue(all(0 <= value < 2 ** 64 for value in hashes))
+        self.assertEqual(PerceptualHash.get_cached(original), hashes)
+
+        # the pHash of a resized copy is close, the other image's isn't
+        p_hash = hashes[2]
+        self.assertLessEqual(BKTree.hamming_distance(
+            p_hash, PerceptualHash.get_hashes(smaller)[2]
+        ), DuplicateIndex.MAX_DISTANCES["phash"])
+        self.assertGreater(BKTree.hamming_distance(
+            p_hash, PerceptualHash.get_hashes(other)[2]
+        ), DuplicateIndex.MAX_DISTANCES["phash"])
+
+
+    def test_records(self):
+        path = self._save("image.png", Image.effect_noise((64, 64), 50))
+        stat = os.stat(path)
+        file_records = {
+            "image.png": {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        }
+        hashes = PerceptualHash.get_hashes(path)
+
+        PerceptualHash.store(self.work_dir, file_records)
+        file_records = json.loads(json.dumps(file_records))
+
+        PerceptualHash._cache.clear()
+        PerceptualHash.restore(self.work_dir, file_records)
+        self.assertEqual(PerceptualHash.get_cached(path), hashes)
+        self.assertEqual(
+            PerceptualHash.get_recorded(self.work_dir, file_records),
+            {"image.png": hashes}
+        )
+
+
+class TestDuplicateIndex(unittest.TestCase):
+
+    def test_bk_tree(self):
+        rng = random.Random(0)
+        keys = [rng.getrandbits(16) for _ in range(500)]
+        tree = BKTree()
+        for value, key in enumerate(keys):
+            tree.add(key, value)
+
+        self.assertEqual(len(tree), 500)
+
+        # same results as comparing with every key
+        for query in keys[:20] + [rng.getrandbits(16) for _ in range(20)]:
+            expected = sorted(
+                (BKTree.hamming_distance(query, key), value)
+                for value, key in enumerate(keys)
+                if BKTree.hamming_distance(query, key) <= 3
+            )
+            self.assertEqual(sorted(tree.search(query, 3)), expected)
+
+
+    def test_query(self):
+        index = DuplicateIndex({
+            "a.jpg": (0, 0, 0b1111),
+            "a_small.jpg": (0, 0, 0b0111),
+            "b.jpg": (0, 0, 2 ** 64 - 1),
+            "c.jpg": (0, 0, 2 ** 32 - 1),
+        })
+
+        self.assertEqual(
+            index.query((0, 0, 0b1111), exclude="a.jpg"), [("a_small.jpg", 1)]
+        )
+        self.assertEqual(index.query((0, 0, 2 ** 48 - 1)), [])
+        self.assertEqual(index.get_groups(), [["a.jpg", "a_small.jpg"]])
+
+        with self.assertRaises(ValueError):
+            index.add("a.jpg", (0, 0, 0))
+
+
+class TestImageReader(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def test_read_thumbnail(self):
+        jpeg_path = os.path.join(self.work_dir, "large.jpg")
+        Image.new("RGB", (4000, 3000), (0, 200, 0)).save(jpeg_path)
+
+        img = ImageReader.read_thumbnail(jpeg_path, (100, 100))
+        self.assertEqual(img.size, (100, 75))
+        self.assertEqual(img.mode, "RGB")
+        self.assertEqual(img.getpixel((50, 40)), (0, 200, 0))
+
+        # small images are not enlarged, and stay usable once the file
+        # is closed
+        png_path = os.path.join(self.work_dir, "small.png")
+        Image.new("RGB", (30, 20), (1, 2, 3)).save(png_path)
+
+        img = ImageReader.read_thumbnail(png_path, (100, 100))
+        self.assertEqual(img.size, (30, 20))
+        self.assertEqual(img.getpixel((0, 0)), (1, 2, 3))
+
+
+    def test_read_resized(self):
+        png_path = os.path.join(self.work_dir, "alpha.png")
+        Image.new("RGBA", (1000, 500), (255, 0, 0, 0)).save(png_path)
+
+        img = ImageReader.read_resized(png_path, (40, 30), (0, 0, 255))
+
+        # the size is exact, transparent pixels get the background color
+        self.assertEqual(img.size, (40, 30))
+        self.assertEqual(img.getpixel((20, 15)), (0, 0, 255))
+
+
+class TestTilePyramid(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        # left half red, right half blue
+        img = Image.new("RGB", (1200, 700), (255, 0, 0))
+        img.paste((0, 0, 255), (600, 0, 1200, 700))
+        img.save(os.path.join(self.work_dir, "scan.png"))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def test_levels(self):
+        self.assertEqual(
+            TilePyramid.get_levels((1200, 700)),
+            [(1200, 700), (600, 350), (300, 175)]
+        )
+        self.assertEqual(TilePyramid.get_levels((512, 100)), [(512, 100)])
+
+        # the level at least as large as the displayed image
+        self.assertEqual(TilePyramid.get_level((1200, 700), 2400), 0)
+        self.assertEqual(TilePyramid.get_level((1200, 700), 1000), 0)
+        self.assertEqual(TilePyramid.get_level((1200, 700), 500), 1)
+        self.assertEqual(TilePyramid.get_level((1200, 700), 10), 2)
+
+        self.assertFalse(TilePyramid.needs_tiles((4000, 3000)))
+        self.assertTrue(TilePyramid.needs_tiles((30000, 20000)))
+
+
+    def test_get_tiles(self):
+        tiles = TilePyramid.get_tiles((1200, 700), 0)
+        self.assertEqual([(col, row) for col, row, _box in tiles], [
+            (0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)
+        ])
+        self.assertEqual(tiles[-1][2], (1024, 512, 1200, 700))
+
+        # only the tiles intersecting the region
+        tiles = TilePyramid.get_tiles((1200, 700), 0, (500, 600, 530, 650))
+        self.assertEqual([(col, row) for col, row, _box in tiles], [
+            (0, 1), (1, 1)
+        ])
+
+        # boxes of the smaller levels are in pixels of the full image
+        tiles = TilePyramid.get_tiles((1200, 700), 1, (0, 0, 10, 10))
+        self.assertEqual(tiles, [(0, 0, (0, 0, 1024, 700))])
+
+
+    def test_generate(self):
+        levels = list()
+        pyramid_dir = TilePyramid.generate(
+            self.work_dir, "scan.png", levels.append
+        )
+
+        # the smallest level first, then from the full resolution
+        self.assertEqual(levels, [2, 0, 1])
+        self.assertTrue(TilePyramid.is_ready(pyramid_dir))
+        self.assertEqual(
+            pyramid_dir, TilePyramid.get_directory(self.work_dir, "scan.png")
+        )
+
+        for level, size in enumerate(TilePyramid.get_levels((1200, 700))):
+            for col, row, box in TilePyramid.get_tiles((1200, 700), level):
+                tile_path = TilePyramid.get_tile_path(
+                    pyramid_dir, level, col, row
+                )
+                with Image.open(tile_path) as tile:
+                    self.assertEqual(tile.size, (
+                        round((box[2] - box[0]) * size[0] / 1200),
+                        round((box[3] - box[1]) * size[1] / 700)
+                    ))
+                    # the color of the image at the center of the tile
+                    red, _green, blue = tile.getpixel((
+                        tile.width // 2, tile.height // 2
+                    ))
+                    if (box[0] + box[2]) / 2 < 600:
+                        self.assertGreater(red, blue)
+                    else:
+                        self.assertGreater(blue, red)
+
+        # the pyramid isn't generated again
+        levels.clear()
+        TilePyramid.generate(self.work_dir, "scan.png", levels.append)
+        self.assertEqual(levels, [])
+
+        # the pyramids of removed images are pruned
+        TilePyramid.prune(self.work_dir, dict())
+        self.assertFalse(os.path.exists(pyramid_dir))
+
+
+def save_tiled_tiff(pixels, path, tile_size, compression=1):
+    """ Writes an RGB array as a tiled TIFF, uncompressed (1) or deflate
+        (8), which Pillow can read but not write
+    """
+    height, width, _samples = pixels.shape
+    tile_width, tile_height = tile_size
+
+    chunks = list()
+    for top in range(0, height, tile_height):
+        for left in range(0, width, tile_width):
+            # the tiles on the edges are padded
+            tile = np.zeros((tile_height, tile_width, 3), np.uint8)
+            part = pixels[top:top + tile_height, left:left + tile_width]
+            tile[:part.shape[0], :part.shape[1]] = part
+            chunk = tile.tobytes()
+            chunks.append(zlib.compress(chunk) if compression == 8 else chunk)
+
+    offsets = [8 + sum(map(len, chunks[:idx])) for idx in range(len(chunks))]
+    ifd_offset = 8 + sum(map(len, chunks))
+    entries = [
+        # tag, type, count, value
+        (256, 4, 1, width), (257, 4, 1, height), (258, 3, 3, None),
+        (259, 3, 1, compression), (262, 3, 1, 2), (277, 3, 1, 3),
+        (284, 3, 1, 1), (322, 4, 1, tile_width), (323, 4, 1, tile_height),
+        (324, 4, len(chunks), None), (325, 4, len(chunks), None),
+    ]
+    # values which don't fit in an entry go after the directory
+    bits_offset = ifd_offset + 2 + 12 * len(entries) + 4
+    values = {
+        258: bits_offset,
+        324: bits_offset + 6,
+        325: bits_offset + 6 + 4 * len(chunks),
+    }
+
+    data = b"II*\x00" + struct.pack("<I", ifd_offset) + b"".join(chunks)
+    data += struct.pack("<H", len(entries))
+    for tag, tag_type, count, value in entries:
+        value = values.get(tag, value)
+        if tag_type == 3 and count == 1:
+            data += struct.pack("<HHIHH", tag, tag_type, count, value, 0)
+        else:
+            data += struct.pack("<HHII", tag, tag_type, count, value)
+    data += struct.pack("<I", 0)
+    data += struct.pack("<3H", 8, 8, 8)
+    data += struct.pack("<%dI" % len(chunks), *offsets)
+    data += struct.pack("<%dI" % len(chunks), *map(len, chunks))
+
+    with open(path, "wb") as tiff:
+        tiff.write(data)
+
+
+class TestTiffReader(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.pixels = np.random.RandomState(0).randint(
+            0, 256, (300, 400, 3), np.uint8
+        )
+
+        # the test images are small
+        self.min_pixels = TiffReader.MIN_PIXELS
+        TiffReader.MIN_PIXELS = 0
+
+
+    def tearDown(self):
+        TiffReader.MIN_PIXELS = self.min_pixels
+        shutil.rmtree(self.work_dir)
+
+
+    def _check_reader(self, path, tolerance=0):
+        with Image.open(path) as img:
+            expected = img.convert("RGB")
+            reader = TiffReader.open(img)
+
+        self.assertIsNotNone(reader)
+        self.assertEqual(reader.size, (400, 300))
+
+        box = (50, 20, 390, 290)
+        region = np.asarray(reader.read_region(box), dtype=int)
+        self.assertLessEqual(
+            np.abs(region - np.asarray(expected.crop(box), dtype=int)).max(),
+            tolerance
+        )
+
+        reduced = np.asarray(reader.reduce(3), dtype=int)
+        self.assertLessEqual(
+            np.abs(reduced - np.asarray(expected.reduce(3), dtype=int)).max(),
+            tolerance
+        )
+
+        # the smallest reduction at least as large
+        self.assertEqual(reader.read_reduced((100, 60)).size, (100, 75))
+
+
+    def test_tiles(self):
+        for compression in (1, 8):
+            path = os.path.join(self.work_dir, "tiled%d.tif" % compression)
+            save_tiled_tiff(self.pixels, path, (128, 64), compression)
+            self._check_reader(path)
+
+
+    def test_strips(self):
+        for compression in (None, "tiff_lzw", "tiff_adobe_deflate", "jpeg"):
+            path = os.path.join(self.work_dir, "%s.tif" % compression)
+            Image.fromarray(self.pixels).save(
+                path, compression=compression, strip_size=400 * 3 * 16
+            )
+            # JPEG blocks overlap the strips, but are decoded the same
+            self._check_reader(path)
+
+
+    def test_open(self):
+        jpeg_path = os.path.join(self.work_dir, "image.jpg")
+        Image.fromarray(self.pixels).save(jpeg_path)
+        with Image.open(jpeg_path) as img:
+            self.assertIsNone(TiffReader.open(img))
+
+        # 16 bits samples are decoded whole
+        tiff_path = os.path.join(self.work_dir, "gray16.tif")
+        Image.new("I;16", (400, 300)).save(tiff_path)
+        with Image.open(tiff_path) as img:
+            self.assertIsNone(TiffReader.open(img))
+
+        TiffReader.MIN_PIXELS = self.min_pixels
+        tiff_path = os.path.join(self.work_dir, "small.tif")
+        Image.fromarray(self.pixels).save(tiff_path)
+        with Image.open(tiff_path) as img:
+            self.assertIsNone(TiffReader.open(img))
+
+
+    def test_large_tiff(self):
+        save_tiled_tiff(
+            self.pixels, os.path.join(self.work_dir, "scan.tif"), (128, 64), 8
+        )
+
+        img = ImageReader.read_resized(
+            os.path.join(self.work_dir, "scan.tif"), (40, 30)
+        )
+        self.assertEqual(img.size, (40, 30))
+
+        # the full resolution is written from the tiles of the TIFF
+        TilePyramid.TILE_SIZE, tile_size = 128, TilePyramid.TILE_SIZE
+        try:
+            pyramid_dir = TilePyramid.generate(self.work_dir, "scan.tif")
+        finally:
+            TilePyramid.TILE_SIZE = tile_size
+
+        self.assertTrue(TilePyramid.is_ready(pyramid_dir))
+        for level, col, row, size in ((0, 3, 2, (16, 44)), (1, 1, 1, (72, 22))):
+            tile_path = TilePyramid.get_tile_path(pyramid_dir, level, col, row)
+            with Image.open(tile_path) as tile:
+                self.assertEqual(tile.size, size)
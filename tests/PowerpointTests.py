@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from PIL import Image
+from pptx import Presentation
+
+from api.CollectionImage import CollectionImage
+from api.Powerpoint import Powerpoint
+
+
+class TestPowerpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.work_dir, "export.pptx")
+        self.images = list()
+
+        for i in range(12):
+            filename = "%02d.jpg" % i
+            Image.new("RGB", (300 + 10 * i, 200), (i * 20, 0, 0)).save(
+                os.path.join(self.work_dir, filename)
+            )
+            self.images.append(CollectionImage(filename, title="Image %d" % i))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+    def test_create_presentation(self):
+        progress = list()
+
+        saved = Powerpoint.create_presentation(
+            self.images, self.work_dir, self.output_path,
+            progress_callback=lambda done, total: progress.append((done, total))
+        )
+
+        self.assertTrue(saved)
+        self.assertEqual(progress, [(i, 12) for i in range(1, 13)])
+
+        # the slides are in the order of the images
+        slides = Presentation(self.output_path).slides
+        self.assertEqual(len(slides), 12)
+        for slide, image in zip(slides, self.images):
+            texts = [shape.text_frame.text for shape in slide.shapes
+                     if shape.has_text_frame]
+            self.assertIn(image.title, texts)
+
+
+    def test_cancel(self):
+        cancel_event = threading.Event()
+
+        def on_progress(done, _total):
+            if done == 3:
+                cancel_event.set()
+
+        saved = Powerpoint.create_presentation(
+            self.images, self.work_dir, self.output_path,
+            progress_callback=on_progress, cancel_event=cancel_event
+        )
+
+        self.assertFalse(saved)
+        self.assertFalse(os.path.exists(self.output_path))
+
+
+    def test_downsample(self):
+        filename = "large.jpg"
+        Image.effect_noise((3000, 2000), 64).convert("RGB").save(
+            os.path.join(self.work_dir, filename)
+        )
+        images = [CollectionImage(filename), self.images[0]]
+        downsampled_path = os.path.join(self.work_dir, "downsampled.pptx")
+
+        Powerpoint.create_presentation(images, self.work_dir, self.output_path)
+        Powerpoint.create_presentation(
+            images, self.work_dir, downsampled_path, target_dpi=100
+        )
+
+        self.assertLess(
+            os.path.getsize(downsampled_path) * 10,
+            os.path.getsize(self.output_path)
+        )
+
+        # the large image is resized to fit the slide at 100 dpi, the
+        # small one is embedded as is
+        large, small = (
+            [s for s in slide.shapes if s.shape_type == 13][0].image
+            for slide in Presentation(downsampled_path).slides
+        )
+        prs = Presentation()
+        height = Powerpoint._get_layout_params(
+            os.path.join(self.work_dir, filename),
+            (prs.slide_width, prs.slide_height)
+        )["image"]["height"]
+        self.assertEqual(large.content_type, "image/jpeg")
+        self.assertEqual(large.size[1], round(height.inches * 100))
+        self.assertEqual(small.size, (300, 200))
@@ -0,0 +1,93 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from kivy.graphics.texture import Texture
+from kivymd.app import MDApp
+
+from api.CollectionImage import CollectionImage
+
+
+class TestCollectionGridTile(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # KivyMD widgets need an app, which doesn't have to run
+        cls.app = MDApp.get_running_app() or MDApp()
+
+        # the kv rules of the tile need the app
+        from widgets.CollectionGridTile import CollectionGridTile
+        cls.tile_class = CollectionGridTile
+
+
+    def setUp(self):
+        self.images = [CollectionImage("a.jpg"), CollectionImage("b.jpg")]
+        self.app.TOOLBAR = SimpleNamespace(selected_images=list())
+        self.grid = SimpleNamespace(
+            data=[
+                {"collection_image": image, "selected": False}
+                for image in self.images
+            ],
+            CURRENT_COLLECTION=SimpleNamespace(work_directory="/collection")
+        )
+
+        # the thumbnails aren't tested here
+        patcher = mock.patch("widgets.CollectionGridTile.ThumbnailLoader")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.tile = self.tile_class()
+
+
+    def _display(self, index):
+        self.tile.refresh_view_attrs(self.grid, index, self.grid.data[index])
+
+
+    def test_recycle_selected(self):
+        self._display(0)
+        self.tile.ids.select_image.active = True
+        self.assertEqual(self.app.TOOLBAR.selected_images, [self.images[0]])
+
+        # the tile is recycled for another image, then for the first one
+        self._display(1)
+        self.assertFalse(self.tile.ids.select_image.active)
+        self._display(0)
+        self.assertTrue(self.tile.ids.select_image.active)
+        self.assertEqual(self.app.TOOLBAR.selected_images, [self.images[0]])
+
+
+    def test_recycle_unselected(self):
+        # all the images are selected, then one is unchecked
+        for item in self.grid.data:
+            item["selected"] = True
+        self.app.TOOLBAR.selected_images = list(self.images)
+
+        self._display(0)
+        self.tile.ids.select_image.active = False
+        self.assertEqual(self.app.TOOLBAR.selected_images, [self.images[1]])
+
+        self._display(1)
+        self.assertTrue(self.tile.ids.select_image.active)
+        self._display(0)
+
+        # displaying the selection isn't mistaken for a click
+        self.assertFalse(self.tile.ids.select_image.active)
+        self.assertEqual(self.app.TOOLBAR.selected_images, [self.images[1]])
+
+
+    def test_recycle_thumbnail(self):
+        self._display(0)
+        placeholder = self.tile._img_widget.source
+        self.assertIsInstance(placeholder, Texture)
+
+        thumbnail = Texture.create(size=(4, 3))
+        self.tile._on_thumbnail(thumbnail)
+        self.assertIs(thumbnail, self.tile._img_widget.source)
+
+        # the thumbnail of the other image isn't decoded yet
+        self._display(1)
+        self.assertIs(placeholder, self.tile._img_widget.source)
+
+        # nor can it be
+        self.tile._on_thumbnail(None)
+        self.assertIs(placeholder, self.tile._img_widget.source)
@@ -1,21 +1,32 @@
 from kivy.lang.builder import Builder
-from kivy.core.window import Window
 from kivy.app import App
+from kivy.core.image import Image as CoreImage
 from kivy.uix.behaviors.button import ButtonBehavior
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 import kivy.properties as kyprops
 
 from kivymd.uix.imagelist import SmartTileWithLabel
 
+from api.ThumbnailLoader import ThumbnailLoader
+
 
 EMPTY = 'resources/empty.png'
 BLANK_CHECKBOX = 'resources/blank-check-box.png'
+# displayed while the thumbnail is being decoded
+PLACEHOLDER = EMPTY
 
 
-class CollectionGridTile(SmartTileWithLabel, ButtonBehavior):
+class CollectionGridTile(
+    RecycleDataViewBehavior, SmartTileWithLabel, ButtonBehavior
+):
     """
         Summary
         -------
         Displays a clickable and selectable image of the collection.
+        Tiles are views of the CollectionImageList RecycleView: they
+        are recycled to display other images as the user scrolls.
+        The thumbnail is decoded in the background by the
+        ThumbnailLoader, a placeholder is displayed meanwhile.
 
         Attributes
         ----------
@@ -25,14 +36,20 @@ class CollectionGridTile(SmartTileWithLabel, ButtonBehavior):
             True if the mouse is on the widget
         collection_image: ObjectProperty(CollectionImage)
             the CollectionImage represented by this widget
+        index: int
+            index of the tile's data in the RecycleView
 
         Methods
         -------
+        refresh_view_attrs(rv, index, data):
+            displays the image at index in the RecycleView data
         on_press():
             displays the panel for the image when pressed
         checkbox_click():
             selects the image if the checkbox is clicked
-        on_mouse_pos:
+        on_parent(instance, parent):
+            forgets the hover when the tile is removed from the grid
+        set_hovered(is_hovered):
             displays the checkbox if the mouse is on the image
 
     """
@@ -40,17 +57,65 @@ class CollectionGridTile(SmartTileWithLabel, ButtonBehavior):
     source = kyprops.StringProperty(None)
     collection_image = kyprops.ObjectProperty(None)
     is_hovered = False
+    index = None
+
+    # reference to the CollectionImageList displaying this tile
+    grid = None
+    # True while the tile is being refreshed with new data, so that the
+    # checkbox update isn't mistaken for a click
+    refreshing = False
+    # texture of the PLACEHOLDER, loaded once
+    _placeholder = None
 
     Builder.load_file("templates/CollectionGridTile.kv")
 
 
-    def __init__(self, **kwargs):
-        super(CollectionGridTile, self).__init__(**kwargs)
-        # bind mouse position updates so we can check when the cursor
-        # hovers over the image
-        # note: had to do it in the init, otherwise it doesn't work
-        Window.bind(mouse_pos=self.on_mouse_pos)
-        self.text = self.collection_image.to_legend(style_name="SIMPLE")
+    def refresh_view_attrs(self, rv, index, data):
+        """ Summary
+            -------
+            Called by the RecycleView when this tile is used to display
+            the image at index in its data.
+
+            Arguments
+            ---------
+            rv: CollectionImageList
+                the grid displaying this tile
+            index: int
+                index of the image in the grid
+            data: dict
+                the data of the image to display
+        """
+        self.grid = rv
+        self.index = index
+
+        collection_image = data["collection_image"]
+
+        if collection_image is not self.collection_image:
+            self._load_thumbnail(collection_image)
+
+        self.set_collection_image(collection_image)
+
+        self.refreshing = True
+        self.ids.select_image.active = data["selected"]
+        self.refreshing = False
+
+
+    def on_parent(self, _instance, parent):
+        """ Summary
+            -------
+            Hides the checkbox when the RecycleView removes (and
+            caches) the tile, as the grid won't tell it that the mouse
+            left.
+
+            Arguments
+            ---------
+            _instance: (unused)
+                reference to the current instance
+            parent: Widget
+                the new parent of the tile, None if it was removed
+        """
+        if parent is None:
+            self.set_hovered(False)
 
 
     def on_press(self):
@@ -74,6 +139,14 @@ class CollectionGridTile(SmartTileWithLabel, ButtonBehavior):
             is_checked: bool
                 states if the checkbox is checked
         """
+        # the checkbox shows the selection of the image the tile is
+        # recycled for, it wasn't clicked
+        if self.refreshing:
+            return
+
+        # the RecycleView restores the checkbox from its data when the
+        # tile is recycled
+        self.grid.data[self.index]["selected"] = is_checked
 
         app = App.get_running_app()
 
@@ -87,31 +160,74 @@ class CollectionGridTile(SmartTileWithLabel, ButtonBehavior):
                 app.TOOLBAR.selected_images.remove(self.collection_image)
 
 
-    def on_mouse_pos(self, _window, pos):
+    def set_hovered(self, is_hovered):
         """ Summary
             -------
-            Displays the checkbox when the mouse hovers the image
+            Displays the checkbox when the mouse hovers the image.
+            Called by the CollectionImageList, which finds the tile
+            under the mouse.
 
             Arguments
             ---------
-            _window (unused)
-                reference the app window
-            pos: tuple
-                position of the cursor
+            is_hovered: bool
+                True if the mouse is on the image
         """
+        if is_hovered == self.is_hovered:
+            return
 
-        # convert window position to local position
-        rel_pos = self.to_widget(*pos)
+        self.is_hovered = is_hovered
+        self.ids.select_image.background_checkbox_normal = (
+            BLANK_CHECKBOX if is_hovered else EMPTY
+        )
+
+
+    def _load_thumbnail(self, collection_image):
+        """ Summary
+            -------
+            Displays a placeholder and requests the thumbnail of an
+            image to the ThumbnailLoader.
+        """
+        work_dir = self.grid.CURRENT_COLLECTION.work_directory
+
+        # this tile was displaying another image, whose thumbnail may
+        # not be loaded yet
+        if self.collection_image is not None:
+            ThumbnailLoader.cancel(
+                work_dir, self.collection_image.filename, self._on_thumbnail
+            )
+
+        # a path wouldn't replace the texture of the previous image: the
+        # inner image of the FitImage still has the PLACEHOLDER as source
+        self._img_widget.source = self._get_placeholder()
+        ThumbnailLoader.load(
+            work_dir, collection_image.filename, self._on_thumbnail,
+            owner=self.grid
+        )
+
+
+    @classmethod
+    def _get_placeholder(cls):
+        if cls._placeholder is None:
+            cls._placeholder = CoreImage(PLACEHOLDER).texture
+
+        return cls._placeholder
+
+
+    def _on_thumbnail(self, texture):
+        """ Summary
+            -------
+            Callback of the ThumbnailLoader, displays the thumbnail.
+
+            Arguments
+            ---------
+            texture: Texture
+                The decoded thumbnail, None if it couldn't be loaded.
+        """
+        # the placeholder stays if the image can't be read: the original
+        # would be decoded on the main thread, at full size
+        if texture is not None:
+            self._img_widget.source = texture
 
-        # if the mouse position is over the image, make checkbox visible
-        if self.collide_point(*rel_pos):
-            if not self.is_hovered:
-                self.is_hovered = True
-                self.ids.select_image.background_checkbox_normal = BLANK_CHECKBOX
-        else:
-            if self.is_hovered:
-                self.is_hovered = False
-                self.ids.select_image.background_checkbox_normal = EMPTY
 
     def set_collection_image(self, collection_image):
         self.collection_image = collection_image
@@ -1,18 +1,30 @@
-from kivy.app import App
+from kivy.core.window import Window
 from kivy.lang.builder import Builder
 from kivy.logger import Logger
-from kivy.metrics import dp
-
-from kivymd.uix.gridlayout import MDGridLayout
+from kivy.uix.recycleview import RecycleView
 
 from api.Collection import Collection
+from api.ThumbnailLoader import ThumbnailLoader
 from widgets.CollectionGridTile import CollectionGridTile
 
 
-class CollectionImageList(MDGridLayout):
+class CollectionImageList(RecycleView):
     """ Summary
         -------
         Displays the collection in grid format.
+        The grid is virtualized: only the tiles visible in the viewport
+        (plus a few overscan rows) are instantiated, and they are
+        recycled as the user scrolls.
+
+        Attributes
+        ----------
+        display_list : list(CollectionImage)
+            The images displayed in the grid, in display order.
+        display_index : dict
+            filename -> index of each displayed image in display_list.
+        OVERSCAN_ROWS : int
+            Number of rows rendered above and below the viewport, so
+            the tiles are ready before they scroll into view.
 
         Methods
         -------
@@ -22,18 +34,33 @@ class CollectionImageList(MDGridLayout):
         set_display_list(collection_list)
             Displays a list of CollectionImages in the order of the
             list. set_collection() must have been called prior.
+        update_image(collection_image)
+            Updates the tile of an image after its metadata changed.
+        set_selection(is_selected)
+            Selects or deselects all the displayed images.
+        get_index_at(pos)
+            Index of the image displayed under a window position.
+        on_mouse_pos(window, pos)
+            Tells the tile under the mouse that it is hovered.
     """
     CURRENT_COLLECTION = None
     display_list = list()
+    # filename -> index of the image in display_list (and data)
+    display_index = dict()
+
+    OVERSCAN_ROWS = 1
+
+    Builder.load_file("templates/CollectionImageList.kv")
 
 
     def __init__(self, **kwargs):
         super(CollectionImageList, self).__init__(**kwargs)
-
-        self.cols = 3
-        self.adaptive_height = True
-        self.padding = (dp(4), dp(4))
-        self.spacing = dp(4)
+        # the tile currently under the mouse
+        self._hovered_tile = None
+        # a single binding for the whole grid: the tile under the mouse
+        # is found from the geometry of the grid, the tiles don't follow
+        # the mouse themselves
+        Window.bind(mouse_pos=self.on_mouse_pos)
 
 
     def set_collection(self, collection):
@@ -49,6 +76,12 @@ class CollectionImageList(MDGridLayout):
         if not isinstance(collection, Collection):
             raise ValueError("collection must by of type Collection")
 
+        # the textures of another collection, or of images modified
+        # since they were decoded, won't be displayed again
+        ThumbnailLoader.prune_textures(
+            collection.work_directory, collection.file_records
+        )
+
         # set the collection
         self.CURRENT_COLLECTION = collection
 
@@ -66,39 +99,33 @@ class CollectionImageList(MDGridLayout):
             order of the list.
             A collection must have been set using the set_collection()
             method.
+            Sorting or filtering only reorders the data of the
+            RecycleView: the instantiated tiles are recycled and the
+            thumbnails already decoded are reused (see ThumbnailLoader).
 
             Arguments
             ---------
             collection_list : list(CollectionImage)
                 A list of CollectionImages to display in the grid.
         """
-        # remove children if the collection is not None
-        if self.CURRENT_COLLECTION:
-            self.clear_widgets()
-
-        for collection_image in collection_list:
-            # get absolute path to the image, in order to display it
-            absolute_path = self.CURRENT_COLLECTION.get_absolute_path(
-                collection_image
-            )
-
-            try:
-                # create an image widget
-                tile = CollectionGridTile(
-                    source=absolute_path,
-                    collection_image=collection_image
-                )
-
-                # add it to the grid
-                self.add_widget(tile)
-
-            except ValueError:
-                Logger.exception(
-                    'CollectionGrid: Unable to load <%s>' % collection_image
-                )
-                App.get_running_app().show_error("Unable to load <%s>" % collection_image)
+        # stop decoding the images that won't be displayed anymore
+        ThumbnailLoader.cancel_all(
+            self.CURRENT_COLLECTION.work_directory,
+            keep=[i.filename for i in collection_list],
+            owner=self
+        )
+
+        # the tiles are created (or recycled) by the RecycleView from
+        # this data, only when they are about to be displayed
+        self.data = [
+            {"collection_image": collection_image, "selected": False}
+            for collection_image in collection_list
+        ]
 
         self.display_list = collection_list
+        self.display_index = {
+            image.filename: idx for idx, image in enumerate(collection_list)
+        }
 
 
     def update_image(self, collection_image):
@@ -111,15 +138,143 @@ class CollectionImageList(MDGridLayout):
             collection_image : CollectionImage
                 The updated image
         """
-        try:
-            # find this image in the display list
-            # NOTE: I really don't know why it's reversed ¯\_(ツ)_/¯
-            idx = list(reversed(self.display_list)).index(collection_image)
-
-            # update the image
-            self.children[idx].set_collection_image(collection_image)
-
-        except ValueError:
-            # this image is not currently displayed -> no need to update
-            Logger.exception("The image is not currently displayed")
-            pass
+        idx = self.display_index.get(collection_image.filename)
+
+        # this image is not currently displayed -> no need to update
+        if idx is None:
+            return
+
+        self.data[idx]["collection_image"] = collection_image
+
+        # update the tile if it is currently instantiated
+        tile = self.view_adapter.get_visible_view(idx)
+        if tile is not None:
+            tile.set_collection_image(collection_image)
+
+
+    def set_selection(self, is_selected):
+        """ Summary
+            -------
+            Selects or deselects all the images displayed in the grid.
+
+            Arguments
+            ---------
+            is_selected : bool
+                True to check all the checkboxes, False to uncheck them.
+        """
+        for item in self.data:
+            item["selected"] = is_selected
+
+        self.refresh_from_data()
+
+
+    def get_viewport(self):
+        """ Summary
+            -------
+            Extends the viewport of the RecycleView by OVERSCAN_ROWS
+            rows on each side, so that the tiles right outside of the
+            visible area are also instantiated.
+        """
+        left, bottom, width, height = super(
+            CollectionImageList, self
+        ).get_viewport()
+
+        layout = self.layout_manager
+        overscan = self.OVERSCAN_ROWS * (
+            layout.default_size[1] + layout.spacing[1]
+        )
+
+        top = min(layout.height, bottom + height + overscan)
+        bottom = max(0, bottom - overscan)
+
+        return left, bottom, width, top - bottom
+
+
+    def get_index_at(self, pos):
+        """ Summary
+            -------
+            Finds the image displayed under a position of the window,
+            from the number of columns, the size of the tiles and the
+            spacing of the grid, without going through the tiles.
+
+            Arguments
+            ---------
+            pos : tuple
+                (x, y) in window coordinates
+
+            Returns
+            -------
+            int
+                Index of the image in display_list, None if the
+                position isn't on an image.
+        """
+        layout = self.layout_manager
+        if layout is None or not self.data or self.parent is None:
+            return None
+
+        # outside of the visible part of the grid
+        if not self.collide_point(*self.parent.to_widget(*pos)):
+            return None
+
+        # position relative to the top left corner of the first tile
+        x, y = layout.to_widget(*pos)
+        pad_left, pad_top, pad_right, _pad_bottom = layout.padding
+        x -= layout.x + pad_left
+        y = layout.top - pad_top - y
+
+        spacing_x, spacing_y = layout.spacing
+        cols = layout.cols
+        tile_width = (
+            layout.width - pad_left - pad_right - spacing_x * (cols - 1)
+        ) / cols
+        tile_height = layout.default_size[1]
+
+        if x < 0 or y < 0 or tile_width <= 0:
+            return None
+
+        col, x = divmod(x, tile_width + spacing_x)
+        row, y = divmod(y, tile_height + spacing_y)
+
+        # in the spacing between two tiles
+        if col >= cols or x > tile_width or y > tile_height:
+            return None
+
+        index = int(row) * cols + int(col)
+        return index if index < len(self.data) else None
+
+
+    def on_mouse_pos(self, _window, pos):
+        """ Summary
+            -------
+            Displays the checkbox of the tile under the mouse, and
+            hides the one of the tile previously hovered.
+
+            Arguments
+            ---------
+            _window (unused)
+                reference the app window
+            pos: tuple
+                position of the cursor
+        """
+        index = self.get_index_at(pos)
+        tile = None
+        if index is not None:
+            tile = self.view_adapter.get_visible_view(index)
+
+        if tile is self._hovered_tile:
+            return
+
+        if self._hovered_tile is not None:
+            self._hovered_tile.set_hovered(False)
+        if tile is not None:
+            tile.set_hovered(True)
+
+        self._hovered_tile = tile
+
+
+    def on_scroll_y(self, _instance, _scroll_y):
+        """ Summary
+            -------
+            The tiles move under the mouse when the grid is scrolled.
+        """
+        self.on_mouse_pos(Window, Window.mouse_pos)
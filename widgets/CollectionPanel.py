@@ -3,7 +3,6 @@
 """
 
 import os
-from PIL import Image
 
 from kivy.uix.boxlayout import BoxLayout
 #from kivy.logger import Logger
@@ -12,6 +11,10 @@ from kivy.app import App
 import kivy.properties as kyprops
 
 from api.CollectionImage import CollectionImage
+from api.CollectionManager import CollectionManager
+from api.ImageInfo import ImageInfo
+from api.PreviewLoader import PreviewLoader
+from api.ThumbnailLoader import ThumbnailLoader
 from widgets.ImagePreview import ImagePreview
 from widgets.MetadataItem import MetadataItem
 from widgets.Palette import Palette
@@ -44,6 +47,11 @@ class CollectionPanel(BoxLayout):
         save()
             Loops through the text fields and saves the data to the
             collection.
+        show_neighbour(offset)
+            Displays the previous or next image of the grid.
+        show_similar_colors()
+            Displays in the grid the images with colors similar to the
+            current image.
     """
     WORK_DIRECTORY = ""
     tabs = dict()
@@ -66,6 +74,12 @@ class CollectionPanel(BoxLayout):
         # needed to get the full path to an image
         self.WORK_DIRECTORY = work_dir
 
+        # the previews of another collection, or of images modified
+        # since they were decoded, won't be displayed again
+        PreviewLoader.prune_textures(
+            work_dir, App.get_running_app().CURRENT_COLLECTION.file_records
+        )
+
         # generate text fields
         container = self.ids.metadata_container
 
@@ -156,22 +170,62 @@ class CollectionPanel(BoxLayout):
             Saves the metadata of the current collection image
         """
 
+        changed = False
+
         for metadata_item in self.ids.metadata_container.children:
             # read the value from TextInput
             field_value = metadata_item.text
 
             # save the value to memory
-            setattr(self.current_image, metadata_item.field_name, field_value)
+            field_name = metadata_item.field_name
+            if getattr(self.current_image, field_name) != field_value:
+                setattr(self.current_image, field_name, field_value)
+                changed = True
+
+        # nothing to save when the user only looked at the image
+        if not changed:
+            return
 
-        # update the image in the collection (in RAM).
+        # update the image in the collection (in RAM), and save it to
+        # disk a bit later
         app = App.get_running_app()
         app.CURRENT_COLLECTION.update_image(self.current_image)
         app.GRID.update_image(self.current_image)
+        CollectionManager.schedule_save(app.CURRENT_COLLECTION)
         
 
         # TODO: update legend in collection grid tile
 
 
+    def show_neighbour(self, offset):
+        """ Summary
+            -------
+            Displays the image before or after the current one in the
+            grid.
+
+            Arguments
+            ---------
+            offset : int
+                -1 for the previous image, 1 for the next one
+        """
+        grid = App.get_running_app().GRID
+        idx = grid.display_index.get(self.current_image.filename)
+        if idx is None or not 0 <= idx + offset < len(grid.display_list):
+            return
+
+        self.set_image(grid.display_list[idx + offset])
+
+
+    def show_similar_colors(self):
+        """ Summary
+            -------
+            Displays in the grid the images whose palettes are the
+            closest to the palette of the current image.
+        """
+        app = App.get_running_app()
+        app.TOOLBAR.show_similar_colors(self.current_image)
+
+
     def on_current_image(self, _instance, image):
         """ Summary
             -------
@@ -188,13 +242,13 @@ class CollectionPanel(BoxLayout):
 
         # update preview image
         self.ids.preview.legend = image.to_legend()
-        self.ids.preview.source = image_path
+        self._set_preview(image)
 
         # update palette
         self.ids.palette.set_image(image_path)
 
-        img_width, img_height = Image.open(image_path).size
-        
+        img_width, img_height = ImageInfo.get_size(image_path)
+
         self.ids.image_size.text = f"{img_width}x{img_height}px"
 
         # dict for the texinputs helpers
@@ -225,3 +279,64 @@ class CollectionPanel(BoxLayout):
 
             # display the value in TextInput
             metadata_item.text = field_value
+
+        # the next images are likely to be displayed after this one
+        self._prefetch_neighbours(image)
+
+
+    def _set_preview(self, image):
+        """ Summary
+            -------
+            Displays the preview of an image (see PreviewLoader). Until
+            it is decoded, the thumbnail of the grid is displayed
+            instead.
+        """
+        preview = self.ids.preview
+        image_path = self.get_image_source()
+        preview.image_path = image_path
+
+        # the images displayed before aren't waited for anymore
+        ThumbnailLoader.cancel_all(
+            self.WORK_DIRECTORY, keep=[image.filename], owner=self
+        )
+        PreviewLoader.cancel_all(keep=[image_path], owner=self)
+
+        texture = PreviewLoader.get_texture(image_path)
+        if texture is not None:
+            preview.texture = texture
+            return
+
+        def on_preview(texture):
+            # another image may be displayed meanwhile
+            if preview.image_path == image_path and texture is not None:
+                preview.texture = texture
+
+        def on_thumbnail(texture):
+            # the preview may be decoded before the thumbnail
+            if PreviewLoader.get_texture(image_path) is None:
+                on_preview(texture)
+
+        preview.texture = None
+        ThumbnailLoader.load(
+            self.WORK_DIRECTORY, image.filename, on_thumbnail, owner=self
+        )
+        PreviewLoader.load(image_path, on_preview, owner=self)
+
+
+    def _prefetch_neighbours(self, image):
+        """ Summary
+            -------
+            Prefetches the images before and after an image in the grid
+        """
+        grid = App.get_running_app().GRID
+        idx = grid.display_index.get(image.filename)
+        if idx is None:
+            return
+
+        PreviewLoader.prefetch([
+            os.path.join(
+                self.WORK_DIRECTORY, grid.display_list[neighbour].filename
+            )
+            for neighbour in (idx + 1, idx - 1)
+            if 0 <= neighbour < len(grid.display_list)
+        ])
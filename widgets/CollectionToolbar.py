@@ -1,6 +1,8 @@
+import threading
 from types import BuiltinFunctionType
 from plyer import filechooser
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.lang import Builder
 from kivy.uix.boxlayout import BoxLayout
 from kivy.logger import Logger
@@ -14,12 +16,17 @@ from kivymd.uix.button import MDRaisedButton
 
 from widgets.FilterDialogContent import FilterDialogContent
 from widgets.ExportDialogContent import ExportDialogContent
+from widgets.ProgressDialogContent import ProgressDialogContent
 from widgets.ToggleButtonWidget import ToggleButtonWidget
 from widgets.ConfirmationSnackbar import ConfirmationSnackbar
 from widgets.IconListItem import IconListItem
 from api.CollectionUtils import CollectionUtils
 from api.CollectionManager import CollectionManager
+from api.ColorIndex import ColorIndex
+from api.ColorPalette import ColorPalette
+from api.DuplicateIndex import DuplicateIndex
 from api.Powerpoint import Powerpoint
+from api.SearchIndex import SearchIndex
 
 class CollectionToolbar(BoxLayout):
     """ Summary
@@ -46,9 +53,16 @@ class CollectionToolbar(BoxLayout):
             Current filter mode
         mode_text_filter: StringProperty
             Current filter mode name
+        search_base: list
+            Images narrowed by the search field: the whole collection,
+            or the result of the last filter
+        search_query: str
+            Normalized query of the search currently displayed
 
         Methods
         -------
+        initialize(collection)
+            Resets the toolbar for a newly loaded collection
         to_home_screen()
             on_press home button, return to the start screen
         save_coll()
@@ -64,6 +78,11 @@ class CollectionToolbar(BoxLayout):
             on_press sort by button, sorts the collection
         open_filter()
             on_press filter button, opens the filter window
+        search()
+            narrows the displayed images to those matching the search
+            field
+        show_similar_colors(collection_image)
+            displays the images with colors similar to an image
 
     """
     Builder.load_file('templates/CollectionToolbar.kv')
@@ -77,6 +96,24 @@ class CollectionToolbar(BoxLayout):
     # dialog is active
 
     dialog = None
+    # export dialog, kept apart from the filter dialog above so that
+    # each one keeps its own fields
+    export_dialog = None
+    # dialog showing the progress of the pptx export
+    progress_dialog = None
+
+    # seconds without typing before the search runs
+    SEARCH_DELAY = .3
+    SEARCH_ATTRIBUTES = (
+        "title", "artist", "datation", "technique", "material", "style",
+        "conservation_site", "production_site",
+    )
+    search_base = list()
+    search_query = ""
+
+    # number of images displayed by show_similar_colors()
+    SIMILAR_COLORS_COUNT = 60
+
     # NOT WORKING
     # toolbar_icon = kyprops.ListProperty([
     #     ["sort-ascending", lambda x: open_filter(), 'Sort the collection'],
@@ -91,7 +128,76 @@ class CollectionToolbar(BoxLayout):
     def __init__(self, **kwargs):
         super(CollectionToolbar, self).__init__(**kwargs)
         self.app = App.get_running_app()
-    
+        self._search_trigger = Clock.create_trigger(
+            self.search, self.SEARCH_DELAY
+        )
+
+
+    def initialize(self, collection):
+        """ Summary
+            -------
+            Resets the displayed images, the selection and the search
+            for a newly loaded collection.
+
+            Arguments
+            ---------
+            collection : Collection
+                The current collection opened in the app
+        """
+        self.search_base = collection.get_collection()
+        self.search_query = ""
+        self.displayed_images = self.search_base
+        self.selected_images = list()
+        self.ids.search_field.text = ""
+
+
+    def on_search_text(self, _text):
+        """ Summary
+            -------
+            Runs the search once the user stops typing for SEARCH_DELAY
+            seconds
+        """
+        # restart the delay at each keystroke
+        self._search_trigger.cancel()
+        self._search_trigger()
+
+
+    def search(self, *_args):
+        """ Summary
+            -------
+            Displays the images of search_base where one of the
+            SEARCH_ATTRIBUTES contains the text of the search field.
+        """
+        collection = self.app.CURRENT_COLLECTION
+        query = SearchIndex.normalize(self.ids.search_field.text.strip())
+
+        if collection is None or query == self.search_query:
+            return
+
+        index = collection.get_search_index()
+
+        if not query:
+            displayed_images = list(self.search_base)
+        elif self.search_query and self.search_query in query:
+            # the query was extended: the new results can only be among
+            # the current ones
+            displayed_images = [
+                i for i in self.displayed_images
+                if index.contains(i.filename, query, self.SEARCH_ATTRIBUTES)
+            ]
+        else:
+            filenames = index.search(query, self.SEARCH_ATTRIBUTES)
+            displayed_images = [
+                i for i in self.search_base if i.filename in filenames
+            ]
+
+        self.search_query = query
+
+        # recycled tiles only reload their thumbnail if their image changed
+        self.displayed_images = displayed_images
+        self.app.GRID.set_display_list(displayed_images)
+        self.selected_images = list()
+
     def sort_drop(self, button):
         sort_items = [
             {'viewclass': 'IconListItem',
@@ -138,20 +244,32 @@ class CollectionToolbar(BoxLayout):
         """
         collection = self.app.CURRENT_COLLECTION
 
-        # switches to start screen
-        CollectionManager.save(collection)
+        # saves in the background and switches to start screen
+        self.app.PANEL.save()
+        CollectionManager.save_async(collection)
         self.app.SCREEN_MANAGER.switch_to(self.app.SCREENS["START"], direction ='right')
 
     def save_coll(self):
         """ Summary
             -------
-            Saves the current collection
+            Saves the current collection, in the background
         """
         collection = self.app.CURRENT_COLLECTION
 
         # saves curent collection
-        CollectionManager().save(collection)
-        ConfirmationSnackbar().open()
+        self.app.PANEL.save()
+        CollectionManager.save_async(collection, self._on_saved)
+
+
+    def _on_saved(self, saved):
+        """ Summary
+            -------
+            Called on the main thread once save_coll() is finished
+        """
+        if saved:
+            ConfirmationSnackbar().open()
+        else:
+            self.app.show_error("The collection couldn't be saved.")
 
 
 
@@ -166,8 +284,7 @@ class CollectionToolbar(BoxLayout):
         do_select = self.selected_images != self.displayed_images
 
         # activate checkboxes
-        for grid_image in self.app.GRID.children:
-            grid_image.ids.select_image.active = do_select
+        self.app.GRID.set_selection(do_select)
 
         # update selected_images
         if do_select:
@@ -193,6 +310,81 @@ class CollectionToolbar(BoxLayout):
             self.app.show_error(message = "Please select 2 to 4 images")
 
 
+    def show_similar_colors(self, collection_image):
+        """ Summary
+            -------
+            Displays the images whose palettes are the closest to the
+            palette of an image, closest first. The search field then
+            narrows these images.
+
+            Arguments
+            ---------
+            collection_image : CollectionImage
+                The reference image
+        """
+        collection = self.app.CURRENT_COLLECTION
+        palette = ColorPalette.get_cached(
+            collection.get_absolute_path(collection_image)
+        )
+
+        if not palette:
+            self.app.show_error("The colors of this image are still being analyzed")
+            return
+
+        results = ColorIndex.get_index(collection).query(
+            palette, self.SIMILAR_COLORS_COUNT
+        )
+        self._display_results([filename for filename, _d in results])
+
+        ConfirmationSnackbar(text="Images with similar colors").open()
+
+
+    def show_duplicates(self):
+        """ Summary
+            -------
+            Displays the images which have near duplicates in the
+            collection, each next to its duplicates. Only the images
+            already hashed in the background are compared.
+        """
+        collection = self.app.CURRENT_COLLECTION
+        groups = DuplicateIndex.get_index(collection).get_groups()
+
+        if not groups:
+            ConfirmationSnackbar(text="No near duplicates found").open()
+            return
+
+        self._display_results(
+            [filename for group in groups for filename in group]
+        )
+
+        ConfirmationSnackbar(
+            text="%d groups of near duplicates" % len(groups)
+        ).open()
+
+
+    def _display_results(self, filenames):
+        """ Summary
+            -------
+            Displays the images of the current collection with the
+            given filenames, in this order, in place of the search or
+            filter results.
+        """
+        collection = self.app.CURRENT_COLLECTION
+        displayed_images = [
+            image for image in map(collection.get_image, filenames)
+            if image is not None
+        ]
+
+        self.search_base = displayed_images
+        self.search_query = ""
+        self.ids.search_field.text = ""
+
+        self.displayed_images = displayed_images
+        self.app.GRID.set_display_list(displayed_images)
+        self.app.GRID.scroll_y = 1
+        self.selected_images = list()
+
+
     def sort_by(self, value, rev):
         """ Summary
             -------
@@ -214,6 +406,12 @@ class CollectionToolbar(BoxLayout):
                                         value,
                                         reverse=rev
                                         )
+        # keep the same order when the search changes
+        self.search_base = CollectionUtils.sort(
+                                        self.search_base,
+                                        value,
+                                        reverse=rev
+                                        )
 
         # sets the grid with the sorted collection
         self.app.GRID.set_display_list(self.displayed_images)
@@ -278,10 +476,11 @@ class CollectionToolbar(BoxLayout):
         if mode_text == 'OR':
             true_mode = 'any'
 
-        displayed_images = self.app.CURRENT_COLLECTION.get_collection()
+        collection = self.app.CURRENT_COLLECTION
 
         # filter with the textinput values
-        displayed_images = CollectionUtils.filter(displayed_images,
+        displayed_images = CollectionUtils.filter(collection.get_collection(),
+            index = collection.get_search_index(),
             mode = true_mode,
             title = title_art,
             artist = artist,
@@ -292,6 +491,16 @@ class CollectionToolbar(BoxLayout):
             datation_max = datation_max
         )
 
+        # the search field narrows the filtered images
+        self.search_base = displayed_images
+        if self.search_query:
+            filenames = collection.get_search_index().search(
+                self.search_query, self.SEARCH_ATTRIBUTES
+            )
+            displayed_images = [
+                i for i in displayed_images if i.filename in filenames
+            ]
+
         # saves the filtered collection in a list and displays it
         self.app.TOOLBAR.displayed_images = displayed_images
         self.app.GRID.set_display_list(displayed_images)
@@ -329,8 +538,8 @@ class CollectionToolbar(BoxLayout):
             self.app.show_error("Please select at least one image")
             return
 
-        if not self.dialog:
-            self.dialog = MDDialog(
+        if not self.export_dialog:
+            self.export_dialog = MDDialog(
                 title="Export",
                 type="custom",
                 content_cls=ExportDialogContent(),
@@ -341,19 +550,25 @@ class CollectionToolbar(BoxLayout):
                     ),
                     MDRaisedButton(
                         text="CANCEL",
-                        on_release=self.dismiss_dialog
+                        on_release=self.dismiss_export
                     ),
                 ],
             )
 
-        self.dialog.open()
+        self.export_dialog.open()
+
+
+    def dismiss_export(self, _instance):
+        if self.export_dialog:
+            # close the popup
+            self.export_dialog.dismiss()
 
 
     def export(self, _instance):
         """
             Call plyer filechooser API to run a filechooser Activity.
         """
-        field_ids = self.dialog.content_cls.ids
+        field_ids = self.export_dialog.content_cls.ids
 
         # get the file type chosen based on the text in the selected
         # button.
@@ -387,26 +602,97 @@ class CollectionToolbar(BoxLayout):
         """
         Callback function for handling the selection response from Activity.
         """
+        # the user closed the file chooser without choosing a file
+        if not selection:
+            return
+
         # 2. generate the powerpoint and save it to the selected path
 
         # get the input export path
         export_path = str(selection[0])
 
+        target_dpi = None
+        if self.export_dialog.content_cls.ids.downsample_checkbox.active:
+            target_dpi = Powerpoint.EXPORT_DPI
+
+        # close dialog
+        self.export_dialog.dismiss()
+
         Logger.info("Arty: exporting selection to pptx...")
-        ConfirmationSnackbar(text="Exporting to PowerPoint...").open()
+
+        images = list(self.selected_images)
+        cancel_event = threading.Event()
+        progress = ProgressDialogContent(total=len(images))
+
+        self.progress_dialog = MDDialog(
+            title="Exporting to PowerPoint...",
+            type="custom",
+            content_cls=progress,
+            auto_dismiss=False,
+            buttons=[
+                MDRaisedButton(
+                    text="CANCEL",
+                    on_release=lambda _button: cancel_event.set()
+                ),
+            ],
+        )
+        self.progress_dialog.open()
+
+        # generating the slides takes a while: keep the UI responsive
+        threading.Thread(
+            target=self._export_pptx,
+            args=(images, export_path, target_dpi, progress, cancel_event),
+            daemon=True
+        ).start()
+
+
+    def _export_pptx(
+        self, images, export_path, target_dpi, progress, cancel_event
+    ):
+        """ Summary
+            -------
+            Runs in a background thread. Generates the presentation and
+            reports the progress to the main thread.
+        """
+        def on_progress(done, _total):
+            Clock.schedule_once(lambda _dt: setattr(progress, "done", done))
 
         try:
-            Powerpoint.create_presentation(
-                self.selected_images,
+            saved = Powerpoint.create_presentation(
+                images,
                 self.app.PROJECT_DIRECTORY,
-                export_path
+                export_path,
+                progress_callback=on_progress,
+                cancel_event=cancel_event,
+                target_dpi=target_dpi
             )
         except Exception as exc:
             Logger.exception(exc)
+            saved = None
+
+        Clock.schedule_once(lambda _dt: self._on_export_done(saved))
+
+
+    def _on_export_done(self, saved):
+        """ Summary
+            -------
+            Runs on the main thread once the export is over.
+
+            Arguments
+            ---------
+            saved : bool or None
+                True if the presentation was saved, False if the export
+                was cancelled, None if it failed.
+        """
+        self.progress_dialog.dismiss()
+        self.progress_dialog = None
+
+        if saved is None:
             self.app.show_error("An error occurred while generating the presentation")
-        
-        # close dialog
-        self.dialog.dismiss()
+        elif saved:
+            ConfirmationSnackbar(text="Presentation exported !").open()
+        else:
+            Logger.info("Arty: pptx export cancelled")
 
 
     def handle_selection_csv(self, selection):
@@ -416,6 +702,6 @@ class CollectionToolbar(BoxLayout):
         CollectionUtils.export_csv(self.selected_images, export_path)
 
         # close dialog
-        self.dialog.dismiss()
+        self.export_dialog.dismiss()
         # with open(export_path, "w") as csv_file:
         #     csv_file.write(csv_data)
@@ -8,9 +8,9 @@ from kivy.app import App
 from kivy.uix.floatlayout import FloatLayout
 from kivy.core.window import Window
 from kivy.logger import Logger
+from kivy.uix.modalview import ModalView
+from kivy.uix.textinput import TextInput
 
-from api.CollectionManager import CollectionManager
-from widgets.ConfirmationSnackbar import ConfirmationSnackbar
 
 
 class Hotkeys(FloatLayout):
@@ -47,6 +47,7 @@ class Hotkeys(FloatLayout):
             Ctrl/Cmd + S : save the current collection
             Ctrl/Cmd + A : select all images
             Ctrl/Cmd + E : export selection to PowerPoint
+            Left / Right : previous / next image
 
             Arguments
             ---------
@@ -58,6 +59,9 @@ class Hotkeys(FloatLayout):
         if keycode[1] == 'escape':
             self.escape()
 
+        if keycode[1] in ('left', 'right'):
+            return self.step(-1 if keycode[1] == 'left' else 1)
+
 
         ###
         # MacOSX hotkeys definition
@@ -132,10 +136,8 @@ class Hotkeys(FloatLayout):
         if not collection:
             return False
 
-        # save the collection
-        self.app.PANEL.save()
-        CollectionManager.save(collection)
-        ConfirmationSnackbar().open()
+        # save the collection via the toolbar
+        self.app.TOOLBAR.save_coll()
 
         return False
 
@@ -182,6 +184,36 @@ class Hotkeys(FloatLayout):
         return False
 
 
+    def step(self, offset):
+        """ Summary
+            -------
+            Displays the previous or next image in the panel, unless a
+            text field is being edited or a modal is open
+
+            Returns
+            -------
+            bool
+                Always False. It has got something to do with the kivy
+                _on_keyboard_key_down callback.
+        """
+        # check that we are in the collection screen
+        if self.app.SCREEN_MANAGER.current != "Collection":
+            return False
+
+        # the arrows move the cursor of the text fields, and the image
+        # behind a modal (e.g. the large view) shouldn't change
+        for root in Window.children:
+            if isinstance(root, ModalView) or any(
+                isinstance(widget, TextInput) and widget.focus
+                for widget in root.walk()
+            ):
+                return False
+
+        self.app.PANEL.show_neighbour(offset)
+
+        return False
+
+
     def escape(self):
         """ Summary
             -------
@@ -9,6 +9,9 @@ from widgets.LargeImageView import LargeImageView
 class ImagePreview(ButtonBehavior, Image):
     source = kyprops.StringProperty("")
     legend = kyprops.StringProperty("")
+    # path to the original image, when the texture is a preview of it
+    # (see PreviewLoader)
+    image_path = kyprops.StringProperty("")
 
     is_hovered = False
     large_view_open = False
@@ -18,11 +21,20 @@ class ImagePreview(ButtonBehavior, Image):
 
     def __init__(self, **kwargs):
         super(ImagePreview, self).__init__(**kwargs)
-        # bind mouse position updates so we can check when the cursor
-        # hovers over the image
-        # note: had to do it in the init, otherwise it doesn't work
         self.app = App.get_running_app()
-        Window.bind(mouse_pos=self.on_mouse_pos)
+
+
+    def on_parent(self, _instance, parent):
+        """ Summary
+            -------
+            Binds mouse position updates while the preview is in the
+            panel, so we can check when the cursor hovers over the
+            image, and unbinds them when it is removed.
+        """
+        if parent is not None:
+            Window.bind(mouse_pos=self.on_mouse_pos)
+        else:
+            Window.unbind(mouse_pos=self.on_mouse_pos)
 
 
     def on_press(self):
@@ -32,7 +44,9 @@ class ImagePreview(ButtonBehavior, Image):
             view the image in a larger format
         """
         # open a modal view to see the image in full size
-        large_view = LargeImageView(source=self.source, legend=self.legend)
+        large_view = LargeImageView(
+            source=self.image_path or self.source, legend=self.legend
+        )
 
         # pylint: disable=no-member
         large_view.bind(on_dismiss=self._on_large_view_dismissed)
@@ -46,8 +60,8 @@ class ImagePreview(ButtonBehavior, Image):
     def on_mouse_pos(self, window, pos):
         # if the mouse position is over the image
         if (
-            self.collide_point(*pos)
-            and not self.large_view_open
+            not self.large_view_open
+            and self.collide_point(*pos)
             and self.app.SCREEN_MANAGER.current == "Collection"
         ):
             if not self.is_hovered:
@@ -1,5 +1,6 @@
-from PIL import Image
+import os
 
+from kivy.app import App
 from kivy.core.window import Window
 from kivy.lang.builder import Builder
 from kivy.uix.floatlayout import FloatLayout
@@ -8,13 +9,19 @@ from kivy.uix.label import Label
 import kivy.properties as kyprops
 
 from api.Geometry import Geometry
+from api.ImageInfo import ImageInfo
+from api.TilePyramid import TilePyramid
 
+from widgets.TiledImage import TiledImage
 from widgets.ZoomablePicture import ZoomablePicture
 
 
 class LargeImageView(ModalView):
     source = kyprops.StringProperty("")
     legend = kyprops.StringProperty("")
+    # True if the image is too large to be loaded at once, and is
+    # displayed from its tile pyramid (see TiledImage)
+    tiled = kyprops.BooleanProperty(False)
 
     WINDOW_MARGIN = 75 #px
 
@@ -23,13 +30,15 @@ class LargeImageView(ModalView):
 
 
     def __init__(self, **kwargs):
+        # get image size
+        image_size = ImageInfo.get_size(kwargs["source"])
+
+        # must be known before the kv rules load the image
+        kwargs["tiled"] = TilePyramid.needs_tiles(image_size)
+
         super(LargeImageView, self).__init__(**kwargs)
         Window.bind(on_resize=self._on_resize)
 
-        # get image size
-        with Image.open(self.source) as im:
-            image_size= im.size
-
         modal_size = Geometry.fit_to_container(image_size, (Window.width, Window.height), padding=self.WINDOW_MARGIN)
         self.size = modal_size
 
@@ -37,14 +46,30 @@ class LargeImageView(ModalView):
         img.width = modal_size[0]
         img.height = modal_size[1]
 
+        if self.tiled:
+            work_dir = App.get_running_app().CURRENT_COLLECTION.work_directory
+            self.ids.tiledimage.set_image(
+                work_dir, os.path.relpath(self.source, work_dir), image_size
+            )
+
+
+    def on_dismiss(self):
+        """ Summary
+            -------
+            Frees the tiles and stops following the window once the
+            modal is closed (handlers bound to on_dismiss may prevent
+            it, in which case this isn't called).
+        """
+        Window.unbind(on_resize=self._on_resize)
+        self.ids.tiledimage.release()
+
 
     def _on_resize(self, window, *_args):
 
-        with Image.open(self.source) as im:
-            image_size = im.size
+        image_size = ImageInfo.get_size(self.source)
 
         new_size = Geometry.fit_to_container(image_size, (window.width, window.height), padding=self.WINDOW_MARGIN)
         self.size = new_size
         # resize the image inside the ZoomableImage widget (which is a
-        # ScatterPlane !)
-        self.ids.zoomableimage.children[0].size = new_size
+        # ScatterPlane !), the tiles follow it
+        self.ids.realimage.size = new_size
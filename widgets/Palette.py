@@ -1,24 +1,25 @@
-from PIL import Image
-
 from kivy.graphics import Rectangle, Color
 from kivy.core.window import Window
+from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.widget import Widget
-from kivy.logger import Logger
 
-class Palette(Widget):
+from api.ColorPalette import ColorPalette
+
+class Palette(ButtonBehavior, Widget):
     """ Summary
         -------
-        Computes and displays the palette of dominant colors of an image
+        Displays the palette of dominant colors of an image (see
+        ColorPalette). Can be pressed like a button.
 
         Methods
         -------
         set_image(image_path)
             Calculates and displays the palette of an image
     """
-    NUM_COLORS = 7
-    RESIZE = 100
+    NUM_COLORS = ColorPalette.NUM_COLORS
 
     current_palette = list()
+    image_path = None
 
     def __init__(self, **kwargs):
         super(Palette, self).__init__(**kwargs)
@@ -36,7 +37,29 @@ class Palette(Widget):
                 Absolute path to the image of which the palette is
                 wanted.
         """
-        palette = self.get_colors(image_path)
+        self.image_path = image_path
+
+        palette = ColorPalette.get_cached(image_path)
+
+        if palette is None:
+            # compute the palette without blocking the UI, and display
+            # nothing meanwhile
+            palette = list()
+            ColorPalette.load(
+                image_path,
+                lambda colors: self._on_colors(image_path, colors)
+            )
+
+        self._set_colors(palette)
+
+
+    def _on_colors(self, image_path, colors):
+        # another image was displayed meanwhile
+        if image_path == self.image_path:
+            self._set_colors(colors)
+
+
+    def _set_colors(self, palette):
         # remap RGB values [0-255] -> [0-1]
         kivy_palette = [[v / 255 for v in color] for color in palette]
 
@@ -67,62 +90,6 @@ class Palette(Widget):
                     )
 
 
-    @classmethod
-    def get_colors(cls, image_path):
-        """ Summary
-            -------
-            Gets the palette of an image
-
-            Arguments
-            ---------
-            image_path : str
-                Absolute path to the image of which the palette is
-                wanted.
-
-            Returns
-            -------
-            list(tuple):
-                A list of tuples containing the RGB values of the color,
-                in a range from 0 to 255.
-
-
-            Adapted from : https://gist.github.com/zollinger/1722663
-        """
-        # Resize image to speed up processing
-        img = Image.open(image_path)
-        img = img.convert("RGB")
-        img = img.copy()
-        img.thumbnail((cls.RESIZE, cls.RESIZE))
-
-        # Reduce to palette
-        paletted = img.convert(
-            'P',
-            palette=Image.ADAPTIVE,
-            colors=cls.NUM_COLORS
-        )
-
-        # Find dominant colors
-        palette = paletted.getpalette()
-        color_counts = sorted(paletted.getcolors(), reverse=True)
-        colors = list()
-        for i in range(cls.NUM_COLORS):
-            try:
-                palette_index = color_counts[i][1]
-                dominant_color = palette[palette_index*3:palette_index*3+3]
-                colors.append(tuple(dominant_color))
-            except IndexError:
-                Logger.exception(
-                    "{image_path} has less than {num_colors} colors."
-                    .format(
-                        image_path = image_path,
-                        num_colors = cls.NUM_COLORS
-                    )
-                )
-                break
-
-        return colors
-
-
     def _on_resize(self, *_args):
         # reload the palette (fixes positioning and sizing issue)
         self._display_palette()
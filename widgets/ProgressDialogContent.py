@@ -0,0 +1,20 @@
+from kivy.uix.boxlayout import BoxLayout
+from kivy.lang import Builder
+import kivy.properties as kyprops
+
+class ProgressDialogContent(BoxLayout):
+    """ Summary
+        -------
+        Content of a dialog showing the progress of a long task.
+
+        Attributes
+        ----------
+        done: NumericProperty
+            Number of steps done
+        total: NumericProperty
+            Total number of steps
+    """
+    Builder.load_file('templates/ProgressDialogContent.kv')
+
+    done = kyprops.NumericProperty(0)
+    total = kyprops.NumericProperty(1)
@@ -0,0 +1,339 @@
+"""
+    Displays a very large image from its tile pyramid, loading only the
+    tiles visible at the current zoom.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.graphics import Color, Rectangle
+from kivy.graphics.texture import Texture
+from kivy.logger import Logger
+from kivy.uix.widget import Widget
+
+from api.TilePyramid import TilePyramid
+
+
+class TiledImage(Widget):
+    """ Summary
+        -------
+        Displays an image from its TilePyramid. The level of the pyramid
+        is chosen from the size of the image on screen, and only its
+        tiles which intersect the window are loaded and drawn, so that
+        the memory used doesn't depend on the size of the image.
+
+        The pyramid is generated in the background the first time the
+        image is displayed. Meanwhile, and while the tiles of the
+        current level are loading, the tiles of the coarser levels
+        already loaded are drawn instead.
+
+        The widget must have the aspect ratio of the image. It can be
+        scaled and moved by a Scatter (see ZoomablePicture).
+
+        Methods
+        -------
+        set_image(work_dir, filename, image_size)
+            Displays an image
+        release()
+            Stops loading tiles and frees their textures
+
+        Attributes
+        ----------
+        MAX_TEXTURES : int
+            Number of tile textures kept in memory, the least recently
+            displayed ones are freed first
+    """
+    MAX_TEXTURES = 96
+
+    # tiles are loaded by a pool of workers, pyramids are generated by
+    # another one so that loading doesn't wait for generation
+    _loader = None
+    _generator = None
+
+
+    def __init__(self, **kwargs):
+        super(TiledImage, self).__init__(**kwargs)
+        self.image_size = None
+        self._pyramid_dir = None
+        # levels whose tiles are all written
+        self._ready_levels = set()
+        # (level, col, row) -> texture, least recently used first
+        self._textures = OrderedDict()
+        # (level, col, row) -> future of the tiles being loaded
+        self._loading = dict()
+
+        self._trigger_update = Clock.create_trigger(self._update)
+        self.bind(pos=self._trigger_update, size=self._trigger_update)
+
+
+    def set_image(self, work_dir, filename, image_size):
+        """ Summary
+            -------
+            Displays an image, generating its pyramid if needed
+
+            Arguments
+            ---------
+            work_dir : str
+                Absolute path to the collection's directory
+            filename : str
+                Filename of the image, relative to work_dir
+            image_size : tuple(int, int)
+                (width, height) of the image
+        """
+        self.release()
+        self.image_size = tuple(image_size)
+
+        self._pyramid_dir = TilePyramid.get_directory(work_dir, filename)
+        if TilePyramid.is_ready(self._pyramid_dir):
+            self._ready_levels = set(
+                range(len(TilePyramid.get_levels(self.image_size)))
+            )
+            self._trigger_update()
+            return
+
+        if TiledImage._generator is None:
+            TiledImage._generator = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="TilePyramid"
+            )
+
+        pyramid_dir = self._pyramid_dir
+        TiledImage._generator.submit(
+            self._generate, work_dir, filename, pyramid_dir
+        )
+
+
+    def release(self):
+        """ Summary
+            -------
+            Stops loading tiles and frees their textures, e.g. when the
+            image is closed. A pyramid being generated is still
+            completed, for the next time the image is displayed.
+        """
+        for future in self._loading.values():
+            future.cancel()
+
+        self._loading.clear()
+        self._textures.clear()
+        self._pyramid_dir = None
+        self._ready_levels = set()
+        self.canvas.clear()
+
+
+    def on_parent(self, _instance, parent):
+        """ Summary
+            -------
+            Follows the zoom and the translation of the Scatter
+            containing the widget.
+        """
+        if parent is not None and "transform" in parent.properties():
+            parent.bind(transform=self._trigger_update)
+
+
+    def _generate(self, work_dir, filename, pyramid_dir):
+        """ Summary
+            -------
+            Runs in the generator worker. Displays each level as soon as
+            it is written.
+        """
+        def on_level(level):
+            Clock.schedule_once(
+                lambda _dt: self._on_level_ready(pyramid_dir, level)
+            )
+
+        try:
+            TilePyramid.generate(work_dir, filename, on_level)
+        except Exception:
+            Logger.exception(
+                "TiledImage: Couldn't generate the tiles of %s" % filename
+            )
+
+
+    def _on_level_ready(self, pyramid_dir, level):
+        # another image was displayed meanwhile
+        if pyramid_dir != self._pyramid_dir:
+            return
+
+        self._ready_levels.add(level)
+        self._trigger_update()
+
+
+    def _get_visible_region(self):
+        """ Summary
+            -------
+            Region of the image inside the window, and width of the
+            image on screen.
+
+            Returns
+            -------
+            tuple
+                ((left, top, right, bottom) in pixels of the image,
+                displayed width), None if the image is not visible
+        """
+        if self.width <= 0 or self.height <= 0:
+            return None
+
+        left, _bottom = self.to_window(self.x, self.y)
+        right, _top = self.to_window(self.right, self.top)
+
+        # window corners in the coordinates of the widget
+        win_left, win_bottom = self.to_widget(0, 0)
+        win_right, win_top = self.to_widget(Window.width, Window.height)
+
+        scale_x = self.image_size[0] / self.width
+        scale_y = self.image_size[1] / self.height
+        region = (
+            max(0, (win_left - self.x) * scale_x),
+            max(0, (self.top - win_top) * scale_y),
+            min(self.image_size[0], (win_right - self.x) * scale_x),
+            min(self.image_size[1], (self.top - win_bottom) * scale_y),
+        )
+
+        if region[0] >= region[2] or region[1] >= region[3]:
+            return None
+
+        return region, right - left
+
+
+    def _update(self, *_args):
+        """ Summary
+            -------
+            Draws the visible tiles of the level matching the zoom,
+            over the ones of the next level and the whole smallest
+            level, and loads the missing ones.
+        """
+        num_levels = len(TilePyramid.get_levels(self.image_size))
+        # the smallest level is written first, the others are drawn
+        # once it is ready
+        if num_levels - 1 not in self._ready_levels:
+            return
+
+        visible = self._get_visible_region()
+        self.canvas.clear()
+        if visible is None:
+            return
+
+        region, displayed_width = visible
+        level = TilePyramid.get_level(self.image_size, displayed_width)
+        # the levels aren't written in order while the pyramid is
+        # generated
+        if level not in self._ready_levels:
+            level = num_levels - 1
+
+        # coarsest first, the finer tiles are drawn over them
+        layers = [(num_levels - 1, None)]
+        if level + 1 < num_levels - 1 and level + 1 in self._ready_levels:
+            layers.append((level + 1, region))
+        if level < num_levels - 1:
+            layers.append((level, region))
+
+        wanted = set()
+        with self.canvas:
+            Color(1, 1, 1, 1)
+
+            for layer_level, layer_region in layers:
+                for col, row, box in TilePyramid.get_tiles(
+                    self.image_size, layer_level, layer_region
+                ):
+                    key = (layer_level, col, row)
+                    texture = self._textures.get(key)
+
+                    if texture is None:
+                        # the intermediate level is only a fallback
+                        if layer_level in (level, num_levels - 1):
+                            wanted.add(key)
+                            self._load_tile(key)
+                        continue
+
+                    self._textures.move_to_end(key)
+                    self._draw_tile(texture, box)
+
+        # the tiles which went out of view don't need to be loaded
+        for key in list(self._loading):
+            if key not in wanted and self._loading[key].cancel():
+                del self._loading[key]
+
+
+    def _draw_tile(self, texture, box):
+        left, top, right, bottom = box
+        scale_x = self.width / self.image_size[0]
+        scale_y = self.height / self.image_size[1]
+
+        Rectangle(
+            texture=texture,
+            pos=(self.x + left * scale_x, self.top - bottom * scale_y),
+            size=((right - left) * scale_x, (bottom - top) * scale_y)
+        )
+
+
+    def _load_tile(self, key):
+        """ Summary
+            -------
+            Decodes a tile in the background, its texture is created on
+            the main thread
+        """
+        if key in self._loading:
+            return
+
+        if TiledImage._loader is None:
+            TiledImage._loader = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="TiledImage"
+            )
+
+        pyramid_dir = self._pyramid_dir
+        future = TiledImage._loader.submit(
+            self._decode, TilePyramid.get_tile_path(pyramid_dir, *key)
+        )
+        self._loading[key] = future
+
+        future.add_done_callback(
+            lambda f: Clock.schedule_once(
+                lambda _dt: self._on_tile_decoded(pyramid_dir, key, f)
+            )
+        )
+
+
+    @staticmethod
+    def _decode(tile_path):
+        """ Summary
+            -------
+            Runs in a loader worker. Decodes a tile to raw RGB data.
+        """
+        with Image.open(tile_path) as img:
+            img = img.convert("RGB")
+            return img.size, img.tobytes()
+
+
+    def _on_tile_decoded(self, pyramid_dir, key, future):
+        """ Summary
+            -------
+            Runs on the main thread once a tile is decoded: creates its
+            texture and draws it.
+        """
+        if pyramid_dir != self._pyramid_dir or (
+            self._loading.get(key) is not future
+        ):
+            return
+        del self._loading[key]
+
+        if future.cancelled():
+            return
+
+        try:
+            size, data = future.result()
+        except Exception:
+            Logger.exception("TiledImage: Couldn't load the tile %s" % (key,))
+            return
+
+        texture = Texture.create(size=size, colorfmt="rgb")
+        texture.blit_buffer(data, colorfmt="rgb", bufferfmt="ubyte")
+        # Pillow rows go top to bottom, OpenGL's bottom to top
+        texture.flip_vertical()
+
+        self._textures[key] = texture
+        while len(self._textures) > self.MAX_TEXTURES:
+            self._textures.popitem(last=False)
+
+        self._trigger_update()